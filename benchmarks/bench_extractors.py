@@ -0,0 +1,111 @@
+"""
+风险页面解析微基准
+在 benchmarks/fixtures 下保存的 ping0 / scamalytics 页面上，对比流式提取器与原先基于 lxml 的整树 XPath 解析，
+并校验结果与 fixtures/expected.json 一致（安装了 lxml 时同时与旧实现逐字段比对）
+
+用法: python benchmarks/bench_extractors.py [--repeat 5] [--number 200]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import timeit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from src.ip_checker.ip_utils import _parse_ping0_risk, _parse_scamalytics_risk
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+
+def legacy_parse_ping0_risk(html_content: str):
+    tree = lxml_html.fromstring(html_content)
+    xpath = {
+        "ping0Risk": '//div[@class="line line-risk"]//div[@class="riskitem riskcurrent"]/span[@class="value"]',
+        "ipType": '/html/body/div[2]/div[2]/div[1]/div[2]/div[8]/div[2]/span',
+        "nativeIP": '/html/body/div[2]/div[2]/div[1]/div[2]/div[10]/div[2]/span'
+    }
+    ping0_data = {}
+    for key, path in xpath.items():
+        elements = tree.xpath(path)
+        ping0_data[key] = elements[0].text_content().strip() if elements else None
+    return ping0_data
+
+
+def legacy_parse_scamalytics_risk(html_content: str):
+    # 原实现：正则末尾多余的 "|" 使其总是匹配空串，结果恒为 {'score': None, 'risk': None}
+    score_match = re.search(r'"score":"(.*?)"|', html_content)
+    risk_match = re.search(r'"risk":"(.*?)"|', html_content)
+    if risk_match:
+        return {'score': score_match.group(1) if score_match else None, 'risk': risk_match.group(1)}
+    return None
+
+
+def load_fixtures(prefix: str):
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.startswith(prefix) and name.endswith('.html'):
+            with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+                pages[name] = f.read()
+    return pages
+
+
+def bench(label: str, fn, pages, number: int, repeat: int) -> float:
+    texts = list(pages.values())
+    best = min(timeit.repeat(lambda: [fn(t) for t in texts], number=number, repeat=repeat)) / number
+    print(f"{label:<34} {best * 1e6 / len(texts):8.1f} us/page")
+    return best
+
+
+def import_time(module: str) -> float:
+    """在新进程中导入模块的耗时（秒），不受本进程已加载模块影响。"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    return float(out.stdout.strip()) if out.returncode == 0 else float('nan')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark for the ping0/scamalytics page extractors")
+    parser.add_argument("--number", type=int, default=200, help="Passes over the fixtures per timing")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES, 'expected.json'), 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+    ping0_pages = load_fixtures('ping0_')
+    scam_pages = load_fixtures('scamalytics_')
+
+    mismatches = []
+    for name, text in ping0_pages.items():
+        got = _parse_ping0_risk(text)
+        if got != expected[name] or (lxml_html is not None and got != legacy_parse_ping0_risk(text)):
+            mismatches.append((name, got))
+    for name, text in scam_pages.items():
+        got = _parse_scamalytics_risk(text)
+        if got != expected[name]:
+            mismatches.append((name, got))
+    if mismatches:
+        print(f"Result mismatch on {len(mismatches)} fixtures, e.g. {mismatches[:3]!r}")
+        sys.exit(1)
+
+    if lxml_html is not None:
+        old = bench("legacy lxml ping0 parse", legacy_parse_ping0_risk, ping0_pages, args.number, args.repeat)
+    new = bench("ip_utils._parse_ping0_risk", _parse_ping0_risk, ping0_pages, args.number, args.repeat)
+    if lxml_html is not None:
+        print(f"{'speedup':<34} {old / new:8.2f}x")
+    # 旧正则恒匹配空串，耗时没有可比性，这里只校验它确实取不到字段
+    broken = sum(1 for t in scam_pages.values() if legacy_parse_scamalytics_risk(t) == {'score': None, 'risk': None})
+    print(f"{'legacy scamalytics regex':<34} {broken}/{len(scam_pages)} pages parsed as empty")
+    bench("ip_utils._parse_scamalytics_risk", _parse_scamalytics_risk, scam_pages, args.number, args.repeat)
+
+    if lxml_html is not None:
+        print(f"{'import lxml.html':<34} {import_time('lxml.html') * 1e3:8.1f} ms")
+    print(f"{'import src.ip_checker.htmlscan':<34} {import_time('src.ip_checker.htmlscan') * 1e3:8.1f} ms")
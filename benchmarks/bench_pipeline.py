@@ -0,0 +1,218 @@
+"""
+订阅→报告流水线基准
+用合成订阅语料（corpus.py）和本地模拟查询服务（ip_checker.mockserver）离线测量各阶段的吞吐与单条延迟：
+  parse.base64 / parse.clash_yaml               订阅解析为代理列表
+  hosts.base64 / hosts.clash_yaml               订阅提取主机名（run_purity_check 的路径）
+  resolve                                       DoH 主机名解析（模拟服务；系统DNS不可控，不计入）
+  lookup                                        ProxyCheck 查询（模拟服务，不限速）
+  classify                                      纯净度判定
+  emit                                          分组并写出 Clash YAML
+
+结果按提交保存到 benchmarks/results/<commit>.json，并与上一份结果（或 --baseline 指定的文件）对比，
+吞吐下降超过 --threshold 的阶段标记为回归
+
+用法: python benchmarks/bench_pipeline.py [--n 5000] [--repeat 3] [--latency 0.002] [--error-rate 0.01] [--fail-on-regression]
+"""
+import argparse
+import glob
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_mixed_corpus, make_proxies, synthetic_host
+
+from src.ip_checker import subscription
+from src.ip_checker.clash import build_config_from_proxies
+from src.ip_checker.fileutil import atomic_write_json, read_json
+from src.ip_checker.mockserver import MockProviderServer, ServiceBehavior
+from src.ip_checker.models import PurityVerdict
+from src.ip_checker.proxycheck_provider import ProxyCheckProvider
+from src.ip_checker.yaml_io import HAS_LIBYAML, save_yaml_config
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+LOOKUP_WORKERS = 10
+
+
+def git_revision() -> str:
+    """当前提交的短哈希；工作区有未提交修改时加 -dirty 后缀。"""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{rev}-dirty" if dirty else rev
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(fn, items: int, repeat: int) -> dict:
+    """运行 repeat 次取最快一次的耗时；fn 可以返回每条的延迟列表（秒）用于计算分位数。"""
+    best, latencies = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        per_item = fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best, latencies = elapsed, per_item
+    result = {"items": items, "seconds": round(best, 6), "throughput": round(items / best, 1) if best else None}
+    if latencies:
+        result["p50_ms"] = round(_percentile(latencies, 0.50) * 1e3, 3)
+        result["p95_ms"] = round(_percentile(latencies, 0.95) * 1e3, 3)
+        result["mean_ms"] = round(statistics.fmean(latencies) * 1e3, 3)
+    return result
+
+
+def timed_map(func, items, workers: int):
+    """并发执行 func，返回 (结果列表, 每条耗时列表)。"""
+
+    def run(item):
+        start = time.perf_counter()
+        value = func(item)
+        return value, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pairs = list(ex.map(run, items))
+    return [p[0] for p in pairs], [p[1] for p in pairs]
+
+
+def run_benchmarks(n: int, repeat: int, latency: float, error_rate: float = 0.0) -> dict:
+    results = {}
+    corpus = make_mixed_corpus(n)
+    for kind, text in corpus.items():
+        parsed = subscription.parse_proxies_from_text(text)
+        results[f"parse.{kind}"] = measure(lambda: subscription.parse_proxies_from_text(text) and None,
+                                           len(parsed), repeat)
+        results[f"hosts.{kind}"] = measure(lambda: subscription.extract_hosts_from_text(text) and None,
+                                           len(parsed), repeat)
+
+    proxies = make_proxies(n)
+    hosts = sorted({synthetic_host(i) for i in range(max(1, n // 10))})
+    behavior = ServiceBehavior(latency=latency, error_rate=error_rate)
+    with MockProviderServer(default=behavior, seed=0) as server:
+        endpoints = server.endpoints()
+        resolve = partial(subscription._resolve_via_doh_google, url=endpoints["doh"])
+        results["resolve"] = measure(
+            lambda: timed_map(resolve, hosts, subscription.MAX_RESOLVE_WORKERS)[1], len(hosts), repeat)
+
+        provider = ProxyCheckProvider(api_key="bench", base_url=endpoints["proxycheck"])
+        # 测量的是查询链路本身，不是配置的速率限制
+        provider.min_interval = 1e-6
+        provider.daily_limit = None
+        ips = sorted({p["server"] for p in proxies if not p["server"].endswith(".invalid")})
+        infos = {}
+
+        def lookup():
+            values, per_item = timed_map(provider.check_ip, ips, LOOKUP_WORKERS)
+            infos.update(zip(ips, values))
+            return per_item
+
+        results["lookup"] = measure(lookup, len(ips), repeat)
+
+    info_list = list(infos.values())
+    results["classify"] = measure(lambda: [PurityVerdict.from_info(info) for info in info_list] and None,
+                                  len(info_list), repeat)
+
+    verdicts = {ip: PurityVerdict.from_info(info) for ip, info in infos.items()}
+    annotated = []
+    for proxy in proxies:
+        verdict = verdicts.get(proxy["server"])
+        annotated.append({**proxy, **verdict.to_annotations()} if verdict else proxy)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench_clash.yaml")
+        results["emit"] = measure(lambda: save_yaml_config(build_config_from_proxies(annotated), output),
+                                  len(annotated), repeat)
+    return results
+
+
+def latest_result(exclude: str):
+    files = [f for f in glob.glob(os.path.join(RESULTS_DIR, '*.json')) if os.path.abspath(f) != exclude]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """打印逐阶段对比，返回吞吐下降超过阈值的阶段名。"""
+    regressions = []
+    print(f"\nCompared with {baseline['meta']['commit']} ({baseline['meta']['timestamp']}):")
+    for case, result in current["results"].items():
+        old = baseline["results"].get(case)
+        if not old or not old.get("throughput") or not result.get("throughput"):
+            print(f"  {case:<18} (no baseline)")
+            continue
+        change = result["throughput"] / old["throughput"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(case)
+        print(f"  {case:<18} {old['throughput']:>12,.0f} -> {result['throughput']:>12,.0f} items/s "
+              f"({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput/latency benchmark for the ip_checker pipeline")
+    parser.add_argument("--n", type=int, default=5000, help="Proxies per synthetic subscription")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock provider response latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock responses that fail")
+    parser.add_argument("--baseline", default=None, help="Result file to compare with (defaults to the latest one)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Throughput drop treated as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--no-save", action="store_true", help="Do not write benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    # --error-rate 注入的失败会被各 provider 记为 ERROR 日志，这里只看汇总
+    logging.getLogger().setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as state_dir:
+        # 缓存与配额账本写到临时目录，不影响真实运行的状态
+        os.environ["IP_CHECKER_CACHE_DB"] = os.path.join(state_dir, "ip_cache.db")
+        os.environ["IP_CHECKER_QUOTA_LEDGER"] = os.path.join(state_dir, "quota_ledger.json")
+        results = run_benchmarks(args.n, args.repeat, args.latency, args.error_rate)
+
+    commit = git_revision()
+    current = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "libyaml": HAS_LIBYAML,
+            "n": args.n,
+            "repeat": args.repeat,
+            "mock_latency": args.latency,
+            "mock_error_rate": args.error_rate,
+        },
+        "results": results,
+    }
+    for case, result in results.items():
+        extra = "".join(f" {k}={result[k]}" for k in ("p50_ms", "p95_ms") if k in result)
+        print(f"{case:<18} {result['items']:>8} items {result['seconds']:>9.3f}s "
+              f"{result['throughput']:>12,.0f} items/s{extra}")
+
+    path = os.path.abspath(os.path.join(RESULTS_DIR, f"{commit}.json"))
+    baseline_path = args.baseline or latest_result(exclude=path)
+    regressions = []
+    if baseline_path:
+        regressions = compare(current, read_json(baseline_path, {}), args.threshold)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        atomic_write_json(path, current)
+        print(f"\nSaved results to {os.path.relpath(path, ROOT)}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
@@ -0,0 +1,80 @@
+"""
+ip_checker.validate 微基准
+与原先逐次 re.fullmatch 的实现对比，并校验两者在同一语料上的结果一致
+
+用法: python benchmarks/bench_validate.py [--n 200000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ip_checker.validate import is_probable_base64, is_valid_hostname_or_ip
+
+
+def legacy_is_valid_hostname_or_ip(host: str) -> bool:
+    if not host or len(host) > 253 or " " in host:
+        return False
+    if re.fullmatch(r"(\d{1,3}\.){3}\d{1,3}", host):
+        parts = [int(p) for p in host.split('.') if p.isdigit()]
+        return len(parts) == 4 and all(0 <= p <= 255 for p in parts)
+    if not re.fullmatch(r"[A-Za-z0-9.-]+", host):
+        return False
+    for label in host.split('.'):
+        if not label or len(label) > 63:
+            return False
+    return True
+
+
+def legacy_is_probable_base64(s: str) -> bool:
+    return bool(re.fullmatch(r"[A-Za-z0-9_\-+/=]+", s)) and len(s) >= 16
+
+
+def make_corpus(n: int, seed: int = 42):
+    """混合IPv4、越界IPv4、主机名、非法主机名与Base64片段的合成语料。"""
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789-"
+    corpus = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.4:
+            corpus.append(".".join(str(rng.randint(0, 300)) for _ in range(4)))
+        elif kind < 0.8:
+            labels = ["".join(rng.choices(alphabet, k=rng.randint(1, 20))) for _ in range(rng.randint(1, 4))]
+            corpus.append(".".join(labels))
+        elif kind < 0.9:
+            corpus.append(rng.choice(["", "a..b", "bad host", "x" * 70 + ".com", "1.2.3", "[::1]", "a_b.com"]))
+        else:
+            corpus.append("".join(rng.choices(alphabet + "ABCDEF+/=", k=rng.randint(8, 64))))
+    return corpus
+
+
+def bench(label: str, fn, corpus, repeat: int) -> float:
+    best = min(timeit.repeat(lambda: [fn(x) for x in corpus], number=1, repeat=repeat))
+    print(f"{label:<34} {best * 1e9 / len(corpus):8.1f} ns/call")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark for ip_checker.validate")
+    parser.add_argument("--n", type=int, default=200000, help="Corpus size")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.n)
+    mismatches = [h for h in corpus if legacy_is_valid_hostname_or_ip(h) != is_valid_hostname_or_ip(h)]
+    mismatches += [s for s in corpus if legacy_is_probable_base64(s) != is_probable_base64(s)]
+    if mismatches:
+        print(f"Result mismatch on {len(mismatches)} inputs, e.g. {mismatches[:5]!r}")
+        sys.exit(1)
+
+    old = bench("legacy is_valid_hostname_or_ip", legacy_is_valid_hostname_or_ip, corpus, args.repeat)
+    new = bench("validate.is_valid_hostname_or_ip", is_valid_hostname_or_ip, corpus, args.repeat)
+    print(f"{'speedup':<34} {old / new:8.2f}x")
+    old = bench("legacy is_probable_base64", legacy_is_probable_base64, corpus, args.repeat)
+    new = bench("validate.is_probable_base64", is_probable_base64, corpus, args.repeat)
+    print(f"{'speedup':<34} {old / new:8.2f}x")
@@ -0,0 +1,92 @@
+"""
+合成订阅语料
+按固定种子生成可复现的订阅内容：整体 Base64 编码的 URI 列表（ss/vmess 混合）与 Clash YAML，
+服务器地址为 TEST-NET 段的IP字面量与 .invalid 顶级域下的主机名，不会指向真实服务器
+"""
+import base64
+import ipaddress
+import json
+import random
+from typing import Dict, List
+
+from src.ip_checker.yaml_io import dump_yaml
+
+# RFC 5737 文档地址段，不会与真实服务器混淆
+TEST_NETS = [ipaddress.ip_network(n) for n in ("192.0.2.0/24", "198.51.100.0/24", "203.0.113.0/24")]
+HOST_SUFFIX = "bench.invalid"
+CIPHERS = ("aes-128-gcm", "aes-256-gcm", "chacha20-ietf-poly1305")
+NETWORKS = ("tcp", "ws", "grpc")
+
+
+def synthetic_ip(index: int) -> str:
+    net = TEST_NETS[index % len(TEST_NETS)]
+    return str(net.network_address + 1 + (index // len(TEST_NETS)) % 254)
+
+
+def synthetic_host(index: int) -> str:
+    return f"node{index}.{HOST_SUFFIX}"
+
+
+def make_proxies(n: int, seed: int = 42, hostname_ratio: float = 0.3) -> List[Dict]:
+    """n 个 Clash 代理字典；约 hostname_ratio 的代理以主机名作为 server，同一IP会被多个代理共用。"""
+    rng = random.Random(seed)
+    proxies = []
+    for i in range(n):
+        server = synthetic_host(rng.randrange(n)) if rng.random() < hostname_ratio else synthetic_ip(rng.randrange(n))
+        port = rng.randint(1024, 65535)
+        if rng.random() < 0.5:
+            proxies.append({"name": f"ss-{i}", "type": "ss", "server": server, "port": port,
+                            "cipher": rng.choice(CIPHERS), "password": f"pw{rng.getrandbits(48):x}"})
+        else:
+            proxies.append({"name": f"vmess-{i}", "type": "vmess", "server": server, "port": port,
+                            "uuid": f"{rng.getrandbits(128):032x}", "alterId": 0, "cipher": "auto",
+                            "tls": rng.random() < 0.5, "network": rng.choice(NETWORKS)})
+    return proxies
+
+
+def proxy_to_uri(proxy: Dict) -> str:
+    if proxy["type"] == "ss":
+        return f"ss://{proxy['cipher']}:{proxy['password']}@{proxy['server']}:{proxy['port']}#{proxy['name']}"
+    payload = {"v": "2", "ps": proxy["name"], "add": proxy["server"], "port": proxy["port"], "id": proxy["uuid"],
+               "aid": proxy["alterId"], "scy": proxy["cipher"], "net": proxy["network"],
+               "tls": "tls" if proxy["tls"] else ""}
+    return "vmess://" + base64.b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def make_uri_subscription(n: int, seed: int = 42) -> str:
+    """逐行 URI 的明文订阅，夹杂注释与空行。"""
+    lines = []
+    for i, proxy in enumerate(make_proxies(n, seed)):
+        if i % 50 == 0:
+            lines.append(f"# batch {i // 50}")
+            lines.append("")
+        lines.append(proxy_to_uri(proxy))
+    return "\n".join(lines) + "\n"
+
+
+def make_base64_subscription(n: int, seed: int = 42) -> str:
+    """整体 Base64 编码的 URI 订阅（按76列换行，与常见机场订阅一致）。"""
+    encoded = base64.b64encode(make_uri_subscription(n, seed).encode("utf-8")).decode("ascii")
+    return "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+
+
+def make_clash_yaml_subscription(n: int, seed: int = 42) -> str:
+    """Clash YAML 订阅（带一个 select 分组）。"""
+    proxies = make_proxies(n, seed)
+    return dump_yaml({
+        "port": 7890,
+        "proxies": proxies,
+        "proxy-groups": [{"name": "PROXY", "type": "select", "proxies": [p["name"] for p in proxies]}],
+        "rules": ["MATCH,PROXY"],
+    })
+
+
+def make_mixed_corpus(n: int, seed: int = 42) -> Dict[str, str]:
+    """
+    两种格式各一份订阅，模拟同时拉取多个来源。
+    明文 URI 列表会先被整体 Base64 解码成乱码，解析器不支持，所以 URI 只以 Base64 订阅的形式出现。
+    """
+    return {
+        "base64": make_base64_subscription(n, seed),
+        "clash_yaml": make_clash_yaml_subscription(n, seed + 1),
+    }
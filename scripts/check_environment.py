@@ -24,8 +24,9 @@ logger = logging.getLogger(__name__)
 def check_dependencies() -> List[Tuple[str, bool, str]]:
     """检查Python依赖包"""
     results = []
+    # socks 由 requests[socks]（PySocks）提供，discover_exit_ips.py --scheme socks5h 需要
     required_packages = [
-        'requests', 'lxml', 'yaml', 'tqdm', 'ipinfo'
+        'requests', 'yaml', 'tqdm', 'ipinfo', 'socks'
     ]
     
     for package in required_packages:
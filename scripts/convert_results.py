@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+结果格式转换
+  .ipr -> CSV / JSON：        python scripts/convert_results.py results.ipr --to csv   (写出 results.ipr.csv)
+  JSON / CSV 报告 -> .ipr：   python scripts/convert_results.py ipinfo_results_x.json
+                              python scripts/convert_results.py subscription_ip_report.csv
+JSON 输入为 ipinfo_batch_processor.py 的 {ip: IP信息} 输出，CSV 输入为 run_purity_check.py 的报告
+
+注意 .ipr 是有损格式：城市、ISP、组织等描述字段不会写入（转换时会给出警告），
+从 .ipr 导出的 CSV/JSON 只有 IP、国家代码、ASN、风险与标记列，不能替代原始结果
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+
+# Add project root to PYTHONPATH so that 'src' is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ip_checker.columnar import FLAG_NAMES, FLAG_PURE, FLAG_UNCHECKED, RISK_UNKNOWN, VerdictTable
+from src.ip_checker.fileutil import atomic_write_json
+from src.ip_checker.resultfile import (RESULT_FILE_EXT, ResultFileReader, dropped_fields, result_path_for,
+                                       write_result_file)
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = ["ip", "countryCode", "as", "risk"] + list(FLAG_NAMES)
+
+
+def warn_dropped_fields(path: str, fields) -> None:
+    lossy = dropped_fields(fields)
+    if lossy:
+        logger.warning(f"{path}: the .ipr format does not store {', '.join(lossy)}; "
+                       f"keep the original file if you need them")
+
+
+def table_from_report_csv(path: str) -> VerdictTable:
+    """
+    run_purity_check.py 的报告（每个 host/ip 一行）按IP去重后转为结果表。
+    国家取 countryCode 列；country 列是完整国名，不能放进国家代码列，旧报告没有 countryCode 时留空。
+    """
+    table = VerdictTable()
+    seen = set()
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if "countryCode" not in (reader.fieldnames or []):
+            logger.warning(f"{path} has no countryCode column; country codes will be empty")
+        warn_dropped_fields(path, reader.fieldnames or [])
+        for row in reader:
+            ip = row.get("ip")
+            if not ip or ip in seen:
+                continue
+            seen.add(ip)
+            pure = row.get("pure")
+            flags = FLAG_PURE if pure == "yes" else FLAG_UNCHECKED if pure == "unknown" else 0
+            table.append_row(ip, row.get("countryCode") or None, row.get("as") or None, flags, RISK_UNKNOWN)
+    return table
+
+
+def table_from_results_json(path: str) -> VerdictTable:
+    with open(path, "r", encoding="utf-8") as f:
+        results = json.load(f)
+    fields = set()
+    for info in results.values():
+        if isinstance(info, dict):
+            fields.update(info)
+    warn_dropped_fields(path, fields)
+    return VerdictTable.from_results(results)
+
+
+def export_csv(reader: ResultFileReader, output: str) -> None:
+    with open(output, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(reader)
+
+
+def export_json(reader: ResultFileReader, output: str) -> None:
+    data = {}
+    for row in reader:
+        data[row.pop("ip")] = row
+    atomic_write_json(output, data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between binary .ipr result files and CSV/JSON")
+    parser.add_argument("input", help=".ipr file to export, or a JSON/CSV result file to pack")
+    parser.add_argument("--to", choices=["csv", "json"], default="csv",
+                        help="Output format when exporting an .ipr file")
+    parser.add_argument("-o", "--output", default=None, help="Output path (defaults to the input name)")
+    args = parser.parse_args()
+
+    ext = os.path.splitext(args.input)[1]
+    if ext == RESULT_FILE_EXT:
+        # 默认 results.ipr -> results.ipr.csv，避免覆盖生成该 .ipr 的原始 CSV/JSON
+        output = args.output or f"{args.input}.{args.to}"
+        with ResultFileReader(args.input) as reader:
+            if args.to == "csv":
+                export_csv(reader, output)
+            else:
+                export_json(reader, output)
+            rows = len(reader)
+    elif ext in (".json", ".csv"):
+        table = table_from_results_json(args.input) if ext == ".json" else table_from_report_csv(args.input)
+        output = args.output or result_path_for(args.input)
+        rows = write_result_file(output, table)
+    else:
+        parser.error(f"unsupported input type '{ext}' (expected {RESULT_FILE_EXT}, .json or .csv)")
+
+    logger.info(f"Wrote {rows} rows to {output}")
@@ -1,7 +1,7 @@
+import argparse
 import logging
 import sys
 import os
-import re
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple
@@ -11,12 +11,22 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.ip_checker.subscription import (
     read_subscription_links,
-    collect_proxies_from_links,
+    collect_proxy_records_from_links,
     resolve_host_to_ips,
     is_valid_hostname_or_ip,
 )
-from src.ip_checker.ip_utils import fetch_ip_info, is_pure_ip
-from src.ip_checker.clash import build_config_from_proxies, save_config
+from src.ip_checker.ip_utils import fetch_ip_info
+from src.ip_checker.checkpoint import CheckpointJournal, journal_path_for
+from src.ip_checker.egress import EgressStage
+from src.ip_checker.fileutil import atomic_write_json
+from src.ip_checker.incremental import save_clash_incremental
+from src.ip_checker.latency import load_latencies
+from src.ip_checker.metrics import export_run_metrics, get_metrics, metrics_path_for
+from src.ip_checker.models import ProxyRecord, PurityVerdict
+from src.ip_checker.pipeline import PipelineReport
+from src.ip_checker.profiling import disable_profiling, setup_profiling
+from src.ip_checker.sharding import parse_shard_spec, select_shard, shard_api_key, shard_path
+from src.ip_checker.validate import is_ipv4_literal
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -27,15 +37,11 @@ logging.getLogger("requests").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
-def _is_ipv4_literal(value: str) -> bool:
-    return bool(re.fullmatch(r"(\d{1,3}\.){3}\d{1,3}", value)) and all(0 <= int(p) <= 255 for p in value.split('.'))
-
-
-def _resolve_proxy_ipv4(proxy: Dict) -> Optional[str]:
-    server = str(proxy.get("server", ""))
+def _resolve_proxy_ipv4(proxy: ProxyRecord) -> Optional[str]:
+    server = proxy.server or ""
     if not server:
         return None
-    if _is_ipv4_literal(server):
+    if is_ipv4_literal(server):
         return server
     if not is_valid_hostname_or_ip(server):
         return None
@@ -43,7 +49,8 @@ def _resolve_proxy_ipv4(proxy: Dict) -> Optional[str]:
     return sorted(ips)[0] if ips else None
 
 
-def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float = 1.0) -> Optional[Dict]:
+def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float = 1.0,
+                             api_key: Optional[str] = None) -> Optional[Dict]:
     """
     获取IP信息，使用智能重试策略
     """
@@ -52,7 +59,7 @@ def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float =
 
     while attempt <= max_retries:
         try:
-            info = fetch_ip_info(ip)
+            info = fetch_ip_info(ip, api_key=api_key)
             if info and info.get('status') == 'success':
                 return info
             elif info and info.get('status') == 'fail':
@@ -67,8 +74,11 @@ def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float =
             # 智能退避策略
             if "429" in str(last_error) or "rate limit" in str(last_error).lower():
                 sleep_seconds = base_delay * (3 ** attempt) + 2
+                reason = "rate_limited"
             else:
                 sleep_seconds = base_delay * (2 ** attempt)
+                reason = "error"
+            get_metrics().record_retry("fetch_ip_info", reason, sleep_seconds)
 
             logger.debug(f"Retrying IP info for {ip} in {sleep_seconds:.1f}s (attempt {attempt + 1}/{max_retries + 1})")
             time.sleep(sleep_seconds)
@@ -79,20 +89,41 @@ def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float =
     return None
 
 
-def run_dedup_purity_to_yaml(sub_file: str = "汇聚订阅.txt", output_yaml: str = "dedup_purity_clash.yml") -> Tuple[int, int, str]:
+def run_dedup_purity_to_yaml(sub_file: str = "汇聚订阅.txt", output_yaml: str = "dedup_purity_clash.yml",
+                             resume: bool = False, shard: Optional[Tuple[int, int]] = None,
+                             providers_dir: Optional[str] = None,
+                             providers_url: Optional[str] = None, force: bool = False,
+                             diff_report: Optional[str] = None, egress: bool = False,
+                             mihomo: Optional[str] = None,
+                             latencies: Optional[Dict[str, float]] = None,
+                             report: Optional[PipelineReport] = None) -> Tuple[int, int, str]:
     """
     读取订阅链接 → 解析所有代理 → 解析 server 到 IPv4 → 按 IP 去重 → 并发获取 IP 信息并判定纯净 →
     在代理项上打标（country/countryCode/city/isp/org/as/purity/ip）→ 生成 Clash YAML。
 
+    每个IP的标注结果写入检查点日志，resume=True 时跳过日志中已完成的IP。
+    shard=(i, N) 时只处理一致性哈希落在第 i 个分片的IP，不生成 YAML，
+    而是把标注后的代理写入 <output>.shard-i-of-N.json，由 merge_shards.py 合并生成最终 YAML。
+    providers_dir 给出时改为 proxy-provider 输出：代理按 (纯净度, 国家) 写入该目录下的 provider 文件，
+    output_yaml 只引用它们（providers_url 给出时以 http provider 引用），内容未变的文件不重写。
+    生成前与上次的模型（<output>.model.json）比较，代理与生成参数都没有变化时跳过写入（force=True 除外），
+    diff_report 给出时把差异写为 JSON。
+    egress=True 时，对入口IP属于 CDN/中转的代理经由 mihomo（mihomo 为其路径）测量出口IP并判定，
+    这些代理的标注改为描述出口IP，同时保留 exit_ip 与 entry_purity。
+    latencies（measure_latency.py --output 的中位延迟）写入代理的 latency 字段并计入模型；分片模式下由合并步骤写入。
+    各阶段（collect → resolve → dedup →（shard）→ lookup →（egress）→ emit）的耗时与条目数记入 report。
     返回 (原始代理数, 去重后代理数, 输出文件路径)。
     """
+    report = report or PipelineReport("dedup-purity")
     links = read_subscription_links(sub_file)
     if not links:
         logger.warning("No subscription links found. Nothing to do.")
         return (0, 0, output_yaml)
 
     # 1) 收集所有代理（已按 name 去重）
-    proxies = collect_proxies_from_links(links)
+    with report.stage("collect", len(links)) as stats:
+        proxies = collect_proxy_records_from_links(links)
+        stats.items_out = len(proxies)
     total_before = len(proxies)
     if total_before == 0:
         logger.warning("No proxies parsed from subscriptions.")
@@ -101,72 +132,171 @@ def run_dedup_purity_to_yaml(sub_file: str = "汇聚订阅.txt", output_yaml: st
     logger.info(f"Collected {total_before} proxies. Resolving to IPv4 and de-duplicating by IP...")
 
     # 2) 解析每个 proxy 的 IPv4，并按 IP 去重
-    resolved_map: Dict[str, Dict] = {}  # ip -> proxy
-    with ThreadPoolExecutor(max_workers=32) as ex:
+    resolved_ips: List[Optional[str]] = [None] * len(proxies)
+    with report.stage("resolve", total_before) as stats, ThreadPoolExecutor(max_workers=32) as ex:
         future_to_idx = {ex.submit(_resolve_proxy_ipv4, p): i for i, p in enumerate(proxies)}
         for future in as_completed(future_to_idx):
             idx = future_to_idx[future]
-            proxy = proxies[idx]
             try:
-                ip = future.result()
+                resolved_ips[idx] = future.result()
             except Exception as e:
-                logger.debug(f"Resolve error for proxy '{proxy.get('name')}': {e}")
-                ip = None
+                logger.debug(f"Resolve error for proxy '{proxies[idx].name}': {e}")
+        stats.items_out = sum(1 for ip in resolved_ips if ip)
 
-            if not ip:
-                continue
+    # 按订阅中的顺序去重（而非解析完成的顺序），保证每次运行保留同一个代理，增量生成时不产生虚假差异
+    with report.stage("dedup", stats.items_out) as stats:
+        resolved_map: Dict[str, ProxyRecord] = {}  # ip -> proxy
+        for proxy, ip in zip(proxies, resolved_ips):
             # 只保留首个出现的该 IP 对应的代理
-            if ip not in resolved_map:
+            if ip and ip not in resolved_map:
                 # 暂存已解析的 IP 供后续写入
-                proxy_copy = dict(proxy)
-                proxy_copy["ip"] = ip
-                resolved_map[ip] = proxy_copy
+                proxy.ip = ip
+                resolved_map[ip] = proxy
+        stats.items_out = len(resolved_map)
 
     deduped_proxies = list(resolved_map.values())
     total_after = len(deduped_proxies)
     logger.info(f"De-duplicated proxies by IPv4: {total_before} -> {total_after}")
 
+    api_key = None
+    if shard:
+        shard_index, shard_count = shard
+        with report.stage("shard", total_after) as stats:
+            deduped_proxies = select_shard(deduped_proxies, shard_index, shard_count, key=lambda p: p.ip)
+            stats.items_out = len(deduped_proxies)
+        output_yaml = shard_path(output_yaml, shard_index, shard_count, ".json")
+        api_key = shard_api_key(shard_index)
+        logger.info(f"Shard {shard_index}/{shard_count}: {len(deduped_proxies)} of {total_after} unique IPs")
+        total_after = len(deduped_proxies)
+
     if total_after == 0:
         logger.warning("No proxies remained after IP deduplication.")
         return (total_before, 0, output_yaml)
 
     # 3) 并发获取 IP 信息并判定纯净 (降低并发数避免速率限制)
-    unique_ips = [p["ip"] for p in deduped_proxies]
-    ip_info_map: Dict[str, Dict] = {}
+    journal = CheckpointJournal(journal_path_for(output_yaml), resume=resume)
+    verdicts: Dict[str, PurityVerdict] = {}
+    pending_ips = []
+    for p in deduped_proxies:
+        if p.ip in journal:
+            verdicts[p.ip] = PurityVerdict.from_annotations(journal.get(p.ip))
+        else:
+            pending_ips.append(p.ip)
+    if verdicts:
+        logger.info(f"Restored {len(verdicts)} IP results from checkpoint")
 
     # 根据IP数量动态调整并发数
-    max_workers = min(10, len(unique_ips))  # 最多10个并发
-    logger.info(f"Using {max_workers} workers for {len(unique_ips)} unique IPs")
+    max_workers = max(1, min(10, len(pending_ips)))  # 最多10个并发
+    logger.info(f"Using {max_workers} workers for {len(pending_ips)} unique IPs")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        future_to_ip = {ex.submit(_fetch_ipinfo_with_retry, ip): ip for ip in unique_ips}
+    with report.stage("lookup", total_after) as stats, journal, ThreadPoolExecutor(max_workers=max_workers) as ex:
+        stats.notes["journaled"] = len(verdicts)
+        failed = 0
+        future_to_ip = {ex.submit(_fetch_ipinfo_with_retry, ip, api_key=api_key): ip for ip in pending_ips}
         for future in as_completed(future_to_ip):
             ip = future_to_ip[future]
             info = future.result() or {}
-            ip_info_map[ip] = info
+            verdicts[ip] = PurityVerdict.from_info(info)
+            # 失败的查询不记入检查点，resume 时会重试
+            if info.get("status") == "success":
+                journal.record(ip, verdicts[ip].to_annotations())
+            else:
+                failed += 1
+        stats.notes["looked_up"] = len(pending_ips)
+        stats.notes["failed"] = failed
+        stats.items_out = len(verdicts)
 
-    # 4) 在代理项上附加标注（purity 等）
+    # 4) 在代理项上附加判定（输出时展开为 purity/country/... 标注）
     for proxy in deduped_proxies:
-        ip = proxy.get("ip")
-        info = ip_info_map.get(ip, {})
-        proxy["purity"] = "pure" if is_pure_ip(info) else "non-pure"
-        proxy["country"] = info.get("country")
-        proxy["countryCode"] = info.get("countryCode")
-        proxy["city"] = info.get("city")
-        proxy["isp"] = info.get("isp")
-        proxy["org"] = info.get("org")
-        proxy["as"] = info.get("as")
-
-    # 5) 生成 Clash YAML（包含按 purity/country 的分组）
-    clash_conf = build_config_from_proxies(deduped_proxies)
-    save_config(clash_conf, output_yaml)
-    logger.info(f"Saved deduplicated & annotated Clash YAML to: {output_yaml}")
+        proxy.verdict = verdicts.get(proxy.ip) or PurityVerdict.from_info(None)
+
+    # 4b) 可选：入口判定只是第一轮，CDN/中转入口的代理再测量并判定实际出口
+    if egress:
+        with report.stage("egress", total_after) as stats:
+            stage = EgressStage(lambda ip: _fetch_ipinfo_with_retry(ip, api_key=api_key), binary=mihomo)
+            entry_infos = {p.name: p.verdict.to_annotations() for p in deduped_proxies}
+            results = stage.run([p.to_dict() for p in deduped_proxies], entry_infos)
+            for proxy in deduped_proxies:
+                result = results.get(proxy.name)
+                if result is None or not result.exit_ip:
+                    continue
+                proxy.exit_ip = result.exit_ip
+                if result.info and result.info.get("status") == "success":
+                    proxy.exit_verdict = PurityVerdict.from_info(result.info)
+            stats.items_out = sum(1 for r in results.values() if r.info)
+            stats.notes.update(stage.stats)
+
+    if shard:
+        # 分片模式只输出部分结果，最终 YAML 由合并步骤生成
+        with report.stage("emit", total_after) as stats:
+            atomic_write_json(output_yaml, {"shard": list(shard), "proxies": [p.to_dict() for p in deduped_proxies]})
+            stats.items_out = total_after
+        logger.info(f"Saved shard partial result to: {output_yaml}")
+        journal.discard()
+        return (total_before, total_after, output_yaml)
+
+    # 5) 生成 Clash YAML（包含按 purity/country 的分组），与上次相比没有变化时不重写
+    with report.stage("emit", total_after) as stats:
+        save_clash_incremental(deduped_proxies, output_yaml, providers_dir, providers_url,
+                               force=force, diff_report=diff_report, latencies=latencies)
+        stats.items_out = total_after
+    journal.discard()
 
     return (total_before, total_after, output_yaml)
 
 
 if __name__ == "__main__":
-    before, after, path = run_dedup_purity_to_yaml()
+    parser = argparse.ArgumentParser(description="Deduplicate proxies by IP, annotate purity and emit Clash YAML")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip IP lookups already recorded in the checkpoint journal of a previous run")
+    parser.add_argument("--shard", default=None, metavar="INDEX/COUNT",
+                        help="Only process IPs of one shard (e.g. 0/4); merge with scripts/merge_shards.py")
+    parser.add_argument("--providers-dir", default=None,
+                        help="Write per-country/purity proxy-provider files here and a main config that references them")
+    parser.add_argument("--providers-url", default=None,
+                        help="Base URL the provider files are served from (emits http providers instead of file)")
+    parser.add_argument("--egress", action="store_true",
+                        help="Measure and classify the real exit IP of proxies whose entry IP is a CDN/relay")
+    parser.add_argument("--mihomo", default=None,
+                        help="mihomo binary used for --egress probing (defaults to mihomo/clash on PATH)")
+    parser.add_argument("--latency", default=None, metavar="JSON",
+                        help="Delay results from scripts/measure_latency.py --output to store in each proxy's "
+                             "latency field (used by the latency group dimension)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rewrite the output even if nothing changed since the last run")
+    parser.add_argument("--diff-report", default=None,
+                        help="Write the added/removed/reclassified proxies since the last run to this JSON file")
+    parser.add_argument("--metrics", default=None, metavar="JSON",
+                        help="Write the run metrics summary here (default: <output>.metrics.json)")
+    parser.add_argument("--prometheus", default=None, metavar="PATH",
+                        help="Also write the run metrics in Prometheus text format")
+    parser.add_argument("--profile", nargs="?", const="all", default=None, metavar="MODES",
+                        help="Profile each pipeline stage (cpu, memory, sample; comma separated, default cpu,memory) "
+                             "into <output>.profile/; also enabled by IP_CHECKER_PROFILE")
+    args = parser.parse_args()
+
+    shard = parse_shard_spec(args.shard) if args.shard else None
+    output_yaml = "dedup_purity_clash.yml"
+    setup_profiling(shard_path(output_yaml, *shard, ".json") if shard else output_yaml, args.profile)
+    report = PipelineReport("dedup-purity")
+    try:
+        before, after, path = run_dedup_purity_to_yaml(
+            output_yaml=output_yaml,
+            resume=args.resume,
+            shard=shard,
+            providers_dir=args.providers_dir,
+            providers_url=args.providers_url,
+            force=args.force,
+            diff_report=args.diff_report,
+            egress=args.egress,
+            mihomo=args.mihomo,
+            latencies=load_latencies(args.latency) if args.latency else None,
+            report=report,
+        )
+    finally:
+        disable_profiling()
+    report.log_summary()
+    export_run_metrics(metrics_path_for(path), args.metrics, args.prometheus)
     # 退出码不强制依照纯净数量，这里只做生成产物
     logger.info(f"Done. Proxies: {before} -> {after}. Output: {path}")
 
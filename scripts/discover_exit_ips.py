@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+探测每个代理节点的真实出口IP
+  python scripts/discover_exit_ips.py dedup_purity_clash.yml --launch           # 生成监听配置、启动 mihomo 并探测
+  python scripts/discover_exit_ips.py dedup_purity_clash.yml                    # 只生成 exit_farm.yml，由已运行的 mihomo 加载
+  python scripts/discover_exit_ips.py dedup_purity_clash.yml --probe-only       # 监听已就绪，直接探测
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Add project root to PYTHONPATH so that 'src' is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ip_checker.exitfarm import (LISTEN_HOST, PROBE_SCHEMES, MihomoProcess, assign_ports, probe_exits,
+                                     write_listener_config)
+from src.ip_checker.fileutil import atomic_write_json
+from src.ip_checker.ip_utils import IPV4_ECHO_URL
+from src.ip_checker.validate import is_ipv4_literal
+from src.ip_checker.yaml_io import load_yaml
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover each proxy's egress IP through per-proxy local listener ports")
+    parser.add_argument("config", help="Clash YAML whose proxies should be probed")
+    parser.add_argument("--farm-config", default="exit_farm.yml", help="Where to write the generated listener config")
+    parser.add_argument("--port-start", type=int, default=None, help="First listener port (defaults to config.json port_start)")
+    parser.add_argument("--threads", type=int, default=None, help="Parallel probes (defaults to config.json max_threads)")
+    parser.add_argument("--launch", action="store_true", help="Start mihomo with the generated config while probing")
+    parser.add_argument("--mihomo", default=None, help="Path to the mihomo binary (defaults to mihomo/clash on PATH)")
+    parser.add_argument("--probe-only", action="store_true", help="Listeners are already running; skip writing the config")
+    parser.add_argument("--scheme", choices=PROBE_SCHEMES, default="http", help="How to talk to the listener ports")
+    parser.add_argument("--timeout", type=int, default=10, help="Per-request timeout in seconds")
+    parser.add_argument("--ipv6", action="store_true", help="Also look up the egress IPv6")
+    parser.add_argument("--ipv4-url", default=IPV4_ECHO_URL, help="Echo service returning {\"ip\": ...} for the egress IPv4")
+    parser.add_argument("--risk", action="store_true", help="Also fetch the egress IP's risk score")
+    parser.add_argument("--output", default="exit_ips.json", help="Write the probe results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        proxies = (load_yaml(f.read()) or {}).get("proxies") or []
+    if not proxies:
+        logger.error(f"No proxies in {args.config}")
+        sys.exit(1)
+
+    if args.probe_only:
+        ports = assign_ports(proxies, args.port_start)
+    else:
+        # 由本脚本启动 mihomo 时跳过已被占用的端口；配置交给已有实例加载时端口需与 --probe-only 的分配一致
+        ports = write_listener_config(proxies, args.farm_config, args.port_start,
+                                      host=LISTEN_HOST if args.launch else None)
+        if not args.launch:
+            logger.info(f"Load {args.farm_config} into mihomo, then rerun with --probe-only")
+            sys.exit(0)
+
+    probe_options = {"scheme": args.scheme, "timeout": args.timeout, "ipv6": args.ipv6, "risk": args.risk,
+                     "ipv4_url": args.ipv4_url}
+    if args.launch and not args.probe_only:
+        with MihomoProcess(args.farm_config, list(ports.values()), binary=args.mihomo):
+            results = probe_exits(ports, args.threads, **probe_options)
+    else:
+        results = probe_exits(ports, args.threads, **probe_options)
+
+    servers = {p.get("name"): p.get("server") for p in proxies}
+    relayed = [name for name, r in results.items()
+               if r.exit_ip and is_ipv4_literal(servers.get(name) or "") and r.exit_ip != servers[name]]
+    logger.info(f"{len(relayed)} proxies exit from an IP different from their entry server")
+    atomic_write_json(args.output, {name: dict(r.to_dict(), server=servers.get(name)) for name, r in results.items()})
+    logger.info(f"Saved exit IP results to {args.output}")
@@ -1,12 +1,13 @@
+import argparse
 import logging
 import sys
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
-# Add the src directory to the Python path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+# Add project root to PYTHONPATH so that 'src' is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.ip_checker.subscription import (
     read_subscription_links,
@@ -15,55 +16,182 @@ from src.ip_checker.subscription import (
 )
 from src.ip_checker.ip_utils import fetch_ip_info, is_pure_ip, fetch_ip_risk
 from src.ip_checker.clash import build_config_from_proxies, save_config
+from src.ip_checker.config import get_scoring_config
+from src.ip_checker.egress import EgressStage
+from src.ip_checker.latency import load_latencies
+from src.ip_checker.metrics import export_run_metrics, get_metrics, metrics_path_for
+from src.ip_checker.pipeline import PipelineReport
+from src.ip_checker.profiling import disable_profiling, setup_profiling
+from src.ip_checker.validate import is_ipv4_literal
+from src.ip_checker.verdict_cache import VerdictCache, get_result_ttl
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-MAX_WORKERS = 20
+# 每个阶段独立的并发数：DNS 可以放得很宽，IP 信息 API 有速率限制，scamalytics 最慢也最容易被限流
+RESOLVE_WORKERS = 32
+LOOKUP_WORKERS = 10
+RISK_WORKERS = 5
 
-def get_proxy_ip_and_score(proxy: Dict) -> Tuple[Dict, int]:
-    """For a given proxy, resolve its IP and calculate a score based on purity and risk."""
-    host = proxy.get("server")
-    if not host:
-        return proxy, 999  # No host, score it very high to place at the end
+ScoreFunction = Callable[[Optional[bool], Optional[int], Optional[float], Dict], float]
 
-    logger.info(f"Processing proxy: {proxy.get('name')} ({host})")
+
+def score_proxy(pure: Optional[bool], risk: Optional[int], latency: Optional[float], weights: Dict) -> float:
+    """
+    默认评分（越低越好）：非纯净固定罚分 + 风险分 × risk_weight + 延迟毫秒 × latency_weight。
+    pure 为 None 表示无法解析或查询，直接给 unknown_penalty。
+    """
+    if pure is None:
+        return weights["unknown_penalty"]
+    score = 0.0 if pure else weights["non_pure_penalty"]
+    if risk is not None:
+        score += risk * weights["risk_weight"]
+    if latency is not None:
+        score += latency * weights["latency_weight"]
+    return score
+
+
+def _run_concurrently(func: Callable, items: Iterable, workers: int) -> Dict:
+    """对每个唯一条目调用一次 func，返回 {条目: 结果}；单个条目出错时结果为 None。"""
+    items = list(items)
+    if not items:
+        return {}
+
+    def safe(item):
+        try:
+            return func(item)
+        except Exception as e:
+            logger.debug(f"{getattr(func, '__name__', 'task')} failed for {item}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as ex:
+        return dict(zip(items, ex.map(safe, items)))
+
+
+def resolve_ip(host: str) -> Optional[str]:
+    """主机的代表IP：IP字面量原样返回，域名取解析结果中最小的IP，保证每次运行结果一致。"""
+    if is_ipv4_literal(host):
+        return host
     ips = resolve_host_to_ips(host)
-    if not ips:
-        logger.warning(f"Could not resolve IP for host: {host}")
-        return proxy, 999
-
-    # Use the first resolved IP for checking
-    ip = list(ips)[0]
-    proxy["server"] = ip  # Replace hostname with resolved IP
-    proxy["original_host"] = host # Keep original host for reference
-
-    # Fetch info and calculate score
-    ip_info = fetch_ip_info(ip)
-    
-    # Score calculation
-    score = 0
-    # 1. Purity check (heavy penalty for non-pure)
-    if not is_pure_ip(ip_info):
-        score += 100
-        proxy['purity'] = 'non-pure'
-    else:
-        proxy['purity'] = 'pure'
-
-    # 2. Risk check (add scamalytics score)
+    return sorted(ips)[0] if ips else None
+
+
+def lookup_ip_infos(ips: List[str], workers: int = LOOKUP_WORKERS) -> Dict[str, Optional[Dict]]:
+    """批量查询纯净度信息，缓存有效期内的结果直接复用。"""
+    cache = VerdictCache()
+    ages = cache.ages(ips)
+    ttl = get_result_ttl()
+    infos: Dict[str, Optional[Dict]] = {}
+    for ip in ips:
+        if ages.get(ip, ttl) < ttl:
+            infos[ip] = cache.get(ip)
+    pending = [ip for ip in ips if not infos.get(ip)]
+    get_metrics().record_cache("verdict", hits=len(ips) - len(pending), misses=len(pending))
+    logger.info(f"Reused {len(ips) - len(pending)} cached IP results; looking up {len(pending)}")
+
+    def lookup(ip: str) -> Optional[Dict]:
+        info = fetch_ip_info(ip)
+        if info and info.get("status") == "success":
+            cache.put(ip, info)
+        return info
+
+    infos.update(_run_concurrently(lookup, pending, workers))
+    return infos
+
+
+def fetch_risk_score(ip: str) -> Optional[int]:
     risk_info = fetch_ip_risk(ip)
     if risk_info and risk_info.get("score"):
         try:
-            risk_score = int(risk_info["score"])
-            score += risk_score
-            proxy['risk_score'] = risk_score
+            return int(risk_info["score"])
         except (ValueError, TypeError):
-            pass
+            return None
+    return None
+
+
+def score_proxies(proxies: List[Dict], egress: bool = False, mihomo: Optional[str] = None,
+                  latencies: Optional[Dict[str, float]] = None, score_fn: ScoreFunction = score_proxy,
+                  weights: Optional[Dict] = None, resolve_workers: int = RESOLVE_WORKERS,
+                  lookup_workers: int = LOOKUP_WORKERS, risk_workers: int = RISK_WORKERS,
+                  report: Optional[PipelineReport] = None) -> List[Tuple[Dict, float]]:
+    """
+    分阶段为代理评分：resolve → dedup → lookup →（可选 egress）→ risk → score。
+    每个阶段只处理唯一的主机/IP，并以各自的并发数运行；返回按 (分数, 名称) 排序的 (代理, 分数)。
+    代理的 server 替换为解析出的IP（原域名保存在 original_host），并标注 purity / risk_score / latency。
+    """
+    weights = weights or get_scoring_config()
+    latencies = latencies or {}
+    report = report or PipelineReport("sorted-config")
+
+    with report.stage("resolve", len(proxies)) as stats:
+        hosts = sorted({p["server"] for p in proxies if p.get("server")})
+        host_ips = _run_concurrently(resolve_ip, hosts, resolve_workers)
+        stats.items_out = sum(1 for p in proxies if host_ips.get(p.get("server")))
+        stats.notes["hosts"] = len(hosts)
+
+    with report.stage("dedup", stats.items_out) as stats:
+        unique_ips = sorted({ip for ip in host_ips.values() if ip})
+        stats.items_out = len(unique_ips)
+
+    with report.stage("lookup", len(unique_ips)) as stats:
+        infos = lookup_ip_infos(unique_ips, lookup_workers)
+        stats.items_out = sum(1 for info in infos.values() if info and info.get("status") == "success")
+
+    for proxy in proxies:
+        host = proxy.get("server")
+        ip = host_ips.get(host)
+        if ip:
+            proxy["server"] = ip  # Replace hostname with resolved IP
+            proxy["original_host"] = host  # Keep original host for reference
+
+    # 出口判定：CDN/中转入口的代理改用实际出口IP的信息
+    judged_ip = {p["name"]: host_ips.get(p.get("original_host")) for p in proxies if p.get("name")}
+    if egress:
+        with report.stage("egress", len(proxies)) as stats:
+            stage = EgressStage(fetch_ip_info, binary=mihomo)
+            entry_infos = {name: infos.get(ip) for name, ip in judged_ip.items() if ip}
+            results = stage.run([p for p in proxies if p.get("name") in entry_infos], entry_infos)
+            for name, result in results.items():
+                if result.info and result.info.get("status") == "success":
+                    judged_ip[name] = result.exit_ip
+                    infos[result.exit_ip] = result.info
+            stats.items_out = sum(1 for r in results.values() if r.info)
+            stats.notes.update(stage.stats)
+
+    risk_ips = sorted({ip for ip in judged_ip.values() if ip})
+    with report.stage("risk", len(risk_ips)) as stats:
+        risks = _run_concurrently(fetch_risk_score, risk_ips, risk_workers)
+        stats.items_out = sum(1 for r in risks.values() if r is not None)
+
+    with report.stage("score", len(proxies)) as stats:
+        # 每个IP只判定一次
+        purity = {ip: is_pure_ip(info) for ip, info in infos.items()}
+        scored: List[Tuple[Dict, float]] = []
+        for proxy in proxies:
+            name = proxy.get("name")
+            ip = judged_ip.get(name)
+            if egress and ip and ip != proxy.get("server"):
+                proxy["exit_ip"] = ip
+                proxy["entry_purity"] = "pure" if purity.get(proxy.get("server")) else "non-pure"
+            pure = purity.get(ip, False) if ip else None
+            risk = risks.get(ip) if ip else None
+            latency = latencies.get(name)
+            if pure is not None:
+                proxy["purity"] = "pure" if pure else "non-pure"
+            if risk is not None:
+                proxy["risk_score"] = risk
+            if latency is not None:
+                proxy["latency"] = int(latency)
+            scored.append((proxy, score_fn(pure, risk, latency, weights)))
+        scored.sort(key=lambda item: (item[1], str(item[0].get("name"))))
+        stats.items_out = len(scored)
+
+    return scored
 
-    logger.info(f"Proxy {proxy.get('name')} ({ip}) scored: {score}")
-    return proxy, score
 
-def main():
+def main(egress: bool = False, mihomo: Optional[str] = None, latency_file: Optional[str] = None,
+         output: str = "sorted_clash.yaml", metrics_path: Optional[str] = None,
+         prometheus_path: Optional[str] = None):
     """Main execution logic."""
     start_time = time.time()
 
@@ -74,36 +202,55 @@ def main():
         return
 
     # 2. Collect all unique proxy configurations
-    proxies = collect_proxies_from_links(links)
+    report = PipelineReport("sorted-config")
+    with report.stage("collect", len(links)) as stats:
+        proxies = collect_proxies_from_links(links)
+        stats.items_out = len(proxies)
     if not proxies:
         logger.error("No proxies could be extracted from the subscription links. Exiting.")
         return
 
-    # 3. Concurrently resolve IPs and score all proxies
-    scored_proxies = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_proxy = {executor.submit(get_proxy_ip_and_score, proxy): proxy for proxy in proxies}
-        for future in as_completed(future_to_proxy):
-            try:
-                scored_proxy, score = future.result()
-                scored_proxies.append((scored_proxy, score))
-            except Exception as e:
-                logger.error(f"Error scoring proxy: {e}")
-
-    # 4. Sort proxies by score (lower is better)
-    scored_proxies.sort(key=lambda x: x[1])
+    # 3. Resolve, look up and score in stages (lower is better)
+    scored_proxies = score_proxies(proxies, egress=egress, mihomo=mihomo,
+                                   latencies=load_latencies(latency_file) if latency_file else None,
+                                   report=report)
     sorted_proxy_list = [p for p, s in scored_proxies]
 
     logger.info("--- Top 10 Proxies ---")
     for i, (proxy, score) in enumerate(scored_proxies[:10]):
-        logger.info(f"{i+1}. {proxy.get('name')} (Score: {score}, Purity: {proxy.get('purity')}, IP: {proxy.get('server')})")
+        logger.info(f"{i+1}. {proxy.get('name')} (Score: {score:g}, Purity: {proxy.get('purity')}, IP: {proxy.get('server')})")
 
-    # 5. Generate and save the new Clash configuration
-    new_clash_config = build_config_from_proxies(sorted_proxy_list)
-    save_config(new_clash_config, "sorted_clash.yaml")
+    # 4. Generate and save the new Clash configuration
+    with report.stage("emit", len(sorted_proxy_list)) as stats:
+        new_clash_config = build_config_from_proxies(sorted_proxy_list)
+        save_config(new_clash_config, output)
+        stats.items_out = len(sorted_proxy_list)
 
     end_time = time.time()
-    logger.info(f"Successfully generated 'sorted_clash.yaml' in {end_time - start_time:.2f} seconds.")
+    logger.info(f"Successfully generated '{output}' in {end_time - start_time:.2f} seconds.")
+    report.log_summary()
+    export_run_metrics(metrics_path_for(output), metrics_path, prometheus_path)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Score proxies by purity and risk and emit a sorted Clash config")
+    parser.add_argument("--egress", action="store_true",
+                        help="Measure and classify the real exit IP of proxies whose entry IP is a CDN/relay")
+    parser.add_argument("--mihomo", default=None,
+                        help="mihomo binary used for --egress probing (defaults to mihomo/clash on PATH)")
+    parser.add_argument("--latency", default=None, metavar="JSON",
+                        help="Delay results from scripts/measure_latency.py --output, used by the latency weight")
+    parser.add_argument("--output", default="sorted_clash.yaml", help="Where to write the sorted config")
+    parser.add_argument("--metrics", default=None, metavar="JSON",
+                        help="Write the run metrics summary here (default: <output>.metrics.json)")
+    parser.add_argument("--prometheus", default=None, metavar="PATH",
+                        help="Also write the run metrics in Prometheus text format")
+    parser.add_argument("--profile", nargs="?", const="all", default=None, metavar="MODES",
+                        help="Profile each pipeline stage (cpu, memory, sample; comma separated, default cpu,memory) "
+                             "into <output>.profile/; also enabled by IP_CHECKER_PROFILE")
+    args = parser.parse_args()
+    setup_profiling(args.output, args.profile)
+    try:
+        main(egress=args.egress, mihomo=args.mihomo, latency_file=args.latency, output=args.output,
+             metrics_path=args.metrics, prometheus_path=args.prometheus)
+    finally:
+        disable_profiling()
@@ -8,6 +8,7 @@ import sys
 import os
 import time
 import json
+import argparse
 import sqlite3
 import logging
 from datetime import datetime, timedelta
@@ -18,12 +19,16 @@ import requests
 # 添加src路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from ip_checker.subscription import collect_ips_from_links, load_subscription_links
-from ip_checker.ip_utils import is_pure_ip
+from ip_checker.subscription import collect_ips_from_links, read_subscription_links
+from ip_checker.checkpoint import CheckpointJournal
+from ip_checker.columnar import FLAG_PURE, VerdictTable
+from ip_checker.resultfile import result_path_for, write_result_file
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+JOURNAL_PATH = 'ipinfo_batch.journal.jsonl'
+
 class OptimizedIPInfoProcessor:
     """优化的IPinfo处理器，支持缓存和高并发"""
     
@@ -166,25 +171,32 @@ class OptimizedIPInfoProcessor:
         
         return normalized
     
-    def process_ips_batch(self, ips: List[str]) -> Dict[str, Dict]:
-        """批量处理IP列表"""
+    def process_ips_batch(self, ips: List[str], journal: Optional[CheckpointJournal] = None) -> Dict[str, Dict]:
+        """批量处理IP列表，传入检查点日志时跳过已完成的IP并记录新完成的IP"""
         logger.info(f"Processing {len(ips)} IPs with {self.max_workers} workers")
         
         results = {}
         cache_hits = 0
         api_calls = 0
+        journal_hits = 0
         
-        # 先检查缓存
+        # 先检查检查点和缓存
         uncached_ips = []
         for ip in ips:
+            if journal is not None and ip in journal:
+                results[ip] = journal.get(ip)
+                journal_hits += 1
+                continue
             cached = self._get_from_cache(ip)
             if cached:
                 results[ip] = cached
                 cache_hits += 1
+                if journal is not None:
+                    journal.record(ip, cached)
             else:
                 uncached_ips.append(ip)
         
-        logger.info(f"Cache hits: {cache_hits}, API calls needed: {len(uncached_ips)}")
+        logger.info(f"Checkpoint hits: {journal_hits}, Cache hits: {cache_hits}, API calls needed: {len(uncached_ips)}")
         
         if not uncached_ips:
             return results
@@ -203,27 +215,32 @@ class OptimizedIPInfoProcessor:
                     if result:
                         results[ip] = result
                         api_calls += 1
+                        if journal is not None:
+                            journal.record(ip, result)
                 except Exception as e:
                     logger.error(f"Error processing {ip}: {e}")
         
         logger.info(f"Completed: {len(results)} total, {cache_hits} cached, {api_calls} API calls")
         return results
     
-    def generate_purity_report(self, ip_results: Dict[str, Dict]) -> Tuple[int, int]:
+    def build_verdict_table(self, ip_results: Dict[str, Dict]) -> VerdictTable:
+        """把逐IP的完整JSON结果压缩为列式结果表，后续统计都在表上进行"""
+        return VerdictTable.from_results(ip_results)
+
+    def generate_purity_report(self, ip_results: Dict[str, Dict],
+                               table: Optional[VerdictTable] = None) -> Tuple[int, int]:
         """生成纯净度报告"""
-        pure_count = 0
-        non_pure_count = 0
-        
-        for ip, info in ip_results.items():
-            if info and is_pure_ip(info):
-                pure_count += 1
-            else:
-                non_pure_count += 1
-        
-        return pure_count, non_pure_count
+        table = table if table is not None else self.build_verdict_table(ip_results)
+        pure_count = table.count(table.mask_flags(all_of=FLAG_PURE))
+        return pure_count, len(table) - pure_count
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='IPinfo.io优化批量处理器')
+    parser.add_argument('--resume', action='store_true',
+                        help='跳过上次中断运行中已完成的IP（读取检查点日志）')
+    args = parser.parse_args()
+
     print("=== IPinfo.io优化批量处理器 ===\n")
     
     # 初始化处理器
@@ -235,7 +252,7 @@ def main():
     
     # 加载订阅链接
     print("1. 加载订阅链接...")
-    links = load_subscription_links()
+    links = read_subscription_links()
     print(f"   找到 {len(links)} 个订阅链接")
     
     # 收集IP地址
@@ -252,7 +269,8 @@ def main():
     # 批量处理IP信息
     print("3. 批量获取IP信息...")
     start_time = time.time()
-    ip_results = processor.process_ips_batch(unique_ips)
+    with CheckpointJournal(JOURNAL_PATH, resume=args.resume) as journal:
+        ip_results = processor.process_ips_batch(unique_ips, journal)
     process_time = time.time() - start_time
     
     print(f"   成功获取 {len(ip_results)} 个IP的信息")
@@ -261,18 +279,33 @@ def main():
     
     # 生成纯净度报告
     print("4. 生成纯净度报告...")
-    pure_count, non_pure_count = processor.generate_purity_report(ip_results)
+    table = processor.build_verdict_table(ip_results)
+    pure_count, non_pure_count = processor.generate_purity_report(ip_results, table)
     
     print(f"   纯净IP: {pure_count}")
     print(f"   非纯净IP: {non_pure_count}")
     print(f"   纯净度: {pure_count/(pure_count+non_pure_count)*100:.1f}%")
+    summary = table.summary()
+    print("   标记: " + ", ".join(f"{name}={n}" for name, n in summary["flags"].items()))
+    pure_by_country = table.group_counts("country", table.mask_flags(all_of=FLAG_PURE))
+    top = list(pure_by_country.items())[:10]
+    if top:
+        print("   纯净IP国家分布(前10): " + ", ".join(f"{cc}={n}" for cc, n in top))
     
     # 保存结果
     output_file = f"ipinfo_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(ip_results, f, indent=2, ensure_ascii=False)
     
-    print(f"5. 结果已保存到: {output_file}")
+    # 同时写出定长记录的二进制结果，下游可直接 mmap 读取，无需解析JSON
+    # （.ipr 不含城市、组织等描述字段，完整信息仍以JSON为准）
+    binary_file = result_path_for(output_file)
+    write_result_file(binary_file, table)
+    
+    print(f"5. 结果已保存到: {output_file} (二进制: {binary_file})")
+
+    # 结果已完整保存，检查点不再需要
+    journal.discard()
     
     print(f"\n总耗时: {collect_time + process_time:.1f}秒")
     print("处理完成！")
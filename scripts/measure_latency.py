@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+通过运行中的 Clash/mihomo 控制器测试代理延迟并排序
+  python scripts/measure_latency.py                         # 测试控制器中的全部代理
+  python scripts/measure_latency.py --samples 5 --threads 50 --output latency.json
+  python scripts/measure_latency.py --annotate dedup_purity_clash.yml   # 把中位延迟写回配置的 latency 字段
+
+--annotate 是一次性的后处理：它直接改写生成的 YAML，不更新增量生成的模型（<output>.model.json），
+下次生成有变化时会被覆盖，latency 分组也不会随之更新。需要保留延迟时用 --output 保存结果，
+再交给生成脚本的 --latency（dedup_purity_to_yaml.py / merge_shards.py / generate_sorted_config.py），
+延迟即成为模型的一部分：
+  python scripts/measure_latency.py --output latency.json
+  python scripts/dedup_purity_to_yaml.py --latency latency.json
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Add project root to PYTHONPATH so that 'src' is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ip_checker.fileutil import atomic_write_json
+from src.ip_checker.latency import (DEFAULT_SAMPLES, DEFAULT_TEST_URL, DEFAULT_TIMEOUT_MS, DelayTester,
+                                    annotate_latency, rank_proxies)
+from src.ip_checker.yaml_io import load_yaml, save_yaml_config
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrently delay-test proxies through the Clash API and rank them")
+    parser.add_argument("--controller", default=None, help="Controller URL (defaults to config.json external_controller)")
+    parser.add_argument("--secret", default=None, help="Controller secret (defaults to config.json secret)")
+    parser.add_argument("--threads", type=int, default=None, help="Parallel tests (defaults to config.json max_threads)")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="Delay samples per proxy")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT_MS, help="Per-test timeout in milliseconds")
+    parser.add_argument("--url", default=DEFAULT_TEST_URL, help="URL the controller fetches through each proxy")
+    parser.add_argument("--output", default=None, help="Write the ranked results to this JSON file")
+    parser.add_argument("--annotate", default=None, metavar="CLASH_YAML",
+                        help="One-off: write each proxy's median delay into this config's latency field "
+                             "(overwritten by the next generation; prefer --output with the generator's --latency)")
+    parser.add_argument("--top", type=int, default=20, help="Number of ranked proxies to print")
+    args = parser.parse_args()
+
+    with DelayTester(args.controller, args.secret, args.threads, args.timeout, args.url) as tester:
+        stats = tester.measure_all(samples=args.samples)
+    if not stats:
+        logger.error("No proxies were tested (is the controller running?)")
+        sys.exit(1)
+
+    ranked = rank_proxies(stats, include_dead=True)
+    for i, s in enumerate([s for s in ranked if s.alive][:args.top], 1):
+        logger.info(f"{i:3d}. {s.name}: median {s.median:.0f}ms, p90 {s.p90:.0f}ms, loss {s.loss:.0%}")
+
+    if args.output:
+        atomic_write_json(args.output, [s.to_dict() for s in ranked])
+        logger.info(f"Saved {len(ranked)} results to {args.output}")
+    if args.annotate:
+        with open(args.annotate, "r", encoding="utf-8") as f:
+            clash_config = load_yaml(f.read()) or {}
+        count = annotate_latency(clash_config.get("proxies") or [], stats)
+        save_yaml_config(clash_config, args.annotate)
+        logger.info(f"Annotated {count} proxies in {args.annotate} with their median delay")
@@ -0,0 +1,98 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from typing import Dict, List, Optional
+
+# Add project root to PYTHONPATH so that 'src' is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ip_checker.incremental import save_clash_incremental
+from src.ip_checker.latency import load_latencies
+from src.ip_checker.report import CsvReportWriter, REPORT_FIELDS
+from src.ip_checker.sharding import shard_path
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def _shard_parts(path: str, shard_count: int, ext: Optional[str] = None, allow_missing: bool = False) -> List[str]:
+    """列出所有分片的部分结果文件，缺失分片时报错（除非允许缺失）。"""
+    parts = [shard_path(path, i, shard_count, ext) for i in range(shard_count)]
+    missing = [p for p in parts if not os.path.exists(p)]
+    if missing:
+        if not allow_missing:
+            raise FileNotFoundError(f"Missing shard results: {', '.join(missing)}")
+        logger.warning(f"Merging without {len(missing)} missing shards: {', '.join(missing)}")
+    return [p for p in parts if os.path.exists(p)]
+
+
+def merge_reports(report_path: str, shard_count: int, allow_missing: bool = False) -> int:
+    """把各分片的 CSV 报告合并为一份，返回非纯净行数。"""
+    non_pure_count = 0
+    with CsvReportWriter(report_path, fieldnames=REPORT_FIELDS) as sink:
+        for part in _shard_parts(report_path, shard_count, allow_missing=allow_missing):
+            with open(part, "r", newline="", encoding="utf-8-sig") as f:
+                for row in csv.DictReader(f):
+                    sink.write_row(row)
+                    if row.get("pure") == "no":
+                        non_pure_count += 1
+        rows = sink.rows_written
+    logger.info(f"Merged {rows} rows from {shard_count} shards into {report_path}. Non-pure count: {non_pure_count}")
+    return non_pure_count
+
+
+def merge_clash(output_yaml: str, shard_count: int, allow_missing: bool = False,
+                providers_dir: Optional[str] = None, providers_url: Optional[str] = None,
+                force: bool = False, diff_report: Optional[str] = None,
+                latencies: Optional[Dict[str, float]] = None) -> int:
+    """把各分片标注后的代理合并，生成最终 Clash YAML（与上次相比没有变化时不重写），返回代理数。"""
+    proxies: Dict[str, Dict] = {}
+    for part in _shard_parts(output_yaml, shard_count, ".json", allow_missing):
+        with open(part, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for proxy in data.get("proxies", []):
+            # 不同分片的IP互不相交，这里只防御同名代理
+            proxies.setdefault(proxy.get("name"), proxy)
+    merged = list(proxies.values())
+    save_clash_incremental(merged, output_yaml, providers_dir, providers_url, force=force, diff_report=diff_report,
+                           latencies=latencies)
+    logger.info(f"Merged {len(merged)} proxies from {shard_count} shards into {output_yaml}")
+    return len(merged)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge per-shard purity results into the final CSV / Clash YAML")
+    parser.add_argument("--shards", type=int, required=True, help="Number of shards the run was split into")
+    parser.add_argument("--report", nargs="?", const="subscription_ip_report.csv", default=None,
+                        help="Merge run_purity_check.py shard reports into this CSV")
+    parser.add_argument("--clash", nargs="?", const="dedup_purity_clash.yml", default=None,
+                        help="Merge dedup_purity_to_yaml.py shard results into this YAML")
+    parser.add_argument("--providers-dir", default=None,
+                        help="With --clash: write proxy-provider files here and a main config referencing them")
+    parser.add_argument("--providers-url", default=None,
+                        help="Base URL the provider files are served from (emits http providers instead of file)")
+    parser.add_argument("--force", action="store_true",
+                        help="With --clash: rewrite the YAML even if nothing changed since the last run")
+    parser.add_argument("--diff-report", default=None,
+                        help="With --clash: write the proxy changes since the last run to this JSON file")
+    parser.add_argument("--latency", default=None, metavar="JSON",
+                        help="With --clash: delay results from scripts/measure_latency.py --output to store "
+                             "in each proxy's latency field")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="Merge whatever shards finished instead of failing")
+    args = parser.parse_args()
+
+    if not args.report and not args.clash:
+        parser.error("nothing to merge: pass --report and/or --clash")
+
+    exit_code = 0
+    if args.report:
+        # 与 run_purity_check.py 一致：存在非纯净IP时退出码为1
+        exit_code = 1 if merge_reports(args.report, args.shards, args.allow_missing) > 0 else 0
+    if args.clash:
+        merge_clash(args.clash, args.shards, args.allow_missing, args.providers_dir, args.providers_url,
+                    args.force, args.diff_report, load_latencies(args.latency) if args.latency else None)
+    sys.exit(exit_code)
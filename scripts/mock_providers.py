@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+启动本地模拟查询服务（proxycheck / ipinfo / ip-api / DoH），用于离线压测
+  python scripts/mock_providers.py --port 18080 --latency 0.05 --jitter 0.02 --error-rate 0.01
+  python scripts/mock_providers.py --rate-limit proxycheck=2 --rate-limit ipinfo=16 --quota proxycheck=1000
+启动后按提示导出 IP_CHECKER_*_URL 环境变量，再在同一终端运行其它脚本即可改用模拟服务
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# Add project root to PYTHONPATH so that 'src' is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ip_checker.mockserver import SERVICES, MockProviderServer, ServiceBehavior
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def parse_overrides(values, cast):
+    """把 ["proxycheck=2", ...] 解析为 {服务名: 值}。"""
+    overrides = {}
+    for value in values or []:
+        name, sep, number = value.partition("=")
+        name = name.strip().replace("-", "_")
+        if not sep or name not in SERVICES:
+            raise SystemExit(f"Expected SERVICE=VALUE with SERVICE in {', '.join(SERVICES)}, got '{value}'")
+        overrides[name] = cast(number)
+    return overrides
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the IP lookup and DoH providers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform latency jitter (+/- seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500/503")
+    parser.add_argument("--rate-limit", action="append", metavar="SERVICE=N",
+                        help="Requests per second before answering 429 (repeatable)")
+    parser.add_argument("--quota", action="append", metavar="SERVICE=N",
+                        help="Total requests before the service denies further queries (repeatable)")
+    parser.add_argument("--service-latency", action="append", metavar="SERVICE=SECONDS",
+                        help="Per-service base latency overriding --latency (repeatable)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for injected errors and jitter")
+    args = parser.parse_args()
+
+    default = ServiceBehavior(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    rate_limits = parse_overrides(args.rate_limit, float)
+    quotas = parse_overrides(args.quota, int)
+    latencies = parse_overrides(args.service_latency, float)
+    behaviors = {}
+    for name in SERVICES:
+        overrides = {}
+        if name in rate_limits:
+            overrides["rate_limit"] = rate_limits[name]
+        if name in quotas:
+            overrides["quota"] = quotas[name]
+        if name in latencies:
+            overrides["latency"] = latencies[name]
+        behaviors[name] = default.copy(**overrides)
+
+    server = MockProviderServer(args.host, args.port, behaviors=behaviors, seed=args.seed)
+
+    async def main():
+        await server.start()
+        for key, value in server.env().items():
+            print(f"export {key}={value}", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info(f"Stopped. Request counts: {server.stats()}")
@@ -1,16 +1,25 @@
-import csv
+import argparse
 import logging
 import time
 import sys
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Optional
+from functools import partial
+from typing import List, Dict, Iterator, Optional, Set, Tuple
 
 # Add project root to PYTHONPATH so that 'src' is importable
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.ip_checker.subscription import read_subscription_links, collect_ips_from_links
+from src.ip_checker.subscription import read_subscription_links, fetch_host_sets, resolve_hosts
 from src.ip_checker.ip_utils import fetch_ip_info, is_pure_ip
+from src.ip_checker.checkpoint import CheckpointJournal, journal_path_for
+from src.ip_checker.metrics import export_run_metrics, get_metrics, metrics_path_for
+from src.ip_checker.pipeline import PipelineReport, StageStats
+from src.ip_checker.profiling import disable_profiling, setup_profiling
+from src.ip_checker.quota import remaining_lookup_budget
+from src.ip_checker.report import CsvReportWriter, REPORT_FIELDS
+from src.ip_checker.scheduler import LookupScheduler
+from src.ip_checker.sharding import parse_shard_spec, select_shard, shard_api_key, shard_path
+from src.ip_checker.verdict_cache import VerdictCache, get_result_ttl
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -19,7 +28,8 @@ logger = logging.getLogger(__name__)
 logging.getLogger("requests").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
-def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float = 1.0) -> Optional[Dict]:
+def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float = 1.0,
+                             api_key: Optional[str] = None) -> Optional[Dict]:
     """
     Fetches IP info with improved retry strategy.
     使用智能重试策略，根据错误类型调整重试行为
@@ -29,7 +39,7 @@ def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float =
 
     while attempt <= max_retries:
         try:
-            info = fetch_ip_info(ip)
+            info = fetch_ip_info(ip, api_key=api_key)
             if info and info.get('status') == 'success':
                 return info
             elif info and info.get('status') == 'fail':
@@ -45,9 +55,12 @@ def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float =
             if "429" in str(last_error) or "rate limit" in str(last_error).lower():
                 # 速率限制错误，使用更长的延迟
                 sleep_seconds = base_delay * (3 ** attempt) + 2
+                reason = "rate_limited"
             else:
                 # 其他错误，使用标准指数退避
                 sleep_seconds = base_delay * (2 ** attempt)
+                reason = "error"
+            get_metrics().record_retry("fetch_ip_info", reason, sleep_seconds)
 
             logger.debug(f"Retrying for {ip} in {sleep_seconds:.1f}s (attempt {attempt + 1}/{max_retries + 1})")
             time.sleep(sleep_seconds)
@@ -57,69 +70,217 @@ def _fetch_ipinfo_with_retry(ip: str, max_retries: int = 2, base_delay: float =
     logger.warning(f"Failed to fetch info for {ip} after {max_retries + 1} attempts. Last error: {last_error}")
     return None
 
-def run_check(links: List[str]) -> int:
-    """Returns the number of non-pure IPs found."""
-    pairs = collect_ips_from_links(links)
-    rows = []
-    non_pure_count = 0
+def _iter_verdicts(ip_weights: Dict[str, int], max_lookups: Optional[int], time_budget: Optional[float],
+                   stats: StageStats, api_key: Optional[str] = None) -> Iterator[Tuple[str, Optional[Dict], bool]]:
+    """
+    对唯一IP逐个产出 (ip, info, fresh)，每个IP最多查询一次；info 为 None 表示未能检查，
+    fresh 为 False 表示沿用了过期的旧结果。
 
-    logger.info(f"Found {len(pairs)} (host, ip) pairs. Now fetching IP information...")
-    info_results: Dict[str, Dict] = {}
+    缓存有效期内的结果直接复用，其余IP交给 LookupScheduler 按优先级查询：
+    从未查过的IP → 缓存最旧的IP → 承载主机最多的IP。
+    超出预算未查询的IP有旧结果则沿用旧结果。
+    """
+    cache = VerdictCache()
+    ages = cache.ages(ip_weights)
+    ttl = get_result_ttl()
+    stale_weights: Dict[str, int] = {}
+    cached_count = 0
+    for ip, weight in ip_weights.items():
+        cached = cache.get(ip) if ages.get(ip, ttl) < ttl else None
+        if cached:
+            cached_count += 1
+            yield ip, cached, True
+        else:
+            stale_weights[ip] = weight
+    stats.notes["cached"] = cached_count
+    get_metrics().record_cache("verdict", hits=cached_count, misses=len(stale_weights))
+    logger.info(f"Reused {cached_count} cached results; {len(stale_weights)} IPs need lookup")
+
+    # 查询次数受剩余配额限制
+    budget = remaining_lookup_budget(api_key)
+    if budget is not None:
+        max_lookups = budget if max_lookups is None else min(max_lookups, budget)
+    scheduler = LookupScheduler(stale_weights, ages, max_lookups=max_lookups, time_budget=time_budget)
 
     # 降低并发数以避免速率限制
-    max_workers = min(10, len(pairs))  # 最多10个并发，避免过度并发
+    max_workers = max(1, min(10, len(scheduler.planned)))  # 最多10个并发，避免过度并发
     logger.info(f"Using {max_workers} workers for IP information fetching")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        future_to_ip = {ex.submit(_fetch_ipinfo_with_retry, ip): ip for _, ip in pairs}
-        for future in as_completed(future_to_ip):
-            ip = future_to_ip[future]
-            info = future.result() or {}
-            info_results[ip] = info
-
-    logger.info("IP information fetched. Now checking for purity and generating report.")
-    for host, ip in pairs:
-        info = info_results.get(ip, {})
-        pure = is_pure_ip(info)
-        if not pure:
-            non_pure_count += 1
-        rows.append(
-            {
-                "host": host,
-                "ip": ip,
-                "pure": "yes" if pure else "no",
-                "country": info.get("country", ""),
-                "regionName": info.get("regionName", ""),
-                "city": info.get("city", ""),
-                "isp": info.get("isp", ""),
-                "org": info.get("org", ""),
-                "as": info.get("as", ""),
-            }
-        )
+    looked_up = 0
+    for ip, info in scheduler.run(partial(_fetch_ipinfo_with_retry, api_key=api_key), max_workers):
+        looked_up += 1
+        info = info or {}
+        if info.get("status") == "success":
+            cache.put(ip, info)
+        yield ip, info, True
+    stats.notes["looked_up"] = looked_up
 
-    # Write report
-    report_path = "subscription_ip_report.csv"
-    with open(report_path, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["host", "ip", "pure", "country", "regionName", "city", "isp", "org", "as"],
+    # 超出预算未查询的IP：有旧结果则沿用，否则标记为unknown
+    unknown = 0
+    for ip in scheduler.skipped:
+        previous = cache.get(ip)
+        if not previous:
+            unknown += 1
+        yield ip, previous, False
+    if scheduler.skipped:
+        stats.notes["skipped"] = len(scheduler.skipped)
+        logger.warning(
+            f"Budget exhausted: {len(scheduler.skipped)} IPs not looked up this run "
+            f"({len(scheduler.skipped) - unknown} reuse stale results, {unknown} unknown)"
         )
-        writer.writeheader()
-        writer.writerows(rows)
-    
+
+
+def _verdict_from_info(info: Optional[Dict]) -> Dict[str, str]:
+    """把查询结果压缩成报告所需的字段（不含 host/ip），同时也是检查点日志里保存的内容。"""
+    if info is None:
+        # 因预算不足未检查且无历史结果，不计入非纯净
+        info, pure_label = {}, "unknown"
+    else:
+        pure_label = "yes" if is_pure_ip(info) else "no"
+    return {
+        "pure": pure_label,
+        "country": info.get("country", ""),
+        "countryCode": info.get("countryCode", ""),
+        "regionName": info.get("regionName", ""),
+        "city": info.get("city", ""),
+        "isp": info.get("isp", ""),
+        "org": info.get("org", ""),
+        "as": info.get("as", ""),
+    }
+
+
+def run_check(links: List[str], max_lookups: Optional[int] = None, time_budget: Optional[float] = None,
+              resume: bool = False, report_path: str = "subscription_ip_report.csv",
+              shard: Optional[Tuple[int, int]] = None) -> int:
+    """
+    Returns the number of non-pure IPs found.
+
+    流水线分为 collect → resolve → lookup → fanout 四个阶段，每个阶段报告去掉的条目数：
+    collect 去掉跨订阅重复的主机，resolve 去掉无法解析的主机，
+    lookup 只对唯一IP查询（多个主机解析到同一IP时只查一次），fanout 把结果展开回 (host, ip)。
+    lookup 与 fanout 交错执行：每个IP的结果一出来就写入报告，不在内存中保留完整结果。
+    max_lookups / time_budget 限制本次运行的API查询次数与查询阶段耗时（秒）；
+    resume=True 时保留已有的部分报告，只处理尚未写入的 (host, ip)，
+    并从检查点日志恢复已完成的查询结果，不再重复查询。
+    shard=(i, N) 时只处理一致性哈希落在第 i 个分片的IP，报告写入 <report>.shard-i-of-N.csv，
+    并可从 PROXYCHECK_API_KEYS 中为该分片挑选独立的API密钥；最终报告由 merge_shards.py 合并。
+    """
+    report = PipelineReport("purity-check")
+
+    with report.stage("collect") as stats:
+        host_sets = fetch_host_sets(links)
+        unique_hosts: Set[str] = set()
+        for hs in host_sets:
+            unique_hosts.update(hs)
+        stats.items_in = sum(len(hs) for hs in host_sets)
+        stats.items_out = len(unique_hosts)
+        del host_sets
+
+    with report.stage("resolve", len(unique_hosts)) as stats:
+        pairs = resolve_hosts(unique_hosts)
+        stats.items_out = len(pairs)
+        stats.removed = len(unique_hosts) - len({host for host, _ in pairs})
+    del unique_hosts
+
+    api_key = None
+    if shard:
+        shard_index, shard_count = shard
+        with report.stage("shard", len(pairs)) as stats:
+            pairs = select_shard(pairs, shard_index, shard_count, key=lambda pair: pair[1])
+            stats.items_out = len(pairs)
+        report_path = shard_path(report_path, shard_index, shard_count)
+        api_key = shard_api_key(shard_index)
+        logger.info(f"Running shard {shard_index}/{shard_count} "
+                    f"({'dedicated' if api_key else 'default'} API key), report: {report_path}")
+
+    logger.info(f"Found {len(pairs)} (host, ip) pairs. Now fetching IP information...")
+
+    non_pure_count = 0
+    completed = False
+    journal = CheckpointJournal(journal_path_for(report_path), resume=resume)
+    with journal, CsvReportWriter(report_path, fieldnames=REPORT_FIELDS, resume=resume,
+                                  redo=lambda row: row.get("pure") == "unknown") as sink:
+        # 待写入的 (ip -> hosts)，续写时跳过报告里已有的行
+        pending_hosts: Dict[str, List[str]] = {}
+        for host, ip in pairs:
+            if not sink.is_done(host, ip):
+                pending_hosts.setdefault(ip, []).append(host)
+        non_pure_count += sink.resumed_counts.get("no", 0)
+        total_pairs = len(pairs)
+        del pairs
+
+        fanout = StageStats("fanout", len(pending_hosts))
+        with report.stage("lookup", sum(len(h) for h in pending_hosts.values())) as stats:
+            def verdicts() -> Iterator[Tuple[str, Dict[str, str]]]:
+                # 检查点中已有结果的IP直接产出，其余IP进入查询
+                journaled = [(ip, v) for ip, v in journal.items() if ip in pending_hosts]
+                stats.notes["journaled"] = len(journaled)
+                yield from journaled
+                ip_weights = {ip: len(hosts) for ip, hosts in pending_hosts.items() if ip not in journal}
+                for ip, info, fresh in _iter_verdicts(ip_weights, max_lookups, time_budget, stats, api_key):
+                    verdict = _verdict_from_info(info)
+                    # 失败的查询不记入检查点，resume 时会重试
+                    if fresh and info.get("status") == "success":
+                        journal.record(ip, verdict)
+                    yield ip, verdict
+
+            for ip, verdict in verdicts():
+                stats.items_out += 1
+                emit_start = time.perf_counter()
+                for host in pending_hosts.pop(ip, []):
+                    sink.write_row({"host": host, "ip": ip, **verdict})
+                    fanout.items_out += 1
+                    if verdict["pure"] == "no":
+                        non_pure_count += 1
+                fanout.elapsed += time.perf_counter() - emit_start
+            completed = "skipped" not in stats.notes
+        report.record(fanout)
+
+    if completed:
+        # 全部IP都已检查，检查点不再需要
+        journal.discard()
+
     logger.info(
-        f"Checked {len(pairs)} (host, ip) pairs. Non-pure count: {non_pure_count}. Report saved to {report_path}"
+        f"Checked {total_pairs} (host, ip) pairs. Non-pure count: {non_pure_count}. Report saved to {report_path}"
     )
+    report.log_summary()
     return non_pure_count
 
 if __name__ == "__main__":
     # Assume the script is run from the project root
+    parser = argparse.ArgumentParser(description="Check purity of IPs behind subscription links")
+    parser.add_argument("--max-lookups", type=int, default=None,
+                        help="Maximum number of IP lookups in this run")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Stop starting new lookups after this many seconds")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run: keep the partial report and skip lookups "
+                             "recorded in the checkpoint journal")
+    parser.add_argument("--shard", default=None, metavar="INDEX/COUNT",
+                        help="Only check IPs of one shard (e.g. 0/4); merge with scripts/merge_shards.py")
+    parser.add_argument("--metrics", default=None, metavar="JSON",
+                        help="Write the run metrics summary here (default: <report>.metrics.json)")
+    parser.add_argument("--prometheus", default=None, metavar="PATH",
+                        help="Also write the run metrics in Prometheus text format")
+    parser.add_argument("--profile", nargs="?", const="all", default=None, metavar="MODES",
+                        help="Profile each pipeline stage (cpu, memory, sample; comma separated, default cpu,memory) "
+                             "into <report>.profile/; also enabled by IP_CHECKER_PROFILE")
+    args = parser.parse_args()
+
     links = read_subscription_links("汇聚订阅.txt")
     if not links:
         logger.warning("No subscription links found. Exiting.")
         sys.exit(0)
 
-    non_pure_total = run_check(links)
+    shard = parse_shard_spec(args.shard) if args.shard else None
+    report_path = shard_path("subscription_ip_report.csv", *shard) if shard else "subscription_ip_report.csv"
+    setup_profiling(report_path, args.profile)
+    try:
+        non_pure_total = run_check(links, max_lookups=args.max_lookups, time_budget=args.time_budget,
+                                   resume=args.resume, shard=shard)
+    finally:
+        disable_profiling()
+    export_run_metrics(metrics_path_for(report_path), args.metrics, args.prometheus)
     
     # Exit with 1 if any non-pure IPs are found, for CI purposes
     exit_code = 1 if non_pure_total > 0 else 0
@@ -0,0 +1,94 @@
+"""
+检查点日志
+以追加方式记录已完成的查询（JSON Lines），中断后以 resume 模式重新运行可跳过已完成的部分
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointJournal:
+    """
+    追加写入的检查点日志，每行一条 {"key": ..., "result": ..., "ts": ...}。
+
+    resume=False 时清空旧日志重新开始；resume=True 时载入已有记录并继续追加。
+    每条记录写入后立即 flush，进程被杀死最多丢失最后一条，读取时忽略残缺的行。
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._completed: Dict[str, Any] = {}
+        if resume:
+            self._load()
+            if self._completed:
+                logger.info(f"Resuming from checkpoint {path}: {len(self._completed)} completed entries")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        self._completed[entry["key"]] = entry.get("result")
+                    except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+                        logger.debug(f"Ignoring malformed checkpoint line {line_no} in {self.path}")
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._completed
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._completed.get(key, default)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(list(self._completed.items()))
+
+    def record(self, key: str, result: Any) -> None:
+        """记录一条已完成的结果并立即落盘。"""
+        line = json.dumps({"key": key, "result": result, "ts": round(time.time(), 3)}, ensure_ascii=False)
+        with self._lock:
+            self._completed[key] = result
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def discard(self) -> None:
+        """运行完整结束后删除日志，避免下次 resume 误用过期结果。"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "CheckpointJournal":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def journal_path_for(output_path: str) -> str:
+    """产物文件对应的检查点日志路径，例如 report.csv -> report.csv.journal.jsonl"""
+    return f"{output_path}.journal.jsonl"
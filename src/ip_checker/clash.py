@@ -1,68 +1,137 @@
 import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from urllib.parse import quote, urlparse
 import requests
-import yaml
 
 # Use absolute import for the config within the package
-from .config import config
+from .config import config, get_clash_config, get_controller_config
+from .models import ProxyRecord
+from .yaml_io import save_yaml_config
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 # --- Clash API Interaction ---
 
-def get_api_headers() -> dict:
+def get_api_headers(secret: Optional[str] = None) -> dict:
     """Constructs headers for Clash API requests."""
     headers = {}
-    if config.get("secret"):
-        headers["Authorization"] = f'Bearer {config["secret"]}'
+    secret = get_controller_config()["secret"] if secret is None else secret
+    if secret:
+        headers["Authorization"] = f'Bearer {secret}'
     return headers
 
-def fetch_proxies() -> list:
-    """Fetches and filters the list of available proxies from the Clash API."""
+
+def controller_url(path: str, controller: Optional[str] = None) -> str:
+    """Absolute URL of a Clash API endpoint, e.g. controller_url('/proxies')."""
+    return (controller or get_controller_config()["external_controller"]).rstrip("/") + path
+
+
+# Seconds to wait for the controller itself (delay tests add their own timeout on top)
+API_TIMEOUT = 10
+
+# Proxy types reported by the API that are groups or built-ins rather than real proxies
+NON_PROXY_TYPES = {
+    "LoadBalance", "Selector", "URLTest", "Fallback", "Compatible",
+    "Direct", "Reject", "RejectDrop", "Pass"
+}
+
+
+def fetch_proxies(session: Optional[requests.Session] = None, timeout: float = API_TIMEOUT,
+                  controller: Optional[str] = None, secret: Optional[str] = None) -> list:
+    """Fetches and filters the list of available proxies from the Clash API (config.json's controller by default)."""
     try:
-        headers = get_api_headers()
-        response = requests.get(f'{config["external_controller"]}/proxies', headers=headers)
+        http = session or requests
+        response = http.get(controller_url("/proxies", controller), headers=get_api_headers(secret), timeout=timeout)
         response.raise_for_status()
         proxies = response.json().get("proxies", {})
         logger.info(f"Retrieved {len(proxies)} total proxies/groups from API.")
 
         # Filter out non-proxy types (selectors, groups, etc.)
-        non_proxy_types = {
-            "LoadBalance", "Selector", "URLTest", "Fallback", "Compatible",
-            "Direct", "Reject", "RejectDrop", "Pass"
-        }
         filtered_proxies = [
-            key for key, value in proxies.items() if value.get("type") not in non_proxy_types
+            key for key, value in proxies.items() if value.get("type") not in NON_PROXY_TYPES
         ]
         logger.info(f"Filtered down to {len(filtered_proxies)} proxies.")
 
         return filtered_proxies
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"Error fetching proxy list from Clash API: {e}")
         return []
 
-def delay_test(proxy_group: str, timeout: int = 5000) -> dict:
-    """Performs a delay test on a specified proxy group."""
+def delay_test(proxy_group: str, timeout: int = 5000, session: Optional[requests.Session] = None) -> dict:
+    """Performs a delay test on a specified proxy group (see latency.DelayTester for per-proxy tests)."""
     try:
-        headers = get_api_headers()
-        url = f'{config["external_controller"]}/group/{quote(proxy_group)}/delay'
+        http = session or requests
+        url = controller_url(f"/group/{quote(proxy_group, safe='')}/delay")
         params = {"url": "https://www.google.com/generate_204", "timeout": timeout}
-        response = requests.get(url, params=params, headers=headers)
+        # The controller answers only after the whole group finished, so allow the test timeout on top
+        response = http.get(url, params=params, headers=get_api_headers(), timeout=API_TIMEOUT + timeout / 1000)
         response.raise_for_status()
         result = response.json()
         logger.info(f"Delay test for group '{proxy_group}' completed, tested {len(result)} proxies.")
         return result
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"Error during delay test for group '{proxy_group}': {e}")
         return {}
 
 # --- Clash Configuration Generation ---
 
-def build_config_from_proxies(proxies_list: list) -> dict:
-    """Builds a full Clash configuration with intelligent grouping."""
-    logger.info(f"Building config from a list of {len(proxies_list)} proxies with auto grouping.")
+DEFAULT_GROUP_BY = ("country", "purity")
+
+# Risk score (0-100, e.g. from fetch_ip_risk) and latency (ms) tiers: (upper bound, label)
+RISK_BUCKETS = ((30, "LOW"), (70, "MEDIUM"), (100, "HIGH"))
+LATENCY_TIERS = ((150, "FAST"), (400, "MEDIUM"), (float("inf"), "SLOW"))
+
+
+def _tier(value, tiers) -> Optional[str]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    for bound, label in tiers:
+        if value <= bound:
+            return label
+    return tiers[-1][1]
+
+
+def _country_key(proxy: dict) -> str:
+    return str(proxy.get("countryCode") or "Unknown").upper()
+
+
+def _asn_key(proxy: dict) -> Optional[str]:
+    token = str(proxy.get("as") or "").split(" ", 1)[0].upper()
+    return token if token.startswith("AS") and token[2:].isdigit() else None
+
+
+def _purity_key(proxy: dict) -> Optional[str]:
+    purity = proxy.get("purity")
+    return purity if purity in ("pure", "non-pure") else None
+
+
+def _risk_key(proxy: dict) -> Optional[str]:
+    risk = proxy.get("risk")
+    return _tier(risk if risk is not None else proxy.get("risk_score"), RISK_BUCKETS)
+
 
+def _latency_key(proxy: dict) -> Optional[str]:
+    latency = proxy.get("latency")
+    return _tier(latency if latency is not None else proxy.get("delay"), LATENCY_TIERS)
+
+
+_PURITY_GROUP_NAMES = {"pure": "✅ PURE", "non-pure": "❌ NON-PURE"}
+
+# dimension -> (key function, group name for a key, key order or None for sorted)
+GROUP_DIMENSIONS: Dict[str, Tuple[Callable[[dict], Optional[str]], Callable[[str], str], Optional[List[str]]]] = {
+    "country": (_country_key, lambda key: f"AUTO-{key}", None),
+    "asn": (_asn_key, lambda key: f"ASN-{key}", None),
+    "purity": (_purity_key, _PURITY_GROUP_NAMES.get, ["pure", "non-pure"]),
+    "risk": (_risk_key, lambda key: f"RISK-{key}", [label for _, label in RISK_BUCKETS]),
+    "latency": (_latency_key, lambda key: f"LATENCY-{key}", [label for _, label in LATENCY_TIERS]),
+}
+
+
+def base_config(proxies_list: Optional[list] = None) -> dict:
+    """The non-group part of a generated config: proxies, DNS, rules and the API controller."""
     new_config = {
         "proxies": proxies_list or [],
         "dns": {
@@ -89,60 +158,82 @@ def build_config_from_proxies(proxies_list: list) -> dict:
             new_config["secret"] = str(config["secret"])
     except Exception as e:
         logger.warning(f"Could not parse external_controller from config: {e}")
+    return new_config
+
+
+def build_config_from_proxies(proxies_list: list, group_by: Optional[Sequence[str]] = None) -> dict:
+    """Builds a full Clash configuration with intelligent grouping.
+
+    Accepts Clash proxy dicts or ProxyRecord objects; records are converted to dicts here, at emission time.
+    group_by selects the grouping dimensions (see GROUP_DIMENSIONS), defaulting to config.json's
+    clash.group_by or country + purity.
+    """
+    proxies_list = [p.to_dict() if isinstance(p, ProxyRecord) else p for p in proxies_list or []]
+    logger.info(f"Building config from a list of {len(proxies_list)} proxies with auto grouping.")
+
+    new_config = base_config(proxies_list)
 
     # --- Intelligent Grouping Logic ---
-    proxy_groups = []
-    proxy_names = [p["name"] for p in proxies_list if p.get("name")]
+    group_by = list(group_by) if group_by is not None else get_clash_config().get("group_by", DEFAULT_GROUP_BY)
+    unknown = [dim for dim in group_by if dim not in GROUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown proxy group dimension(s): {', '.join(unknown)}")
+    key_fns = [(dim, GROUP_DIMENSIONS[dim][0]) for dim in group_by]
+
+    # Single pass: every group is a list of indices into proxy_names
+    proxy_names = []
+    pure_indices = []
+    buckets = {dim: {} for dim in group_by}
+    for p in proxies_list:
+        name = p.get("name")
+        if not name:
+            continue
+        idx = len(proxy_names)
+        proxy_names.append(name)
+        if p.get("purity") == "pure":
+            pure_indices.append(idx)
+        for dim, key_fn in key_fns:
+            key = key_fn(p)
+            if key is not None:
+                buckets[dim].setdefault(key, []).append(idx)
 
     if not proxy_names:
         new_config["proxy-groups"] = []
         return new_config
 
-    # 1. Group by Purity
-    pure_proxies = [p["name"] for p in proxies_list if p.get("purity") == "pure"]
-    non_pure_proxies = [p["name"] for p in proxies_list if p.get("purity") == "non-pure"]
+    # Groups with identical members share one list object, which the YAML dumper emits once (&anchor / *alias)
+    member_lists = {}
 
-    # 2. Group by Country
-    country_groups = {}
-    for p in proxies_list:
-        country_code = p.get("countryCode", "Unknown").upper()
-        if country_code not in country_groups:
-            country_groups[country_code] = []
-        country_groups[country_code].append(p["name"])
+    def members(indices):
+        key = tuple(indices)
+        if key not in member_lists:
+            member_lists[key] = [proxy_names[i] for i in indices]
+        return member_lists[key]
 
-    # 3. Build the proxy-groups list for YAML
+    proxy_groups = []
     group_selectors = []
 
     # Add URL Test group for pure nodes
-    if pure_proxies:
+    if pure_indices:
         proxy_groups.append({
             "name": "⚡ URL-TEST",
             "type": "url-test",
             "url": "http://www.gstatic.com/generate_204",
             "interval": 300,
-            "proxies": pure_proxies,
+            "proxies": members(pure_indices),
         })
         group_selectors.append("⚡ URL-TEST")
 
-    # Add country groups
-    for country_code, names in sorted(country_groups.items()):
-        group_name = f"AUTO-{country_code}"
-        proxy_groups.append({
-            "name": group_name,
-            "type": "select",
-            "proxies": names,
-        })
-        group_selectors.append(group_name)
-
-    # Add purity groups
-    if pure_proxies:
-        proxy_groups.append({"name": "✅ PURE", "type": "select", "proxies": pure_proxies})
-        group_selectors.append("✅ PURE")
-    if non_pure_proxies:
-        proxy_groups.append({"name": "❌ NON-PURE", "type": "select", "proxies": non_pure_proxies})
-        group_selectors.append("❌ NON-PURE")
+    for dim in group_by:
+        _, group_name, order = GROUP_DIMENSIONS[dim]
+        groups = buckets[dim]
+        keys = [k for k in order if k in groups] if order else sorted(groups)
+        for key in keys:
+            name = group_name(key)
+            proxy_groups.append({"name": name, "type": "select", "proxies": members(groups[key])})
+            group_selectors.append(name)
 
-    # 4. Create top-level selector
+    # Create top-level selector
     proxy_groups.insert(0, {
         "name": "✈️ PROXY",
         "type": "select",
@@ -150,15 +241,16 @@ def build_config_from_proxies(proxies_list: list) -> dict:
     })
 
     new_config["proxy-groups"] = proxy_groups
-    logger.info("Finished building new Clash configuration with advanced groups.")
+    logger.info(f"Finished building new Clash configuration with {len(proxy_groups)} groups "
+                f"({len(member_lists)} distinct member lists).")
     return new_config
 
 def save_config(clash_config: dict, file_path: str):
     """Saves a Clash configuration dict to a YAML file."""
     logger.info(f"Saving new configuration to: {file_path}")
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            yaml.dump(clash_config, f, allow_unicode=True, sort_keys=False)
+        # Streams the proxies list in chunks via libyaml when available; output matches yaml.dump
+        save_yaml_config(clash_config, file_path)
         logger.info("Configuration saved successfully.")
     except Exception as e:
         logger.error(f"Error saving configuration to {file_path}: {e}")
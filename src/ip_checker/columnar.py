@@ -0,0 +1,244 @@
+"""
+列式存储的IP判定结果表
+每个IP只占约11字节（打包的IPv4、国家/ASN分类编码、标志位、风险分），
+过滤与分组通过 bytes.translate / itertools.compress / Counter 在C层完成，无需逐条处理完整的JSON
+"""
+import socket
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ip_utils import is_pure_ip
+
+# flags 列的位定义
+FLAG_HOSTING = 1
+FLAG_VPN = 2
+FLAG_PROXY = 4
+FLAG_TOR = 8
+FLAG_PURE = 16
+# 因预算等原因未能检查（报告中 pure=unknown）
+FLAG_UNCHECKED = 32
+
+FLAG_NAMES = {"hosting": FLAG_HOSTING, "vpn": FLAG_VPN, "proxy": FLAG_PROXY, "tor": FLAG_TOR,
+              "pure": FLAG_PURE, "unchecked": FLAG_UNCHECKED}
+
+# risk 列中表示“无风险分”的值
+RISK_UNKNOWN = 255
+UNKNOWN = "Unknown"
+
+
+def flags_from_info(info: Optional[Dict]) -> int:
+    """由IP信息计算标志位：privacy 字典优先，其次是顶层的 hosting/vpn/proxy/tor 字段。"""
+    if not info:
+        return 0
+    privacy = info.get("privacy") or {}
+    flags = 0
+    for name in ("hosting", "vpn", "proxy", "tor"):
+        if privacy.get(name, info.get(name)):
+            flags |= FLAG_NAMES[name]
+    if info.get("is_proxy"):
+        flags |= FLAG_PROXY
+    return flags
+
+
+def _risk_value(risk) -> int:
+    if risk is None:
+        return RISK_UNKNOWN
+    try:
+        return max(0, min(100, int(risk)))
+    except (TypeError, ValueError):
+        return RISK_UNKNOWN
+
+
+def _mask_table(all_of: int, none_of: int) -> bytes:
+    """256项转换表：标志字节满足条件映射为1，否则为0，供 bytes.translate 使用。"""
+    return bytes(1 if (b & all_of) == all_of and not (b & none_of) else 0 for b in range(256))
+
+
+class _Categories:
+    """字符串到小整数编码的双向映射，编码0固定表示未知"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.values: List[str] = [UNKNOWN]
+        self._codes: Dict[str, int] = {UNKNOWN: 0}
+
+    def encode(self, value: Optional[str]) -> int:
+        if not value:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            if code >= self.limit:
+                raise OverflowError(f"Too many distinct categories (limit {self.limit})")
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value: Optional[str]) -> Optional[int]:
+        return self._codes.get(value or UNKNOWN)
+
+
+class VerdictTable:
+    """
+    列式IP结果表。
+
+    列：ips(array 'I'，IPv4打包为整数) / country(bytearray，国家代码分类编码) /
+    asn(array 'I'，ASN字符串分类编码) / flags(bytearray，FLAG_* 位) / risk(array 'B'，0-100，255表示未知)。
+    非IPv4地址（如IPv6）在 ips 列中记为0，原始字符串另存于 _other_ips。
+    掩码为与行数等长的 bytes，每字节0或1。
+    """
+
+    def __init__(self):
+        self.ips = array("I")
+        self.country = bytearray()
+        self.asn = array("I")
+        self.flags = bytearray()
+        self.risk = array("B")
+        self.countries = _Categories(limit=256)
+        self.asns = _Categories(limit=2 ** 32)
+        self._other_ips: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def append(self, ip: str, info: Optional[Dict], pure: Optional[bool] = None, risk=None) -> None:
+        """追加一行。pure 未给出时用 is_pure_ip 判定；risk 未给出时取 info 中的 risk_score。"""
+        info = info or {}
+        flags = flags_from_info(info)
+        if pure if pure is not None else is_pure_ip(info):
+            flags |= FLAG_PURE
+        self.append_row(ip, info.get("countryCode") or info.get("country"), info.get("as"), flags,
+                        _risk_value(risk if risk is not None else info.get("risk_score")))
+
+    def append_row(self, ip: str, country: Optional[str], asn: Optional[str], flags: int, risk: int) -> None:
+        """按列值直接追加一行（flags 为 FLAG_* 组合，risk 为0-100或 RISK_UNKNOWN）。"""
+        try:
+            self.ips.append(int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+        except (OSError, TypeError):
+            self._other_ips[len(self.ips)] = ip
+            self.ips.append(0)
+        self.country.append(self.countries.encode(country))
+        self.asn.append(self.asns.encode(asn))
+        self.flags.append(flags)
+        self.risk.append(risk)
+
+    @classmethod
+    def from_results(cls, results: Dict[str, Optional[Dict]]) -> "VerdictTable":
+        """由 {ip: IP信息} 字典构建。"""
+        table = cls()
+        for ip, info in results.items():
+            table.append(ip, info)
+        return table
+
+    # --- 行访问 ---
+
+    def ip_at(self, index: int) -> str:
+        other = self._other_ips.get(index)
+        if other is not None:
+            return other
+        return socket.inet_ntoa(self.ips[index].to_bytes(4, "big"))
+
+    def row(self, index: int) -> Dict:
+        flags = self.flags[index]
+        risk = self.risk[index]
+        row = {
+            "ip": self.ip_at(index),
+            "countryCode": self.countries.values[self.country[index]],
+            "as": self.asns.values[self.asn[index]],
+            "risk": None if risk == RISK_UNKNOWN else risk,
+        }
+        for name, bit in FLAG_NAMES.items():
+            row[name] = bool(flags & bit)
+        return row
+
+    # --- 向量化过滤 ---
+
+    def mask_flags(self, all_of: int = 0, none_of: int = 0) -> bytes:
+        """标志位同时包含 all_of 且不含 none_of 的行。"""
+        return bytes(self.flags).translate(_mask_table(all_of, none_of))
+
+    def mask_country(self, *codes: str) -> bytes:
+        """国家代码属于给定集合的行（"Unknown" 匹配缺失国家）。"""
+        wanted = {self.countries.code_of(c) for c in codes} - {None}
+        table = bytes(1 if b in wanted else 0 for b in range(256))
+        return bytes(self.country).translate(table)
+
+    def mask_risk(self, max_risk: int, include_unknown: bool = False) -> bytes:
+        """风险分不超过 max_risk 的行。"""
+        table = bytes(1 if b <= max_risk or (include_unknown and b == RISK_UNKNOWN) else 0 for b in range(256))
+        return self.risk.tobytes().translate(table)
+
+    def mask_and(self, *masks: bytes) -> bytes:
+        """多个掩码按位与（借助大整数运算一次完成）；没有掩码时选中全部行。"""
+        if not masks:
+            return b"\x01" * len(self)
+        result = int.from_bytes(masks[0], "little")
+        for mask in masks[1:]:
+            result &= int.from_bytes(mask, "little")
+        return result.to_bytes(len(self), "little")
+
+    def mask_or(self, *masks: bytes) -> bytes:
+        """多个掩码按位或；没有掩码时不选中任何行。"""
+        result = 0
+        for mask in masks:
+            result |= int.from_bytes(mask, "little")
+        return result.to_bytes(len(self), "little")
+
+    def indices(self, mask: Optional[bytes] = None) -> List[int]:
+        if mask is None:
+            return list(range(len(self)))
+        return list(compress(range(len(self)), mask))
+
+    def select_ips(self, mask: bytes) -> List[str]:
+        return [self.ip_at(i) for i in compress(range(len(self)), mask)]
+
+    @staticmethod
+    def count(mask: bytes) -> int:
+        return mask.count(1)
+
+    # --- 分组统计 ---
+
+    def _column(self, column: str) -> Tuple[Iterable[int], List[str]]:
+        if column == "country":
+            return self.country, self.countries.values
+        if column == "asn":
+            return self.asn, self.asns.values
+        raise ValueError(f"Unknown categorical column '{column}'")
+
+    def group_counts(self, column: str, mask: Optional[bytes] = None) -> Dict[str, int]:
+        """按国家或ASN分组计数，可先用掩码过滤。按数量降序返回。"""
+        codes, values = self._column(column)
+        if column == "country":
+            # 国家编码不超过255，直接对字节串逐个编码计数（每次 count 都是C层扫描）
+            data = bytes(codes) if mask is None else bytes(compress(codes, mask))
+            counts = Counter()
+            for code in range(len(values)):
+                n = data.count(code)
+                if n:
+                    counts[code] = n
+        else:
+            counts = Counter(codes if mask is None else compress(codes, mask))
+        return {values[code]: n for code, n in counts.most_common()}
+
+    def group_indices(self, column: str, mask: Optional[bytes] = None) -> Dict[str, List[int]]:
+        """按国家或ASN分组返回行号，用于构建报告或 Clash 分组。"""
+        codes, values = self._column(column)
+        groups: Dict[int, List[int]] = {}
+        rows = range(len(self)) if mask is None else compress(range(len(self)), mask)
+        for i in rows:
+            groups.setdefault(codes[i], []).append(i)
+        return {values[code]: idx for code, idx in groups.items()}
+
+    def summary(self) -> Dict:
+        """纯净度、标志位与国家分布的汇总。"""
+        pure = self.count(self.mask_flags(all_of=FLAG_PURE))
+        return {
+            "total": len(self),
+            "pure": pure,
+            "non_pure": len(self) - pure,
+            "flags": {name: self.count(self.mask_flags(all_of=bit))
+                      for name, bit in FLAG_NAMES.items() if bit != FLAG_PURE},
+            "countries": self.group_counts("country"),
+        }
@@ -78,3 +78,55 @@ def get_retry_config(provider_name: str) -> Dict[str, Any]:
         "max_retries": provider_config.get("max_retries", 2),
         "retry_delay": provider_config.get("retry_delay", 1.0)
     }
+
+def get_api_provider_settings(provider_name: str) -> Dict[str, Any]:
+    """Get settings (limits, priority) for a provider from the 'api.providers' section"""
+    providers = config.get("api", {}).get("providers", {})
+    return providers.get(provider_name.replace("-", "_"), {})
+
+# 各外部服务的默认地址；可在 config.json 的 api.endpoints 中覆盖，
+# 或用环境变量 IP_CHECKER_<NAME>_URL（如 IP_CHECKER_PROXYCHECK_URL）临时指向本地模拟服务
+DEFAULT_ENDPOINTS = {
+    "proxycheck": "http://proxycheck.io/v2",
+    "ipinfo": "https://ipinfo.io",
+    "ip_api": "http://ip-api.com",
+    "doh": "https://dns.google/resolve",
+    "scamalytics": "https://scamalytics.com/ip",
+    "ping0": "https://ping0.cc/ip",
+}
+
+def get_endpoint(name: str) -> str:
+    """Get the base URL of an external service: env IP_CHECKER_<NAME>_URL > api.endpoints > built-in default"""
+    key = name.replace("-", "_")
+    url = (os.getenv(f"IP_CHECKER_{key.upper()}_URL")
+           or config.get("api", {}).get("endpoints", {}).get(key)
+           or DEFAULT_ENDPOINTS[key])
+    return url.rstrip("/")
+
+def get_quota_config() -> Dict[str, Any]:
+    """Get quota ledger configuration"""
+    return config.get("quota", {})
+
+def get_clash_config() -> Dict[str, Any]:
+    """Get Clash config generation settings (e.g. proxy group dimensions)"""
+    return config.get("clash", {})
+
+def get_controller_config() -> Dict[str, Any]:
+    """Get Clash/mihomo external controller settings (address, secret, parallelism, listener ports)"""
+    return {
+        "external_controller": config.get("external_controller", "http://127.0.0.1:9090"),
+        "secret": config.get("secret", ""),
+        "max_threads": int(config.get("max_threads", 20)),
+        "port_start": int(config.get("port_start", 42000)),
+    }
+
+def get_scoring_config() -> Dict[str, Any]:
+    """Get proxy scoring weights for generate_sorted_config (lower score is better)"""
+    weights = {
+        "non_pure_penalty": 100,  # 非纯净IP的固定罚分
+        "risk_weight": 1.0,       # 每个风险分（0-100）的罚分
+        "latency_weight": 0.0,    # 每毫秒延迟的罚分，0 表示不考虑延迟
+        "unknown_penalty": 999,   # 无法解析/查询的代理
+    }
+    weights.update(config.get("scoring", {}))
+    return weights
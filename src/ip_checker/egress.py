@@ -0,0 +1,243 @@
+"""
+出口IP判定阶段
+入口IP（代理 server 解析出的IP）的判定作为低成本的第一轮；只有入口IP属于已知 CDN / 中转，
+或代理通过 ws/grpc 等传输借用其它域名前置时，才经由代理实际测量出口IP（见 exitfarm），
+再对出口IP做纯净度判定。出口映射与出口IP的查询结果都会缓存，控制每次运行的探测成本
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .config import get_controller_config
+from .exitfarm import LISTEN_HOST, MihomoProcess, free_ports, probe_exits, write_listener_config
+from .fileutil import atomic_write_json, read_json
+from .metrics import get_metrics
+from .verdict_cache import VerdictCache, get_result_ttl
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EGRESS_CACHE = "egress_cache.json"
+DEFAULT_FARM_CONFIG = "egress_farm.yml"
+
+# 入口IP所属ASN为这些CDN时，入口IP不代表出口
+CDN_ASNS = {
+    "AS13335": "Cloudflare",
+    "AS209242": "Cloudflare",
+    "AS20940": "Akamai",
+    "AS16625": "Akamai",
+    "AS54113": "Fastly",
+    "AS199524": "Gcore",
+    "AS60068": "CDN77",
+}
+# 查询结果中没有ASN时按 org/isp 关键字识别
+CDN_KEYWORDS = ("cloudflare", "akamai", "fastly", "cloudfront", "gcore", "cdn77")
+# 这些传输方式可以经 CDN 前置
+FRONTABLE_NETWORKS = ("ws", "grpc", "h2", "httpupgrade")
+
+
+def _asn_token(value: Optional[str]) -> Optional[str]:
+    token = str(value or "").split(" ", 1)[0].upper()
+    return token if token.startswith("AS") and token[2:].isdigit() else None
+
+
+def _front_host(proxy: Dict) -> Optional[str]:
+    """ws/grpc 等传输中实际请求的域名（Host 头或 SNI），与 server 不同时说明经过前置。"""
+    if proxy.get("network") not in FRONTABLE_NETWORKS:
+        return None
+    ws_headers = (proxy.get("ws-opts") or {}).get("headers") or {}
+    host = ws_headers.get("Host") or ws_headers.get("host") or proxy.get("servername") or proxy.get("sni")
+    return str(host) if host else None
+
+
+def egress_probe_reason(proxy: Dict, entry_info: Optional[Dict]) -> Optional[str]:
+    """
+    判断是否需要测量出口IP，返回原因（如 "cdn:Cloudflare"、"fronted:example.com"），不需要时返回 None。
+    entry_info 为入口IP的查询结果或判定标注（需要 as/org/isp 字段）。
+    """
+    entry_info = entry_info or {}
+    cdn = CDN_ASNS.get(_asn_token(entry_info.get("as")))
+    if cdn:
+        return f"cdn:{cdn}"
+    text = f"{entry_info.get('org') or ''} {entry_info.get('isp') or ''} {entry_info.get('as') or ''}".lower()
+    for keyword in CDN_KEYWORDS:
+        if keyword in text:
+            return f"cdn:{keyword}"
+    host = _front_host(proxy)
+    # original_host: generate_sorted_config 把 server 替换为解析出的IP前的域名
+    own = {str(proxy.get(k) or "").lower() for k in ("server", "original_host")}
+    if host and host.lower() not in own:
+        return f"fronted:{host}"
+    return None
+
+
+def endpoint_key(proxy: Dict) -> str:
+    """出口缓存的键：同一入口（类型/地址/端口/前置域名）视为同一出口。"""
+    return "|".join(str(v or "") for v in (proxy.get("type"), proxy.get("server"), proxy.get("port"),
+                                            _front_host(proxy)))
+
+
+class EgressCache:
+    """入口 → 出口IP 的映射缓存（JSON文件），超过 ttl 秒的记录视为过期"""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.path = path or os.getenv("IP_CHECKER_EGRESS_CACHE") or DEFAULT_EGRESS_CACHE
+        self.ttl = ttl if ttl is not None else get_result_ttl()
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = read_json(self.path, default={}) or {}
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if not entry or time.time() - entry.get("ts", 0) >= self.ttl:
+            return None
+        return entry.get("exit_ip")
+
+    def put(self, key: str, exit_ip: str) -> None:
+        with self._lock:
+            self._entries[key] = {"exit_ip": exit_ip, "ts": time.time()}
+
+    def save(self) -> None:
+        with self._lock:
+            now = time.time()
+            # 顺带清理过期记录，缓存文件不会无限增长
+            entries = {k: v for k, v in self._entries.items() if now - v.get("ts", 0) < self.ttl}
+        atomic_write_json(self.path, entries)
+
+
+class EgressResult:
+    """一个代理的出口测量结果"""
+
+    __slots__ = ("name", "reason", "exit_ip", "info", "cached")
+
+    def __init__(self, name: str, reason: str, exit_ip: Optional[str] = None,
+                 info: Optional[Dict] = None, cached: bool = False):
+        self.name = name
+        self.reason = reason
+        self.exit_ip = exit_ip
+        # 出口IP的查询结果（fetch_ip_info 格式），未能测得出口或查询失败时为 None
+        self.info = info
+        self.cached = cached
+
+
+class EgressStage:
+    """
+    可选的出口IP判定阶段。
+
+    run() 对需要测量的代理：先查出口缓存，其余通过 exitfarm 启动 mihomo 监听并发探测；
+    得到的出口IP再经 VerdictCache 与 lookup（默认为调用方提供的带重试的 fetch_ip_info）判定。
+    未找到 mihomo 时记录警告并跳过探测，入口判定保持不变。
+    """
+
+    def __init__(self, lookup: Callable[[str], Optional[Dict]], cache: Optional[EgressCache] = None,
+                 verdict_cache: Optional[VerdictCache] = None, binary: Optional[str] = None,
+                 port_start: Optional[int] = None, max_threads: Optional[int] = None,
+                 farm_config: str = DEFAULT_FARM_CONFIG, **probe_options):
+        self.lookup = lookup
+        self.cache = cache or EgressCache()
+        self.verdict_cache = verdict_cache or VerdictCache()
+        self.binary = binary
+        self.port_start = port_start
+        self.max_threads = max_threads
+        self.farm_config = farm_config
+        self.probe_options = probe_options
+        self.stats: Dict[str, int] = {"candidates": 0, "cache_hits": 0, "probed": 0, "resolved": 0}
+
+    def select(self, proxies: List[Dict], entry_infos: Dict[str, Optional[Dict]]) -> Dict[str, str]:
+        """{代理名: 需要测量出口的原因}，entry_infos 以代理名为键。"""
+        reasons = {}
+        for proxy in proxies:
+            reason = egress_probe_reason(proxy, entry_infos.get(proxy.get("name")))
+            if reason:
+                reasons[proxy["name"]] = reason
+        return reasons
+
+    def _probe(self, proxies: List[Dict]) -> Dict[str, Optional[str]]:
+        """
+        经由本地监听端口测量出口IP：{代理名: 出口IP或None}。
+        代理数超过 port_start 之后空闲的端口数时分批启动 mihomo，某一批失败时跳过其余批次。
+        """
+        port_start = self.port_start if self.port_start is not None else get_controller_config()["port_start"]
+        exits: Dict[str, Optional[str]] = {}
+        remaining = proxies
+        while remaining:
+            batch_size = len(free_ports(LISTEN_HOST, port_start, len(remaining)))
+            if not batch_size:
+                logger.warning(f"Skipping egress probing of {len(remaining)} proxies: "
+                               f"no free listener ports from {port_start}")
+                break
+            batch, remaining = remaining[:batch_size], remaining[batch_size:]
+            if remaining or exits:
+                logger.info(f"Egress probing a batch of {len(batch)} proxies ({len(remaining)} left)")
+            results = self._probe_batch(batch, port_start)
+            if results is None:
+                break
+            exits.update(results)
+        return exits
+
+    def _probe_batch(self, proxies: List[Dict], port_start: int) -> Optional[Dict[str, Optional[str]]]:
+        """启动一个 mihomo 探测一批代理；无法探测时记录警告并返回 None"""
+        try:
+            ports = write_listener_config(proxies, self.farm_config, port_start, host=LISTEN_HOST)
+            with MihomoProcess(self.farm_config, list(ports.values()), binary=self.binary):
+                results = probe_exits(ports, self.max_threads, **self.probe_options)
+        except (FileNotFoundError, RuntimeError, TimeoutError, ValueError) as e:
+            logger.warning(f"Skipping egress probing: {e}")
+            return None
+        finally:
+            try:
+                os.remove(self.farm_config)
+            except OSError:
+                pass
+        return {name: r.exit_ip for name, r in results.items()}
+
+    def _classify(self, ip: str) -> Optional[Dict]:
+        info = self.verdict_cache.get(ip, max_age=get_result_ttl())
+        get_metrics().record_cache("verdict", hits=int(info is not None), misses=int(info is None))
+        if info is None:
+            info = self.lookup(ip)
+            if info and info.get("status") == "success":
+                self.verdict_cache.put(ip, info, source="egress")
+        return info
+
+    def run(self, proxies: List[Dict], entry_infos: Dict[str, Optional[Dict]]) -> Dict[str, EgressResult]:
+        """测量并判定需要的代理的出口，返回 {代理名: EgressResult}。"""
+        reasons = self.select(proxies, entry_infos)
+        self.stats["candidates"] = len(reasons)
+        if not reasons:
+            return {}
+        by_name = {p["name"]: p for p in proxies if p.get("name") in reasons}
+
+        results: Dict[str, EgressResult] = {}
+        to_probe = []
+        for name, reason in reasons.items():
+            exit_ip = self.cache.get(endpoint_key(by_name[name]))
+            if exit_ip:
+                results[name] = EgressResult(name, reason, exit_ip, cached=True)
+            else:
+                results[name] = EgressResult(name, reason)
+                to_probe.append(by_name[name])
+        self.stats["cache_hits"] = len(reasons) - len(to_probe)
+        get_metrics().record_cache("exit_ip", hits=self.stats["cache_hits"], misses=len(to_probe))
+        logger.info(f"Egress stage: {len(reasons)} proxies behind CDN/relay entries, "
+                    f"{self.stats['cache_hits']} exit IPs cached, probing {len(to_probe)}")
+
+        if to_probe:
+            self.stats["probed"] = len(to_probe)
+            for name, exit_ip in self._probe(to_probe).items():
+                if exit_ip:
+                    results[name].exit_ip = exit_ip
+                    self.cache.put(endpoint_key(by_name[name]), exit_ip)
+            self.cache.save()
+
+        exit_ips = sorted({r.exit_ip for r in results.values() if r.exit_ip})
+        workers = max(1, min(10, len(exit_ips)))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            infos = dict(zip(exit_ips, ex.map(self._classify, exit_ips)))
+        for r in results.values():
+            if r.exit_ip:
+                r.info = infos.get(r.exit_ip)
+        self.stats["resolved"] = sum(1 for r in results.values() if r.info and r.info.get("status") == "success")
+        logger.info(f"Egress stage: classified {self.stats['resolved']}/{len(reasons)} exit IPs")
+        return results
@@ -0,0 +1,221 @@
+"""
+出口IP探测
+为每个代理在本机分配一个监听端口（从 config.json 的 port_start 开始），生成带 listeners 的 mihomo 配置，
+再经由这些端口并发请求IP回显服务（及可选的风险查询），得到每个节点真实的出口IP，而不仅是入口 server
+"""
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .clash import base_config
+from .config import get_controller_config
+from .ip_utils import IPV4_ECHO_URL, IPV6_ECHO_URL, fetch_ip_risk, fetch_ipv4, fetch_ipv6
+from .models import ProxyRecord
+from .yaml_io import save_yaml_config
+
+logger = logging.getLogger(__name__)
+
+LISTEN_HOST = "127.0.0.1"
+MAX_PORT = 65535
+# mixed 监听同时接受 HTTP 与 SOCKS5；探测时默认以 HTTP 代理方式访问
+LISTENER_TYPE = "mixed"
+PROBE_SCHEMES = ("http", "socks5h")
+# 等待 mihomo 打开全部监听端口的时间（秒）
+STARTUP_TIMEOUT = 30
+
+
+def port_free(host: str, port: int) -> bool:
+    """端口当前能否被监听（没有其它进程占用）"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # 允许绑定仍处于 TIME_WAIT 的端口，已在监听的端口仍会失败
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+def free_ports(host: str, port_start: int, count: int) -> List[int]:
+    """从 port_start 起依次找出最多 count 个 host 上空闲的端口"""
+    ports: List[int] = []
+    port = port_start
+    while len(ports) < count and port <= MAX_PORT:
+        if port_free(host, port):
+            ports.append(port)
+        port += 1
+    return ports
+
+
+def assign_ports(proxies_list: list, port_start: Optional[int] = None,
+                 host: Optional[str] = None) -> Dict[str, int]:
+    """
+    按代理顺序分配端口：{代理名: 端口}。host 给出时跳过该地址上已被其它进程占用的端口。
+    端口不够时抛出 ValueError。
+    """
+    port_start = port_start if port_start is not None else get_controller_config()["port_start"]
+    names = list(dict.fromkeys(p.name if isinstance(p, ProxyRecord) else p.get("name") for p in proxies_list))
+    names = [name for name in names if name]
+    if host is not None:
+        candidates = free_ports(host, port_start, len(names))
+    else:
+        candidates = list(range(port_start, min(port_start + len(names), MAX_PORT + 1)))
+    if len(candidates) < len(names):
+        raise ValueError(f"{len(names)} proxies do not fit into the free ports {port_start}-{MAX_PORT}")
+    return dict(zip(names, candidates))
+
+
+def build_listener_config(proxies_list: list, ports: Dict[str, int], listen: str = LISTEN_HOST) -> Dict:
+    """
+    生成 mihomo 配置：每个代理一个 listeners 条目，从该端口进入的流量固定走对应代理，
+    与规则、分组无关。
+    """
+    proxies = [p.to_dict() if isinstance(p, ProxyRecord) else p for p in proxies_list]
+    new_config = base_config([p for p in proxies if p.get("name") in ports])
+    # 探测实例不开放控制器，避免与正在运行的 Clash 冲突
+    new_config.pop("external-controller", None)
+    new_config.pop("secret", None)
+    new_config["allow-lan"] = False
+    new_config["listeners"] = [
+        {"name": f"exit-{port}", "type": LISTENER_TYPE, "port": port, "listen": listen, "proxy": name}
+        for name, port in ports.items()
+    ]
+    # 监听固定指定了出站，规则只作兜底
+    new_config["rules"] = ["MATCH,DIRECT"]
+    return new_config
+
+
+def _port_open(host: str, port: int) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+class MihomoProcess:
+    """
+    以给定配置启动 mihomo（或兼容的 clash 内核），等待全部监听端口就绪；作为上下文管理器使用，退出时结束进程。
+    """
+
+    def __init__(self, config_path: str, ports: List[int], binary: Optional[str] = None,
+                 host: str = LISTEN_HOST, startup_timeout: float = STARTUP_TIMEOUT):
+        self.binary = binary or shutil.which("mihomo") or shutil.which("clash-meta") or shutil.which("clash")
+        if not self.binary:
+            raise FileNotFoundError("mihomo binary not found; pass its path or install it on PATH")
+        self.config_path = config_path
+        self.ports = ports
+        self.host = host
+        self.startup_timeout = startup_timeout
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        # 已被占用的端口一连就通，会被误当作 mihomo 已就绪
+        busy = [port for port in self.ports if not port_free(self.host, port)]
+        if busy:
+            raise RuntimeError(f"{len(busy)} listener ports are already in use (e.g. {busy[:5]})")
+        workdir = os.path.dirname(os.path.abspath(self.config_path))
+        self.process = subprocess.Popen([self.binary, "-d", workdir, "-f", self.config_path],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + self.startup_timeout
+        pending = list(self.ports)
+        while pending:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.binary} exited with code {self.process.returncode} during startup")
+            pending = [port for port in pending if not _port_open(self.host, port)]
+            if pending and time.monotonic() > deadline:
+                self.stop()
+                raise TimeoutError(f"{len(pending)} listener ports did not open within {self.startup_timeout}s")
+            if pending:
+                time.sleep(0.2)
+        logger.info(f"Started {self.binary} with {len(self.ports)} listeners")
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def __enter__(self) -> "MihomoProcess":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+
+class ExitProbe:
+    """一个代理经本地监听端口探测到的出口信息"""
+
+    __slots__ = ("name", "port", "exit_ip", "exit_ipv6", "risk", "error")
+
+    def __init__(self, name: str, port: int, exit_ip: Optional[str] = None, exit_ipv6: Optional[str] = None,
+                 risk: Optional[Dict] = None, error: Optional[str] = None):
+        self.name = name
+        self.port = port
+        self.exit_ip = exit_ip
+        self.exit_ipv6 = exit_ipv6
+        self.risk = risk
+        self.error = error
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "port": self.port, "exit_ip": self.exit_ip, "exit_ipv6": self.exit_ipv6,
+                "risk": self.risk, "error": self.error}
+
+
+def local_proxy(port: int, host: str = LISTEN_HOST, scheme: str = "http") -> Dict[str, str]:
+    """requests 的 proxies 参数：所有请求经由本地端口转发。"""
+    if scheme not in PROBE_SCHEMES:
+        raise ValueError(f"Unsupported probe scheme '{scheme}' (expected one of {', '.join(PROBE_SCHEMES)})")
+    address = f"{scheme}://{host}:{port}"
+    return {"http": address, "https": address}
+
+
+def probe_exit(name: str, port: int, host: str = LISTEN_HOST, scheme: str = "http", timeout: int = 10,
+               ipv6: bool = False, risk: bool = False, ipv4_url: str = IPV4_ECHO_URL,
+               ipv6_url: str = IPV6_ECHO_URL) -> ExitProbe:
+    """经由一个本地端口探测出口IPv4（及可选的IPv6、风险分）。"""
+    proxy = local_proxy(port, host, scheme)
+    probe = ExitProbe(name, port, exit_ip=fetch_ipv4(proxy, timeout=timeout, url=ipv4_url))
+    if probe.exit_ip is None:
+        probe.error = "exit IPv4 lookup failed"
+        return probe
+    if ipv6:
+        probe.exit_ipv6 = fetch_ipv6(proxy, timeout=timeout, url=ipv6_url)
+    if risk:
+        probe.risk = fetch_ip_risk(probe.exit_ip, proxy=proxy, timeout=timeout)
+    return probe
+
+
+def probe_exits(ports: Dict[str, int], max_threads: Optional[int] = None, **probe_options) -> Dict[str, ExitProbe]:
+    """并发探测所有端口，并发数默认取 config.json 的 max_threads。probe_options 传给 probe_exit。"""
+    if not ports:
+        return {}
+    workers = max(1, min(max_threads or get_controller_config()["max_threads"], len(ports)))
+    logger.info(f"Probing exit IPs of {len(ports)} proxies through local ports with {workers} threads")
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {name: ex.submit(probe_exit, name, port, **probe_options) for name, port in ports.items()}
+    results = {name: future.result() for name, future in futures.items()}
+    found = sum(1 for r in results.values() if r.exit_ip)
+    logger.info(f"Exit IP probing finished in {time.monotonic() - started:.1f}s: {found}/{len(ports)} resolved")
+    return results
+
+
+def write_listener_config(proxies_list: list, config_path: str, port_start: Optional[int] = None,
+                          host: Optional[str] = None) -> Dict[str, int]:
+    """
+    分配端口并写出监听配置，返回 {代理名: 端口}。
+    host 给出时只分配该地址上空闲的端口（随后立即启动 mihomo 时使用）。
+    """
+    ports = assign_ports(proxies_list, port_start, host)
+    save_yaml_config(build_listener_config(proxies_list, ports), config_path)
+    logger.info(f"Wrote listener config for {len(ports)} proxies to {config_path}")
+    return ports
@@ -0,0 +1,72 @@
+"""
+文件写入工具
+提供原子写入，避免进程中断时留下半截文件
+"""
+import json
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Any, Iterator
+
+# os.umask 只能通过设置来读取且作用于整个进程，导入时读取一次，避免在多线程写入时来回修改
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write_text(path: str, text: str, encoding: str = "utf-8") -> None:
+    """先写入同目录临时文件再 os.replace，保证读者只会看到完整的旧文件或新文件。"""
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """二进制内容的原子写入，做法同 atomic_write_text。"""
+    with atomic_writer(path, binary=True) as f:
+        f.write(data)
+
+
+def _target_mode(path: str) -> int:
+    """替换后文件应有的权限：沿用已有文件的权限，新文件为 0644 去掉 umask。"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o644 & ~_UMASK
+
+
+@contextmanager
+def atomic_writer(path: str, binary: bool = False, encoding: str = "utf-8") -> Iterator[IO]:
+    """
+    以流式方式原子写入：在 with 块内向临时文件写入，正常结束后 fsync 并替换目标文件，
+    异常时删除临时文件，目标文件保持不变。
+    mkstemp 创建的临时文件权限为 0600，替换前改为目标文件的权限，避免 web 服务器等其他用户无法读取。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with (os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding=encoding, newline="")) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    """以 JSON 格式原子写入。"""
+    atomic_write_text(path, json.dumps(data, indent=2, ensure_ascii=False, sort_keys=True))
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """读取 JSON 文件，文件不存在或损坏时返回 default。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
@@ -0,0 +1,148 @@
+"""
+轻量HTML字段提取
+用编译好的正则逐个扫描标签：只维护元素栈（标签、class、同名兄弟序号），
+遇到目标元素时收集其文本，全部目标取到后立即停止解析，不构建DOM，也不依赖 lxml。
+
+路径使用 XPath 的一个小子集，足以覆盖风险页面解析用到的表达式：
+  /html/body/div[2]/span            绝对路径，[n] 为同名兄弟中的序号（从1开始）
+  //div[@class="a b"]//span         // 为任意层级，[@class="..."] 要求 class 属性完全相等
+"""
+import re
+from html import unescape
+from typing import Dict, List, Optional, Tuple
+
+# 没有结束标签的元素，不入栈
+VOID_ELEMENTS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr",
+))
+
+# 内容按纯文本处理的元素
+RAW_TEXT_ELEMENTS = frozenset(("script", "style"))
+_RAW_TEXT_END = {tag: re.compile(rf"</{tag}\s*>", re.I) for tag in RAW_TEXT_ELEMENTS}
+
+# 注释/doctype 或 开始/结束标签；属性值中的 ">" 不会截断标签
+_TOKEN_RE = re.compile(r'<!--.*?-->|<![^>]*>|<(/?)([A-Za-z][A-Za-z0-9-]*)([^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*)>', re.S)
+_CLASS_RE = re.compile(r'\bclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+_TAG_IN_TEXT_RE = re.compile(r'<!--.*?-->|<[^>]*>', re.S)
+
+_STEP_RE = re.compile(r'(//?)([A-Za-z][A-Za-z0-9]*)(?:\[@class="([^"]*)"\]|\[(\d+)\])?')
+
+# (轴 "/" 或 "//", 标签, class 或 None, 序号 或 None)
+Step = Tuple[str, str, Optional[str], Optional[int]]
+
+
+def compile_path(path: str) -> Tuple[Step, ...]:
+    """把路径表达式解析为步骤序列；不支持的语法抛出 ValueError。"""
+    steps = []
+    pos = 0
+    while pos < len(path):
+        m = _STEP_RE.match(path, pos)
+        if not m:
+            raise ValueError(f"Unsupported path expression at {pos}: {path!r}")
+        axis, tag, cls, index = m.groups()
+        steps.append((axis, tag.lower(), cls, int(index) if index else None))
+        pos = m.end()
+    if not steps:
+        raise ValueError("Empty path expression")
+    return tuple(steps)
+
+
+def _node_matches(step: Step, node: Tuple[str, Optional[str], int]) -> bool:
+    _, tag, cls, index = step
+    return node[0] == tag and (cls is None or node[1] == cls) and (index is None or node[2] == index)
+
+
+def _text_content(fragment: str) -> str:
+    """元素内部HTML片段的文本：去掉标签、解码字符引用、去除首尾空白。"""
+    return unescape(_TAG_IN_TEXT_RE.sub("", fragment)).strip()
+
+
+def _path_matches(steps: Tuple[Step, ...], stack: List[Tuple[str, Optional[str], int]]) -> bool:
+    """从栈顶（当前元素）向根匹配：最后一步必须匹配当前元素。"""
+
+    def match(si: int, ni: int) -> bool:
+        # steps[si] 已对齐到 stack[ni]
+        if not _node_matches(steps[si], stack[ni]):
+            return False
+        axis = steps[si][0]
+        if si == 0:
+            return axis == "//" or ni == 0
+        if axis == "/":
+            return ni > 0 and match(si - 1, ni - 1)
+        return any(match(si - 1, j) for j in range(ni - 1, -1, -1))
+
+    return bool(stack) and match(len(steps) - 1, len(stack) - 1)
+
+
+def extract_fields(html_content: str, paths: Dict[str, Tuple[Step, ...]]) -> Dict[str, Optional[str]]:
+    """
+    按路径提取每个字段第一个匹配元素的文本（含子元素文本，去除首尾空白），未找到为 None。
+    paths 的值为 compile_path 的结果，应在模块级预先编译。
+    """
+    results: Dict[str, Optional[str]] = {key: None for key in paths}
+    pending = dict(paths)
+    # 只有这些标签可能是目标元素，只有这些标签的 class 参与匹配
+    target_tags = {steps[-1][1] for steps in paths.values()}
+    class_tags = {step[1] for steps in paths.values() for step in steps if step[2] is not None}
+    # 元素栈：(标签, class, 同名兄弟序号)；与之平行的子元素计数栈
+    stack: List[Tuple[str, Optional[str], int]] = []
+    child_counts: List[Dict[str, int]] = [{}]
+    # 正在收集文本的字段：(字段名, 栈深度, 文本起始位置)
+    captures: List[Tuple[str, int, int]] = []
+
+    def leave(end: int) -> bool:
+        """弹出栈顶元素；返回 True 表示全部字段已取到。"""
+        depth = len(stack)
+        while captures and captures[-1][1] == depth:
+            key, _, begin = captures.pop()
+            results[key] = _text_content(html_content[begin:end])
+        stack.pop()
+        child_counts.pop()
+        return not pending and not captures
+
+    pos = 0
+    while True:
+        m = _TOKEN_RE.search(html_content, pos)
+        if m is None:
+            break
+        pos = m.end()
+        closing, tag, attrs = m.groups()
+        if tag is None:
+            continue  # 注释、doctype
+        tag = tag.lower()
+
+        if closing:
+            # 容错：关闭到最近的同名元素，中间未闭合的元素一并关闭；孤立的结束标签忽略
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == tag:
+                    while len(stack) > i:
+                        if leave(m.start()):
+                            return results
+                    break
+            continue
+
+        counts = child_counts[-1]
+        counts[tag] = index = counts.get(tag, 0) + 1
+        cls_match = _CLASS_RE.search(attrs) if attrs and tag in class_tags else None
+        stack.append((tag, cls_match.group(cls_match.lastindex) if cls_match else None, index))
+        child_counts.append({})
+        if tag in target_tags:
+            for key, steps in list(pending.items()):
+                if steps[-1][1] == tag and _path_matches(steps, stack):
+                    # 文档顺序中第一个匹配的元素为结果
+                    del pending[key]
+                    captures.append((key, len(stack), pos))
+
+        if tag in RAW_TEXT_ELEMENTS:
+            # script/style 的内容不是标记，直接跳到结束标签
+            end = _RAW_TEXT_END[tag].search(html_content, pos)
+            pos = end.start() if end else len(html_content)
+        elif tag in VOID_ELEMENTS or attrs.endswith("/"):
+            if leave(pos):
+                return results
+
+    while stack:
+        if leave(len(html_content)):
+            break
+    return results
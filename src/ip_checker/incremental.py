@@ -0,0 +1,170 @@
+"""
+增量生成 Clash 配置
+每次生成时把标注后的代理（模型）保存在 <output>.model.json，下次生成前与之比较：
+得出新增/移除/重新分类/内容变化的代理，没有任何变化时完全跳过写入，避免下游无意义的重建与提交
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from .clash import DEFAULT_GROUP_BY, base_config, build_config_from_proxies, save_config
+from .config import get_clash_config
+from .fileutil import atomic_write_json, read_json
+from .latency import apply_latencies
+from .models import ProxyRecord
+from .providers import provider_group_by, save_provider_output
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+# 决定代理所在分组的字段，变化视为“重新分类”
+CLASSIFYING_FIELDS = ("purity", "countryCode")
+# 日志中每类最多列出的代理名
+LOG_NAMES_LIMIT = 10
+
+
+def model_path_for(output_path: str) -> str:
+    """产物对应的模型文件路径，例如 clash.yml -> clash.yml.model.json"""
+    return f"{output_path}.model.json"
+
+
+def build_model(proxies_list: list) -> Dict[str, Dict]:
+    """{代理名: 标注后的代理dict}，同名代理保留首个。"""
+    model: Dict[str, Dict] = {}
+    for p in proxies_list:
+        proxy = p.to_dict() if isinstance(p, ProxyRecord) else p
+        name = proxy.get("name")
+        if name and name not in model:
+            model[name] = proxy
+    return model
+
+
+class ConfigDiff:
+    """两次生成之间代理集合的差异"""
+
+    def __init__(self, added: List[str], removed: List[str], reclassified: Dict[str, Dict],
+                 updated: List[str], settings_changed: bool = False):
+        self.added = added
+        self.removed = removed
+        # {代理名: {字段: [旧值, 新值]}}
+        self.reclassified = reclassified
+        # 分组不变、其它字段（server/port/isp 等）变化的代理
+        self.updated = updated
+        self.settings_changed = settings_changed
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.reclassified or self.updated or self.settings_changed)
+
+    def summary(self) -> str:
+        text = (f"{len(self.added)} added, {len(self.removed)} removed, "
+                f"{len(self.reclassified)} reclassified, {len(self.updated)} updated")
+        return text + (" (generation settings changed)" if self.settings_changed else "")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "added": self.added,
+            "removed": self.removed,
+            "reclassified": self.reclassified,
+            "updated": self.updated,
+            "settings_changed": self.settings_changed,
+        }
+
+    def log(self) -> None:
+        logger.info(f"Config diff: {self.summary()}")
+        for label, names in (("added", self.added), ("removed", self.removed),
+                             ("reclassified", list(self.reclassified)), ("updated", self.updated)):
+            if names:
+                more = f" ... (+{len(names) - LOG_NAMES_LIMIT})" if len(names) > LOG_NAMES_LIMIT else ""
+                logger.info(f"  {label}: {', '.join(names[:LOG_NAMES_LIMIT])}{more}")
+
+
+def diff_models(old: Dict[str, Dict], new: Dict[str, Dict], settings_changed: bool = False) -> ConfigDiff:
+    """比较两个模型。代理顺序不参与比较：生成的配置在语义上只取决于代理内容与分组。"""
+    added = [name for name in new if name not in old]
+    removed = [name for name in old if name not in new]
+    reclassified: Dict[str, Dict] = {}
+    updated: List[str] = []
+    for name, proxy in new.items():
+        previous = old.get(name)
+        if previous is None or previous == proxy:
+            continue
+        changes = {field: [previous.get(field), proxy.get(field)]
+                   for field in CLASSIFYING_FIELDS if previous.get(field) != proxy.get(field)}
+        if changes:
+            reclassified[name] = changes
+        else:
+            updated.append(name)
+    return ConfigDiff(added, removed, reclassified, updated, settings_changed)
+
+
+def generate_incremental(proxies_list: list, output_path: str, write: Callable[[list], Any],
+                         settings: Optional[Dict] = None, force: bool = False) -> ConfigDiff:
+    """
+    与上次生成的模型比较后再调用 write(proxies_list) 生成产物。
+
+    模型与 settings（分组维度、输出模式、基础配置哈希等影响产物的参数）都未变化且产物仍存在时跳过写入；
+    否则写出产物并更新模型。force=True 时总是写出。返回本次的差异。
+    """
+    model_path = model_path_for(output_path)
+    model = build_model(proxies_list)
+    settings = settings or {}
+    previous = read_json(model_path, default=None)
+    if not isinstance(previous, dict) or previous.get("version") != MODEL_VERSION:
+        previous = {"settings": settings, "proxies": {}}
+        if os.path.exists(model_path):
+            logger.warning(f"Ignoring unreadable model file {model_path}; regenerating {output_path}")
+
+    diff = diff_models(previous.get("proxies", {}), model, previous.get("settings") != settings)
+    diff.log()
+    if diff.is_empty and not force and os.path.exists(output_path):
+        logger.info(f"No changes since the last generation; leaving {output_path} untouched")
+        return diff
+
+    write(proxies_list)
+    # 产物写出成功后才更新模型，写入失败时下次仍会与旧模型比较
+    atomic_write_json(model_path, {"version": MODEL_VERSION, "settings": settings, "proxies": model})
+    return diff
+
+
+def save_clash_incremental(proxies_list: list, output_yaml: str, providers_dir: Optional[str] = None,
+                           providers_url: Optional[str] = None, force: bool = False,
+                           diff_report: Optional[str] = None,
+                           latencies: Optional[Dict[str, float]] = None) -> ConfigDiff:
+    """
+    dedup_purity_to_yaml.py / merge_shards.py 共用的输出步骤：普通 Clash YAML 或 proxy-provider 输出，
+    仅在代理或生成参数变化时写出。diff_report 给出时把差异写为 JSON，供工作流判断是否需要提交。
+    latencies（{代理名: 中位延迟}，见 latency.load_latencies）在建模前写入代理的 latency 字段，
+    因此延迟是模型的一部分：延迟变化会更新产物，下次生成也不会丢失。
+    """
+    if latencies:
+        proxies_list = [p.to_dict() if isinstance(p, ProxyRecord) else dict(p) for p in proxies_list]
+        count = apply_latencies(proxies_list, latencies)
+        logger.info(f"Annotated {count}/{len(proxies_list)} proxies with their measured latency")
+    # provider 模式只记录实际生效的分组维度，修改被忽略的维度不会触发重写
+    if providers_dir:
+        group_by = provider_group_by()
+    else:
+        group_by = list(get_clash_config().get("group_by", DEFAULT_GROUP_BY))
+    settings = {
+        "group_by": group_by,
+        "providers_dir": providers_dir,
+        "providers_url": providers_url,
+        # DNS / 规则 / 控制器等不依赖代理的部分
+        "base_config": hashlib.sha256(json.dumps(base_config(), sort_keys=True).encode("utf-8")).hexdigest(),
+    }
+
+    def write(proxies: list) -> None:
+        if providers_dir:
+            save_provider_output(proxies, output_yaml, providers_dir, providers_url, group_by)
+            logger.info(f"Saved Clash YAML referencing proxy providers in {providers_dir} to: {output_yaml}")
+        else:
+            save_config(build_config_from_proxies(proxies, group_by), output_yaml)
+            logger.info(f"Saved deduplicated & annotated Clash YAML to: {output_yaml}")
+
+    diff = generate_incremental(proxies_list, output_yaml, write, settings=settings, force=force)
+    if diff_report:
+        atomic_write_json(diff_report, dict(diff.to_dict(), output=output_yaml, changed=not diff.is_empty))
+    return diff
@@ -5,7 +5,10 @@ import os
 from typing import Dict, Optional, Any
 
 import requests
-from lxml import html
+
+from .config import get_endpoint
+from .htmlscan import compile_path, extract_fields
+from .metrics import get_metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -60,9 +63,12 @@ def _fetch_ip_info_legacy(ip: str, proxy: Optional[Dict] = None, timeout: int =
     """使用ip-api.com获取IP信息（原始实现）"""
     try:
         logger.debug(f'Fetching IP details from ip-api.com for: {ip}')
-        response = requests.get(f"http://ip-api.com/json/{ip}", proxies=proxy, timeout=timeout)
-        response.raise_for_status()
-        data = response.json()
+        with get_metrics().track_request('ip_api') as call:
+            response = requests.get(f"{get_endpoint('ip_api')}/json/{ip}", proxies=proxy, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            if data.get('status', 'success') != 'success':
+                call.outcome = 'fail'
 
         # 确保返回的数据包含status字段
         if 'status' not in data:
@@ -146,52 +152,42 @@ def is_pure_ip(ip_info: Optional[Dict]) -> bool:
 # --- IP Risk Analysis ---
 
 def fetch_ip_risk(ip: str, proxy: Optional[Dict] = None, timeout: int = 5) -> Optional[Dict]:
-    """Fetches risk score from scamalytics.com."""
+    """Fetches risk score from scamalytics.com (pooled session, rate limited, cached; see risk_providers)."""
     logger.info(f'Fetching IP risk for: {ip}')
-    try:
-        response = requests.get(f"https://scamalytics.com/ip/{ip}", proxies=proxy, timeout=timeout)
-        response.raise_for_status()
-        return _parse_scamalytics_risk(response.text)
-    except requests.RequestException as error:
-        logger.error(f'Error fetching IP risk for {ip}: {error}')
-        return None
+    from .risk_providers import get_risk_provider
+    return get_risk_provider("scamalytics").fetch(ip, proxy=proxy, timeout=timeout)
 
-def _parse_scamalytics_risk(html_content: str) -> Optional[Dict[str, str]]:
-    """Parses the HTML response from scamalytics.com."""
-    score_match = re.search(r'"score":"(.*?)"|', html_content)
-    risk_match = re.search(r'"risk":"(.*?)"|', html_content)
+# scamalytics 页面内嵌的 JSON 片段，如 "score":"42"、"risk":"medium"
+_SCAMALYTICS_SCORE_RE = re.compile(r'"score"\s*:\s*"?(\d+)"?')
+_SCAMALYTICS_RISK_RE = re.compile(r'"risk"\s*:\s*"([^"]*)"')
+# JSON 片段缺失时退回页面上显示的文字
+_SCAMALYTICS_SCORE_TEXT_RE = re.compile(r'Fraud Score:\s*(\d+)')
+_SCAMALYTICS_RISK_TEXT_RE = re.compile(r'>\s*(Very High|High|Medium|Low) Risk\s*<')
 
+def _parse_scamalytics_risk(html_content: str) -> Optional[Dict[str, str]]:
+    """Parses the HTML response from scamalytics.com; returns None if neither field is present."""
+    score_match = _SCAMALYTICS_SCORE_RE.search(html_content) or _SCAMALYTICS_SCORE_TEXT_RE.search(html_content)
+    risk_match = _SCAMALYTICS_RISK_RE.search(html_content)
     if risk_match:
-        risk_data = {
+        risk = risk_match.group(1)
+    else:
+        text_match = _SCAMALYTICS_RISK_TEXT_RE.search(html_content)
+        risk = text_match.group(1).lower() if text_match else None
+
+    if score_match or risk:
+        return {
             'score': score_match.group(1) if score_match else None,
-            'risk': risk_match.group(1)
+            'risk': risk
         }
-        return risk_data
     return None
 
 # --- IP Type and other info from Ping0.cc ---
 
 def fetch_ping0_risk(ip: str, proxy: Optional[Dict] = None, timeout: int = 5) -> Optional[Dict]:
-    """Fetches additional risk and type info from ping0.cc."""
+    """Fetches additional risk and type info from ping0.cc (reuses the jskey cookie; see risk_providers)."""
     logger.info(f'Fetching Ping0 risk for: {ip}')
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.116 Safari/537.36"
-    }
-    try:
-        initial_response = requests.get(f'https://ping0.cc/ip/{ip}', headers=headers, proxies=proxy, timeout=timeout)
-        initial_response.raise_for_status()
-        window_x = _parse_window_x(initial_response.text)
-        if window_x:
-            cookies = {"jskey": window_x}
-            final_response = requests.get(f'https://ping0.cc/ip/{ip}', headers=headers, cookies=cookies, proxies=proxy, timeout=timeout)
-            final_response.raise_for_status()
-            return _parse_ping0_risk(final_response.text)
-        else:
-            logger.warning(f'Failed to retrieve window.x value for {ip}.')
-            return None
-    except requests.RequestException as e:
-        logger.error(f'Error fetching Ping0 risk for {ip}: {e}')
-        return None
+    from .risk_providers import get_risk_provider
+    return get_risk_provider("ping0").fetch(ip, proxy=proxy, timeout=timeout)
 
 def _parse_window_x(html_content: str) -> Optional[str]:
     """Parses the window.x value from ping0.cc HTML to get the jskey cookie."""
@@ -206,19 +202,15 @@ def _parse_window_x(html_content: str) -> Optional[str]:
         hash_value += hex_value + 8
     return str(hash_value)
 
+_PING0_PATHS = {
+    "ping0Risk": compile_path('//div[@class="line line-risk"]//div[@class="riskitem riskcurrent"]/span[@class="value"]'),
+    "ipType": compile_path('/html/body/div[2]/div[2]/div[1]/div[2]/div[8]/div[2]/span'),
+    "nativeIP": compile_path('/html/body/div[2]/div[2]/div[1]/div[2]/div[10]/div[2]/span'),
+}
+
 def _parse_ping0_risk(html_content: str) -> Dict[str, Any]:
-    """Parses the final HTML from ping0.cc."""
-    tree = html.fromstring(html_content)
-    xpath = {
-        "ping0Risk": '//div[@class="line line-risk"]//div[@class="riskitem riskcurrent"]/span[@class="value"]',
-        "ipType": '/html/body/div[2]/div[2]/div[1]/div[2]/div[8]/div[2]/span',
-        "nativeIP": '/html/body/div[2]/div[2]/div[1]/div[2]/div[10]/div[2]/span'
-    }
-    ping0_data = {}
-    for key, path in xpath.items():
-        elements = tree.xpath(path)
-        ping0_data[key] = elements[0].text_content().strip() if elements else None
-    return ping0_data
+    """Parses the final HTML from ping0.cc (streaming scan, stops once all fields are found)."""
+    return extract_fields(html_content, _PING0_PATHS)
 
 # --- Utility Functions ---
 
@@ -229,19 +221,23 @@ def is_valid_ipv6(ip: str) -> bool:
     except ipaddress.AddressValueError:
         return False
 
-def fetch_ipv4(proxy: dict, timeout: int = 5) -> Optional[str]:
+# 返回 {"ip": "..."} 的出口IP回显服务
+IPV4_ECHO_URL = 'https://api.ipify.org?format=json'
+IPV6_ECHO_URL = 'https://api64.ipify.org?format=json'
+
+def fetch_ipv4(proxy: dict, timeout: int = 5, url: str = IPV4_ECHO_URL) -> Optional[str]:
     try:
-        response = requests.get('https://api.ipify.org?format=json', proxies=proxy, timeout=timeout)
+        response = requests.get(url, proxies=proxy, timeout=timeout)
         return response.json().get('ip')
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"Failed to fetch IPv4: {e}")
         return None
 
-def fetch_ipv6(proxy: dict, timeout: int = 5) -> Optional[str]:
+def fetch_ipv6(proxy: dict, timeout: int = 5, url: str = IPV6_ECHO_URL) -> Optional[str]:
     try:
-        response = requests.get('https://api64.ipify.org?format=json', proxies=proxy, timeout=timeout)
+        response = requests.get(url, proxies=proxy, timeout=timeout)
         ipv6 = response.json().get('ip')
         return ipv6 if is_valid_ipv6(ipv6) else None
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.warning(f"Failed to fetch IPv6: {e}")
         return None
@@ -6,24 +6,51 @@ IPinfo.io服务提供者
 
 import logging
 import os
+import re
+import threading
 import time
 from typing import Dict, Optional, List
 import requests
 
+from .config import get_api_provider_settings, get_endpoint
+from .metrics import get_metrics, outcome_for_status
+from .quota import get_quota_ledger
+
 logger = logging.getLogger(__name__)
 
+# 429 分两种：短时限速（带 Retry-After，退避后重试）与配额用尽（响应说明达到日/月限额）
+RATE_LIMIT_RETRIES = 2
+RATE_LIMIT_BACKOFF = 2.0
+MAX_RETRY_AFTER = 60.0
+_QUOTA_ERROR_RE = re.compile(r"quota|daily limit|monthly limit|limit for the|req/month", re.IGNORECASE)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Retry-After 头（秒数形式），没有或无法解析时返回None"""
+    try:
+        return max(0.0, float(response.headers.get('Retry-After', '')))
+    except ValueError:
+        return None
+
+
+def _is_quota_error(response: requests.Response) -> bool:
+    """429 是否表示配额用尽：没有 Retry-After，且响应正文提到日/月限额或配额"""
+    return _retry_after(response) is None and bool(_QUOTA_ERROR_RE.search(response.text or ''))
+
+
 class IPInfoProvider:
     """IPinfo.io API服务提供者"""
 
-    def __init__(self, api_token: Optional[str] = None):
+    def __init__(self, api_token: Optional[str] = None, base_url: Optional[str] = None):
         """
         初始化IPinfo提供者
 
         Args:
             api_token: API token，如果为None则从环境变量或文件读取
+            base_url: API地址，如果为None则取 config.get_endpoint("ipinfo")
         """
         self.api_token = api_token or self._get_api_token()
-        self.base_url = "https://ipinfo.io"
+        self.base_url = (base_url or get_endpoint("ipinfo")).rstrip("/")
         self.session = requests.Session()
 
         # 配置连接池
@@ -53,8 +80,14 @@ class IPInfoProvider:
             self.min_interval = 1.5   # 无token时每分钟45次，约1.3s间隔
             self.requests_per_minute = 45
 
-        # 请求计数器（用于更精确的速率控制）
+        # 请求计数器（用于更精确的速率控制）；全局实例在线程间共享，
+        # _rate_lock 保护整个 检查配额-等待-记录 过程
         self.request_times = []
+        self._rate_lock = threading.Lock()
+
+        # 跨运行持久化的配额账本，月限额取自config.json的api.providers.ipinfo
+        self.ledger = get_quota_ledger()
+        self.monthly_limit = get_api_provider_settings('ipinfo').get('monthly_limit')
 
         logger.info(f"IPinfo provider initialized with token: {self.api_token[:8] if self.api_token else 'None'}... "
                    f"Rate limit: {self.requests_per_minute}/min")
@@ -81,8 +114,24 @@ class IPInfoProvider:
         logger.warning("No IPinfo token found, will use free tier")
         return None
     
-    def _rate_limit(self):
-        """实施改进的速率限制"""
+    def _rate_limit(self) -> bool:
+        """
+        实施速率限制并占用一次配额。整个过程持有实例锁，并发的工作线程依次取得发送时机；
+        配额已用尽时返回 False（不等待、不记录）。
+        """
+        with self._rate_lock:
+            if self.remaining_quota() == 0:
+                return False
+            self._wait_for_slot()
+            if not self.ledger.reserve('ipinfo', self.api_token, monthly_limit=self.monthly_limit):
+                return False
+            current_time = time.time()
+            self.request_times.append(current_time)
+            self.last_request_time = current_time
+            return True
+
+    def _wait_for_slot(self) -> None:
+        """等待到每分钟请求数与最小间隔都允许发送，调用方需持有 _rate_lock"""
         current_time = time.time()
 
         # 清理超过1分钟的请求记录
@@ -93,6 +142,7 @@ class IPInfoProvider:
             sleep_time = 60 - (current_time - self.request_times[0]) + 0.1
             if sleep_time > 0:
                 logger.debug(f"Rate limit reached, sleeping for {sleep_time:.1f}s")
+                get_metrics().record_rate_limit_sleep('ipinfo', sleep_time)
                 time.sleep(sleep_time)
                 current_time = time.time()
                 # 重新清理请求记录
@@ -102,12 +152,12 @@ class IPInfoProvider:
         time_since_last = current_time - self.last_request_time
         if time_since_last < self.min_interval:
             sleep_time = self.min_interval - time_since_last
+            get_metrics().record_rate_limit_sleep('ipinfo', sleep_time)
             time.sleep(sleep_time)
-            current_time = time.time()
 
-        # 记录请求时间
-        self.request_times.append(current_time)
-        self.last_request_time = current_time
+    def remaining_quota(self) -> Optional[int]:
+        """根据持久化账本计算本月剩余请求数，未配置月限额时返回None"""
+        return self.ledger.remaining('ipinfo', self.api_token, monthly_limit=self.monthly_limit)
     
     def fetch_ip_info(self, ip: str, timeout: int = 10) -> Optional[Dict]:
         """
@@ -120,30 +170,54 @@ class IPInfoProvider:
         Returns:
             与ip-api.com兼容的字典格式，如果失败返回None
         """
-        self._rate_limit()
-        
-        try:
-            logger.info(f'Fetching IP details from IPinfo for: {ip}')
-            
-            url = f"{self.base_url}/{ip}/json"
-            response = self.session.get(url, timeout=timeout)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return self._normalize_response(data)
-            elif response.status_code == 401:
-                logger.error("IPinfo API: Invalid token (401)")
-                return None
-            elif response.status_code == 429:
-                logger.warning("IPinfo API: Rate limit exceeded (429)")
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            if not self._rate_limit():
+                logger.debug(f"IPinfo quota exhausted, skipping {ip}")
                 return None
-            else:
-                logger.error(f"IPinfo API error: HTTP {response.status_code}")
+
+            try:
+                logger.info(f'Fetching IP details from IPinfo for: {ip}')
+
+                url = f"{self.base_url}/{ip}/json"
+                with get_metrics().track_request('ipinfo') as call:
+                    response = self.session.get(url, timeout=timeout)
+                    call.outcome = outcome_for_status(response.status_code)
+                    if response.status_code == 200:
+                        data = response.json()
+                        if 'ip' not in data:
+                            call.outcome = 'fail'
+
+                if response.status_code == 200:
+                    return self._normalize_response(data)
+                elif response.status_code == 401:
+                    logger.error("IPinfo API: Invalid token (401)")
+                    return None
+                elif response.status_code == 429:
+                    if _is_quota_error(response):
+                        # 只有明确的配额用尽才停用当日的 IPinfo 请求
+                        logger.warning(f"IPinfo API: quota exhausted (429): {response.text[:200]}")
+                        self.ledger.mark_exhausted('ipinfo', self.api_token)
+                        return None
+                    if attempt == RATE_LIMIT_RETRIES:
+                        logger.warning(f"IPinfo API: still rate limited (429) for {ip} "
+                                       f"after {RATE_LIMIT_RETRIES + 1} attempts")
+                        return None
+                    delay = _retry_after(response)
+                    if delay is None:
+                        delay = RATE_LIMIT_BACKOFF * (2 ** attempt)
+                    delay = min(delay, MAX_RETRY_AFTER)
+                    logger.warning(f"IPinfo API: Rate limit exceeded (429), retrying {ip} in {delay:.1f}s")
+                    get_metrics().record_retry('ipinfo', 'rate_limited', delay)
+                    time.sleep(delay)
+                    continue
+                else:
+                    logger.error(f"IPinfo API error: HTTP {response.status_code}")
+                    return None
+
+            except requests.exceptions.RequestException as e:
+                logger.error(f'Error fetching IP details from IPinfo for {ip}: {e}')
                 return None
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f'Error fetching IP details from IPinfo for {ip}: {e}')
-            return None
+        return None
     
     def _normalize_response(self, data: Dict) -> Dict:
         """
@@ -0,0 +1,187 @@
+"""
+代理延迟测试
+通过 Clash/mihomo 控制器的 /proxies/{name}/delay 接口并发测试大量代理：
+连接池复用同一个 Session，并发数取自 config.json 的 max_threads，每个代理重复采样后取中位数与P90，
+结果可用于代理排序，或写回代理的 latency 字段供 clash.py 的 latency 分组使用
+"""
+import json
+import logging
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+import requests
+
+from .clash import API_TIMEOUT, fetch_proxies, get_api_headers
+from .config import get_controller_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEST_URL = "https://www.gstatic.com/generate_204"
+DEFAULT_TIMEOUT_MS = 5000
+DEFAULT_SAMPLES = 3
+
+
+def _percentile(values: List[int], pct: float) -> Optional[float]:
+    """最近秩法百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return float(ordered[rank - 1])
+
+
+class DelayStats:
+    """一个代理的多次延迟采样，None 表示该次超时或失败"""
+
+    __slots__ = ("name", "samples", "error")
+
+    def __init__(self, name: str, samples: List[Optional[int]], error: Optional[str] = None):
+        self.name = name
+        self.samples = samples
+        self.error = error
+
+    @property
+    def ok_samples(self) -> List[int]:
+        return [s for s in self.samples if s is not None]
+
+    @property
+    def median(self) -> Optional[float]:
+        ok = self.ok_samples
+        return float(statistics.median(ok)) if ok else None
+
+    @property
+    def p90(self) -> Optional[float]:
+        return _percentile(self.ok_samples, 90)
+
+    @property
+    def loss(self) -> float:
+        """失败采样的比例"""
+        if not self.samples:
+            return 1.0
+        return 1 - len(self.ok_samples) / len(self.samples)
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.ok_samples)
+
+    def sort_key(self):
+        # 可用的在前；丢包率低、中位数低、P90低的在前
+        return (not self.alive, self.loss, self.median or float("inf"), self.p90 or float("inf"), self.name)
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "samples": self.samples, "median": self.median, "p90": self.p90,
+                "loss": round(self.loss, 3), "error": self.error}
+
+
+class DelayTester:
+    """
+    并发调用控制器的单代理延迟接口。
+
+    controller/secret/max_threads 默认取自 config.json；timeout_ms 是交给控制器的测速超时，
+    HTTP 请求本身的超时在此基础上再加 API_TIMEOUT 秒，避免控制器无响应时线程被长期占用。
+    """
+
+    def __init__(self, controller: Optional[str] = None, secret: Optional[str] = None,
+                 max_threads: Optional[int] = None, timeout_ms: int = DEFAULT_TIMEOUT_MS,
+                 test_url: str = DEFAULT_TEST_URL, session: Optional[requests.Session] = None):
+        settings = get_controller_config()
+        self.controller = (controller or settings["external_controller"]).rstrip("/")
+        self.max_threads = max(1, max_threads or settings["max_threads"])
+        self.timeout_ms = timeout_ms
+        self.test_url = test_url
+
+        self.session = session or requests.Session()
+        if session is None:
+            # 连接池大小与并发数一致，所有线程复用到控制器的 keep-alive 连接
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_threads,
+                                                    max_retries=0)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        self.secret = settings["secret"] if secret is None else secret
+        self.session.headers.update(get_api_headers(self.secret))
+
+    def list_proxies(self) -> List[str]:
+        """控制器中的全部实际代理（不含分组与内置出站）。"""
+        return fetch_proxies(session=self.session, controller=self.controller, secret=self.secret)
+
+    def measure_once(self, name: str) -> Optional[int]:
+        """单次测速，返回毫秒；超时、代理不可用或请求失败返回 None。"""
+        url = f"{self.controller}/proxies/{quote(name, safe='')}/delay"
+        params = {"url": self.test_url, "timeout": self.timeout_ms}
+        response = self.session.get(url, params=params, timeout=API_TIMEOUT + self.timeout_ms / 1000)
+        if response.status_code in (503, 504, 408):
+            # 控制器以 503/504 表示代理不可用或测速超时
+            return None
+        response.raise_for_status()
+        delay = response.json().get("delay")
+        return int(delay) if delay is not None else None
+
+    def measure(self, name: str, samples: int = DEFAULT_SAMPLES, interval: float = 0.0) -> DelayStats:
+        """对一个代理顺序采样 samples 次（同一代理的采样不并发，避免相互干扰）。"""
+        results: List[Optional[int]] = []
+        error = None
+        for i in range(samples):
+            if i and interval:
+                time.sleep(interval)
+            try:
+                results.append(self.measure_once(name))
+            except (requests.RequestException, ValueError) as e:
+                results.append(None)
+                error = str(e)
+        return DelayStats(name, results, error)
+
+    def measure_all(self, names: Optional[Iterable[str]] = None, samples: int = DEFAULT_SAMPLES) -> Dict[str, DelayStats]:
+        """并发测试多个代理（默认为控制器中的全部代理），并发数为 max_threads。"""
+        names = list(dict.fromkeys(names if names is not None else self.list_proxies()))
+        if not names:
+            return {}
+        logger.info(f"Delay testing {len(names)} proxies x {samples} samples with {self.max_threads} threads "
+                    f"(timeout {self.timeout_ms}ms)")
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.max_threads, len(names))) as ex:
+            results = dict(zip(names, ex.map(lambda n: self.measure(n, samples), names)))
+        alive = sum(1 for s in results.values() if s.alive)
+        logger.info(f"Delay test finished in {time.monotonic() - started:.1f}s: {alive}/{len(names)} proxies alive")
+        return results
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "DelayTester":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def rank_proxies(stats: Dict[str, DelayStats], include_dead: bool = False) -> List[DelayStats]:
+    """按可用性、丢包率、中位数、P90 排序。"""
+    ranked = sorted(stats.values(), key=DelayStats.sort_key)
+    return ranked if include_dead else [s for s in ranked if s.alive]
+
+
+def load_latencies(path: str) -> Dict[str, float]:
+    """读取 measure_latency.py --output 的结果：{代理名: 中位延迟}，不可用的代理不在其中"""
+    with open(path, "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    return {row["name"]: row["median"] for row in rows if row.get("median") is not None}
+
+
+def apply_latencies(proxies_list: List[Dict], latencies: Dict[str, float]) -> int:
+    """把 {代理名: 中位延迟} 写入代理的 latency 字段，返回标注的数量。"""
+    annotated = 0
+    for proxy in proxies_list:
+        median = latencies.get(proxy.get("name"))
+        if median is not None:
+            proxy["latency"] = int(median)
+            annotated += 1
+    return annotated
+
+
+def annotate_latency(proxies_list: List[Dict], stats: Dict[str, DelayStats]) -> int:
+    """把中位延迟写入代理的 latency 字段（不可用的代理不写），返回标注的数量。"""
+    return apply_latencies(proxies_list, {name: s.median for name, s in stats.items() if s.alive})
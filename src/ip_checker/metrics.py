@@ -0,0 +1,354 @@
+"""
+运行指标
+进程内统一收集：各阶段耗时与条目数、各提供者的请求延迟直方图与结果（成功/失败/429/超时）、
+缓存命中、限速等待时长、重试次数。运行结束时导出 JSON 汇总，字段与 config.json 的
+monitoring.metrics（response_time / success_rate / cache_hit_rate / api_usage）对应，
+也可导出 Prometheus 文本格式（供 node_exporter textfile collector 或 Pushgateway 使用）
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from .config import config
+from .fileutil import atomic_write_json, atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+# 请求延迟直方图的桶上界（秒），覆盖本地模拟服务到慢速网页查询
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_PREFIX = "ip_checker_"
+_HELP = {
+    "provider_request_seconds": ("histogram", "Latency of requests to external providers"),
+    "provider_requests_total": ("counter", "Requests to external providers by outcome"),
+    "rate_limit_sleep_seconds_total": ("counter", "Time spent waiting in client-side rate limiters, summed over threads"),
+    "cache_lookups_total": ("counter", "Cache lookups by result"),
+    "retries_total": ("counter", "Retried operations by reason"),
+    "retry_backoff_seconds_total": ("counter", "Time spent sleeping before retries"),
+    "stage_seconds": ("gauge", "Wall time of the last run of a pipeline stage"),
+    "stage_items": ("gauge", "Items entering and leaving a pipeline stage"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**labels: str) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def outcome_for_status(status_code: int) -> str:
+    """HTTP 状态码对应的请求结果"""
+    if status_code == 429:
+        return "rate_limited"
+    return "success" if status_code < 400 else "error"
+
+
+def outcome_for_exception(exc: BaseException) -> str:
+    """请求异常对应的请求结果；raise_for_status 抛出的 429 计为 rate_limited"""
+    if isinstance(exc, requests.exceptions.Timeout):
+        return "timeout"
+    response = getattr(exc, "response", None)
+    if response is not None and getattr(response, "status_code", None) is not None:
+        return outcome_for_status(response.status_code)
+    return "error"
+
+
+class Histogram:
+    """固定桶的直方图，额外记录总和与最大值"""
+
+    __slots__ = ("bounds", "counts", "total", "count", "max")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶内线性插值估算分位数；落在 +Inf 桶时返回最大值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = min(self.bounds[i], self.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / n
+            seen += n
+        return self.max
+
+    def as_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else None,
+            "p50_ms": round(self.quantile(0.50) * 1e3, 3),
+            "p95_ms": round(self.quantile(0.95) * 1e3, 3),
+            "p99_ms": round(self.quantile(0.99) * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+        }
+
+
+class RequestTimer:
+    """
+    track_request 产出的对象；在 with 块内可把 outcome 改为实际结果：
+    success 为拿到可用数据，fail 为服务正常应答但没有数据，denied 为配额用尽，
+    另有 rate_limited（429）、timeout、error
+    """
+
+    __slots__ = ("provider", "outcome")
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.outcome = "success"
+
+
+class MetricsRegistry:
+    """线程安全的计数器/直方图集合，外加按顺序记录的阶段统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.stages: List[Dict] = []
+        self.started = time.time()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.stages.clear()
+            self.started = time.time()
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = _labels(**labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = _labels(**labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    # --- 各模块使用的记录接口 ---
+
+    def record_request(self, provider: str, seconds: float, outcome: str = "success") -> None:
+        self.observe("provider_request_seconds", seconds, provider=provider)
+        self.inc("provider_requests_total", provider=provider, outcome=outcome)
+
+    @contextmanager
+    def track_request(self, provider: str) -> Iterator[RequestTimer]:
+        """计时一次外部请求；块内抛出的请求异常按 outcome_for_exception 分类后继续抛出"""
+        timer = RequestTimer(provider)
+        start = time.perf_counter()
+        try:
+            yield timer
+        except Exception as e:
+            timer.outcome = outcome_for_exception(e)
+            raise
+        finally:
+            self.record_request(provider, time.perf_counter() - start, timer.outcome)
+
+    def record_rate_limit_sleep(self, provider: str, seconds: float) -> None:
+        if seconds > 0:
+            self.inc("rate_limit_sleep_seconds_total", seconds, provider=provider)
+
+    def record_cache(self, cache: str, hits: int = 0, misses: int = 0) -> None:
+        if hits:
+            self.inc("cache_lookups_total", hits, cache=cache, result="hit")
+        if misses:
+            self.inc("cache_lookups_total", misses, cache=cache, result="miss")
+
+    def record_retry(self, operation: str, reason: str = "error", backoff: float = 0.0) -> None:
+        self.inc("retries_total", operation=operation, reason=reason)
+        if backoff > 0:
+            self.inc("retry_backoff_seconds_total", backoff, operation=operation)
+
+    def record_stage(self, pipeline: str, stats) -> None:
+        """由 PipelineReport.record 调用，stats 为 StageStats"""
+        entry = {"pipeline": pipeline, **stats.as_dict()}
+        entry["throughput"] = round(stats.items_in / stats.elapsed, 1) if stats.elapsed > 0 else None
+        with self._lock:
+            self.stages.append(entry)
+
+    # --- 导出 ---
+
+    def _counter_by(self, name: str, key: str) -> Dict[str, Dict[str, float]]:
+        """把计数器按某个标签分组：{标签值: {其余标签值: 计数}}"""
+        grouped: Dict[str, Dict[str, float]] = {}
+        for labels, value in self.counters.get(name, {}).items():
+            label_map = dict(labels)
+            rest = ",".join(v for k, v in labels if k != key) or "total"
+            bucket = grouped.setdefault(label_map.get(key, ""), {})
+            bucket[rest] = bucket.get(rest, 0.0) + value
+        return grouped
+
+    def summary(self) -> Dict:
+        """JSON 运行汇总"""
+        with self._lock:
+            now = time.time()
+            response_time = {dict(labels).get("provider", ""): h.as_dict()
+                             for labels, h in self.histograms.get("provider_request_seconds", {}).items()}
+            outcomes = self._counter_by("provider_requests_total", "provider")
+            sleeps = self._counter_by("rate_limit_sleep_seconds_total", "provider")
+            caches = self._counter_by("cache_lookups_total", "cache")
+            retries = self._counter_by("retries_total", "operation")
+            backoffs = self._counter_by("retry_backoff_seconds_total", "operation")
+            stages = list(self.stages)
+
+        api_usage = {}
+        success_rate = {}
+        for provider in sorted(set(outcomes) | set(sleeps)):
+            counts = {k: int(v) for k, v in sorted(outcomes.get(provider, {}).items())}
+            total = sum(counts.values())
+            api_usage[provider] = {
+                "requests": total,
+                "outcomes": counts,
+                "http_429": counts.get("rate_limited", 0),
+                "rate_limit_sleep_seconds": round(sleeps.get(provider, {}).get("total", 0.0), 3),
+            }
+            if total:
+                success_rate[provider] = round(counts.get("success", 0) / total, 4)
+
+        cache_hit_rate = {}
+        for cache, counts in sorted(caches.items()):
+            hits, misses = int(counts.get("hit", 0)), int(counts.get("miss", 0))
+            cache_hit_rate[cache] = {"hits": hits, "misses": misses,
+                                     "rate": round(hits / (hits + misses), 4) if hits + misses else None}
+
+        return {
+            "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "finished_at": datetime.fromtimestamp(now, timezone.utc).isoformat(timespec="seconds"),
+            "wall_seconds": round(now - self.started, 3),
+            "stages": stages,
+            "response_time": dict(sorted(response_time.items())),
+            "success_rate": success_rate,
+            "cache_hit_rate": cache_hit_rate,
+            "api_usage": api_usage,
+            "retries": {
+                operation: {"count": int(sum(counts.values())),
+                            "by_reason": {k: int(v) for k, v in sorted(counts.items())},
+                            "backoff_seconds": round(backoffs.get(operation, {}).get("total", 0.0), 3)}
+                for operation, counts in sorted(retries.items())
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式（exposition format 0.0.4）"""
+        lines: List[str] = []
+
+        def header(name: str) -> None:
+            kind, text = _HELP[name]
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}{name} {text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+
+        def series(name: str, labels: Labels, value: float, suffix: str = "") -> None:
+            label_text = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{PROMETHEUS_PREFIX}{name}{suffix}{label_text} {_format_value(value)}")
+
+        with self._lock:
+            for name, by_labels in sorted(self.histograms.items()):
+                header(name)
+                for labels, histogram in sorted(by_labels.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _format_value(bound)
+                        series(name, labels + (("le", le),), cumulative, "_bucket")
+                    series(name, labels, histogram.total, "_sum")
+                    series(name, labels, histogram.count, "_count")
+            for name, by_labels in sorted(self.counters.items()):
+                header(name)
+                for labels, value in sorted(by_labels.items()):
+                    series(name, labels, value)
+            if self.stages:
+                # 同一阶段多次出现（如多次运行）时取最后一次
+                latest = {(s["pipeline"], s["name"]): s for s in self.stages}
+                header("stage_seconds")
+                for (pipeline, stage), s in latest.items():
+                    series("stage_seconds", _labels(pipeline=pipeline, stage=stage), s["elapsed_seconds"])
+                header("stage_items")
+                for (pipeline, stage), s in latest.items():
+                    for direction in ("in", "out"):
+                        series("stage_items", _labels(pipeline=pipeline, stage=stage, direction=direction),
+                               s[f"items_{direction}"])
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """进程内共享的指标集合"""
+    return _registry
+
+
+def metrics_path_for(output_path: str) -> str:
+    """运行汇总的默认位置：与输出文件同名，扩展名换成 .metrics.json"""
+    base, _ = os.path.splitext(output_path)
+    return f"{base}.metrics.json"
+
+
+def export_run_metrics(default_path: Optional[str] = None, json_path: Optional[str] = None,
+                       prometheus_path: Optional[str] = None) -> Dict:
+    """
+    写出本次运行的指标并返回 JSON 汇总。
+    json_path 未给出时写到 default_path（config.json 的 monitoring.enabled 为 false 时不写）；
+    prometheus_path 给出时另写一份 Prometheus 文本格式。
+    """
+    registry = get_metrics()
+    summary = registry.summary()
+    if json_path is None and config.get("monitoring", {}).get("enabled", True):
+        json_path = default_path
+    if json_path:
+        atomic_write_json(json_path, summary)
+        logger.info(f"Run metrics saved to {json_path}")
+    if prometheus_path:
+        atomic_write_text(prometheus_path, registry.to_prometheus())
+        logger.info(f"Prometheus metrics saved to {prometheus_path}")
+    for provider, usage in summary["api_usage"].items():
+        timing = summary["response_time"].get(provider, {})
+        logger.info(f"  {provider:<12} requests={usage['requests']:<6} "
+                    f"success={summary['success_rate'].get(provider, 0):.1%} 429={usage['http_429']:<4} "
+                    f"p50={timing.get('p50_ms', 0):.0f}ms p95={timing.get('p95_ms', 0):.0f}ms "
+                    f"throttled={usage['rate_limit_sleep_seconds']:.1f}s")
+    for cache, counts in summary["cache_hit_rate"].items():
+        if counts["rate"] is not None:
+            logger.info(f"  cache {cache:<16} hit rate {counts['rate']:.1%} "
+                        f"({counts['hits']}/{counts['hits'] + counts['misses']})")
+    return summary
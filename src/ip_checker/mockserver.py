@@ -0,0 +1,294 @@
+"""
+本地模拟查询服务
+一个 asyncio HTTP/1.1 服务在同一端口上模拟 proxycheck.io / ipinfo.io / ip-api.com / dns.google：
+  /proxycheck/v2/<ip>    /ipinfo/<ip>/json    /ip-api/json/<ip>    /dns/resolve?name=<host>
+返回内容由IP或主机名确定性地生成；每个服务可单独设置延迟、抖动、错误率、每秒限速（超出返回429）
+和总配额（用尽后按各服务的真实行为拒绝），用于离线压测并发、限速与回退逻辑。
+把 config.get_endpoint 指向它即可：IP_CHECKER_PROXYCHECK_URL=http://127.0.0.1:18080/proxycheck/v2 等，
+见 endpoints()；/_stats 返回各服务的请求计数
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+SERVICES = ("proxycheck", "ipinfo", "ip_api", "doh")
+# 各服务在模拟服务上的路径前缀，与 config.DEFAULT_ENDPOINTS 的路径部分对应
+ENDPOINT_PATHS = {
+    "proxycheck": "/proxycheck/v2",
+    "ipinfo": "/ipinfo",
+    "ip_api": "/ip-api",
+    "doh": "/dns/resolve",
+}
+
+COUNTRIES = ("US", "JP", "SG", "DE", "HK", "GB")
+ORGS = ("AS4713 NTT Communications", "AS16509 Amazon.com, Inc.", "AS13335 Cloudflare, Inc.",
+        "AS9304 HGC Global Communications", "AS3320 Deutsche Telekom AG")
+PROXY_TYPES = ("Business", "Residential", "Wireless", "Hosting", "VPN")
+# DoH 应答使用 RFC 2544 基准测试地址段
+DOH_NETWORK = ipaddress.ip_network("198.18.0.0/15")
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _digest(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def fake_proxycheck(ip: str) -> Dict:
+    h = _digest(ip)
+    proxy_type = PROXY_TYPES[h % len(PROXY_TYPES)]
+    asn, _, isp = ORGS[h % len(ORGS)].partition(" ")
+    return {"status": "ok", ip: {
+        "asn": asn, "provider": isp, "isp": isp, "country": COUNTRIES[h % len(COUNTRIES)],
+        "city": "Mock City", "region": "Mock", "proxy": "yes" if proxy_type == "VPN" else "no",
+        "type": proxy_type, "risk": h % 100,
+    }}
+
+
+def fake_ipinfo(ip: str) -> Dict:
+    h = _digest(ip)
+    return {"ip": ip, "city": "Mock City", "region": "Mock", "country": COUNTRIES[h % len(COUNTRIES)],
+            "loc": "35.0,139.0", "org": ORGS[h % len(ORGS)], "timezone": "UTC",
+            "privacy": {"vpn": h % 5 == 4, "proxy": False, "tor": False, "hosting": h % 5 == 3}}
+
+
+def fake_ip_api(ip: str) -> Dict:
+    h = _digest(ip)
+    org = ORGS[h % len(ORGS)]
+    return {"status": "success", "query": ip, "country": COUNTRIES[h % len(COUNTRIES)],
+            "countryCode": COUNTRIES[h % len(COUNTRIES)], "isp": org.partition(" ")[2],
+            "org": org.partition(" ")[2], "as": org, "hosting": h % 5 == 3, "proxy": h % 5 == 4}
+
+
+def fake_doh(name: str) -> Dict:
+    ip = DOH_NETWORK.network_address + _digest(name) % DOH_NETWORK.num_addresses
+    return {"Status": 0, "Answer": [{"name": f"{name}.", "type": 1, "TTL": 300, "data": str(ip)}]}
+
+
+class ServiceBehavior:
+    """一个模拟服务的行为参数"""
+
+    __slots__ = ("latency", "jitter", "error_rate", "rate_limit", "quota")
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: Optional[float] = None, quota: Optional[int] = None):
+        self.latency = latency        # 每个响应的基础延迟（秒）
+        self.jitter = jitter          # 延迟在 ±jitter 内均匀抖动
+        self.error_rate = error_rate  # 返回 500/503 的比例
+        self.rate_limit = rate_limit  # 每秒允许的请求数，超出返回 429（None 不限速）
+        self.quota = quota            # 总请求配额，用尽后 proxycheck 返回 denied、其它服务返回 429
+
+    def copy(self, **overrides) -> "ServiceBehavior":
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(overrides)
+        return ServiceBehavior(**values)
+
+
+class _ServiceState:
+    """单个服务的限速窗口与计数"""
+
+    def __init__(self):
+        self.window_start = 0.0
+        self.window_count = 0
+        self.served = 0
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "denied": 0}
+
+
+class MockProviderServer:
+    """
+    模拟查询服务。可在已有事件循环中 await start()/stop()，
+    也可作为上下文管理器在后台线程中运行：
+      with MockProviderServer(behaviors={"proxycheck": ServiceBehavior(rate_limit=2)}) as server:
+          provider = ProxyCheckProvider(base_url=server.endpoints()["proxycheck"])
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, default: Optional[ServiceBehavior] = None,
+                 behaviors: Optional[Dict[str, ServiceBehavior]] = None, seed: Optional[int] = None):
+        unknown = set(behaviors or {}) - set(SERVICES)
+        if unknown:
+            raise ValueError(f"Unknown mock service(s): {', '.join(sorted(unknown))}")
+        self.host = host
+        self.port = port
+        default = default or ServiceBehavior()
+        self.behaviors = {name: (behaviors or {}).get(name) or default.copy() for name in SERVICES}
+        self.states = {name: _ServiceState() for name in SERVICES}
+        self.rng = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # --- 路由与行为 ---
+
+    def _route(self, path: str, query: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """返回 (服务名, 正常响应体)；未知路径返回 (None, None)。"""
+        parts = [p for p in path.split("/") if p]
+        if parts[:2] == ["proxycheck", "v2"] and len(parts) == 3:
+            return "proxycheck", fake_proxycheck(parts[2])
+        if parts[:1] == ["ipinfo"] and len(parts) == 3 and parts[2] == "json":
+            return "ipinfo", fake_ipinfo(parts[1])
+        if parts[:2] == ["ip-api", "json"] and len(parts) == 3:
+            return "ip_api", fake_ip_api(parts[2])
+        if parts == ["dns", "resolve"]:
+            name = parse_qs(query).get("name", [""])[0]
+            return "doh", fake_doh(name) if name else None
+        return None, None
+
+    def _decide(self, service: str) -> Tuple[int, Optional[Dict], Dict[str, str]]:
+        """按配额、限速、错误率决定本次请求的结果：(状态码, 替换的响应体, 额外响应头)。"""
+        behavior = self.behaviors[service]
+        state = self.states[service]
+        state.stats["requests"] += 1
+        if behavior.quota is not None and state.served >= behavior.quota:
+            state.stats["denied"] += 1
+            if service == "proxycheck":
+                # 与真实服务一致：HTTP 200 + status=denied
+                return 200, {"status": "denied", "message": "Daily query limit reached (mock)."}, {}
+            return 429, {"error": "quota exceeded (mock)"}, {}
+        if behavior.rate_limit:
+            now = time.monotonic()
+            if now - state.window_start >= 1.0:
+                state.window_start, state.window_count = now, 0
+            if state.window_count >= behavior.rate_limit:
+                state.stats["throttled"] += 1
+                retry_after = max(1, int(state.window_start + 1.0 - now + 0.999))
+                return 429, {"error": "rate limited (mock)"}, {"Retry-After": str(retry_after)}
+            state.window_count += 1
+        state.served += 1
+        if behavior.error_rate and self.rng.random() < behavior.error_rate:
+            state.stats["errors"] += 1
+            return self.rng.choice((500, 503)), {"error": "injected failure (mock)"}, {}
+        state.stats["ok"] += 1
+        return 200, None, {}
+
+    def _delay(self, service: str) -> float:
+        behavior = self.behaviors[service]
+        if not behavior.jitter:
+            return behavior.latency
+        return max(0.0, behavior.latency + self.rng.uniform(-behavior.jitter, behavior.jitter))
+
+    # --- HTTP ---
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: Dict,
+                       headers: Optional[Dict[str, str]] = None, keep_alive: bool = True) -> None:
+        data = json.dumps(body).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, _ = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request line"}, keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                if headers.get("content-length"):
+                    await reader.readexactly(int(headers["content-length"]))
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                url = urlsplit(target)
+                if method == "GET" and url.path == "/_stats":
+                    await self._respond(writer, 200, self.stats(), keep_alive=keep_alive)
+                else:
+                    service, body = self._route(url.path, url.query)
+                    if service is None or body is None:
+                        await self._respond(writer, 404, {"error": "not found"}, keep_alive=keep_alive)
+                    else:
+                        status, override, extra = self._decide(service)
+                        delay = self._delay(service)
+                        if delay:
+                            await asyncio.sleep(delay)
+                        await self._respond(writer, status, override or body, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    # --- 生命周期 ---
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Mock provider server listening on http://{self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """停止接受连接，并结束仍保持着的 keep-alive 连接。"""
+        if self._server:
+            self._server.close()
+            handlers = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def __enter__(self) -> "MockProviderServer":
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="mock-provider-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    # --- 信息 ---
+
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def endpoints(self) -> Dict[str, str]:
+        """{服务名: 地址}，可直接作为 config.json api.endpoints 或 IP_CHECKER_<NAME>_URL 的值。"""
+        return {name: self.base_url() + path for name, path in ENDPOINT_PATHS.items()}
+
+    def env(self) -> Dict[str, str]:
+        """把 config.get_endpoint 指向本服务的环境变量。"""
+        return {f"IP_CHECKER_{name.upper()}_URL": url for name, url in self.endpoints().items()}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(state.stats) for name, state in self.states.items()}
@@ -0,0 +1,143 @@
+"""
+流水线中使用的紧凑数据模型
+代理和纯净度判定以 __slots__ 对象在各阶段之间传递，只有在输出 YAML/JSON 时才转换为 dict；
+国家、ASN 等高度重复的字符串做 intern，十万级代理时可显著降低内存占用与GC压力
+"""
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+from .ip_utils import is_pure_ip
+
+# 代理的核心字段，其余 Clash 字段按原顺序保存在 extra 中
+CORE_PROXY_FIELDS = ("name", "type", "server", "port")
+
+
+def _intern(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return sys.intern(str(value))
+
+
+class PurityVerdict:
+    """一个IP的纯净度判定及其归属信息，对应代理项上的 purity/country/... 标注"""
+
+    __slots__ = ("purity", "country", "country_code", "city", "isp", "org", "asn")
+
+    def __init__(self, purity: str, country: Optional[str] = None, country_code: Optional[str] = None,
+                 city: Optional[str] = None, isp: Optional[str] = None, org: Optional[str] = None,
+                 asn: Optional[str] = None):
+        self.purity = sys.intern(purity)
+        self.country = _intern(country)
+        self.country_code = _intern(country_code)
+        self.city = _intern(city)
+        self.isp = _intern(isp)
+        self.org = _intern(org)
+        self.asn = _intern(asn)
+
+    @property
+    def is_pure(self) -> bool:
+        return self.purity == "pure"
+
+    @classmethod
+    def from_info(cls, info: Optional[Dict]) -> "PurityVerdict":
+        """由 fetch_ip_info 的结果生成判定；查询失败（None/空）时判为 non-pure。"""
+        info = info or {}
+        return cls(
+            "pure" if is_pure_ip(info) else "non-pure",
+            country=info.get("country"),
+            country_code=info.get("countryCode"),
+            city=info.get("city"),
+            isp=info.get("isp"),
+            org=info.get("org"),
+            asn=info.get("as"),
+        )
+
+    @classmethod
+    def from_annotations(cls, data: Dict) -> "PurityVerdict":
+        """由 to_annotations() 的输出（如检查点日志中的记录）还原。"""
+        return cls(
+            data.get("purity") or "non-pure",
+            country=data.get("country"),
+            country_code=data.get("countryCode"),
+            city=data.get("city"),
+            isp=data.get("isp"),
+            org=data.get("org"),
+            asn=data.get("as"),
+        )
+
+    def to_annotations(self) -> Dict[str, Optional[str]]:
+        """附加到代理项上的标注字段，键名与历史输出保持一致。"""
+        return {
+            "purity": self.purity,
+            "country": self.country,
+            "countryCode": self.country_code,
+            "city": self.city,
+            "isp": self.isp,
+            "org": self.org,
+            "as": self.asn,
+        }
+
+    def __repr__(self) -> str:
+        return f"PurityVerdict({self.purity!r}, country_code={self.country_code!r}, asn={self.asn!r})"
+
+
+class ProxyRecord:
+    """
+    一个代理节点。name/type/server/port 为独立属性，其余协议相关字段（cipher、uuid、tls…）
+    以 (key, value) 元组保存；解析出的 ip 与判定结果在后续阶段填入。
+    经 CDN/中转的代理还可能测得出口IP（exit_ip）及其判定（exit_verdict），输出时以出口判定为准。
+    """
+
+    __slots__ = ("name", "type", "server", "port", "extra", "ip", "verdict", "exit_ip", "exit_verdict")
+
+    def __init__(self, name: str, type: Optional[str], server: Optional[str], port: Any = None,
+                 extra: Tuple[Tuple[str, Any], ...] = (), ip: Optional[str] = None,
+                 verdict: Optional[PurityVerdict] = None):
+        self.name = name
+        self.type = _intern(type)
+        self.server = server
+        self.port = port
+        self.extra = extra
+        self.ip = ip
+        self.verdict = verdict
+        self.exit_ip: Optional[str] = None
+        self.exit_verdict: Optional[PurityVerdict] = None
+
+    @property
+    def effective_verdict(self) -> Optional[PurityVerdict]:
+        """分组与输出使用的判定：测得出口时为出口判定，否则为入口判定。"""
+        return self.exit_verdict if self.exit_verdict is not None else self.verdict
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> Optional["ProxyRecord"]:
+        """由 Clash 代理字典构造；没有 name 的条目返回 None。"""
+        name = data.get("name")
+        if not name:
+            return None
+        extra = tuple((k, v) for k, v in data.items() if k not in CORE_PROXY_FIELDS)
+        server = data.get("server")
+        return cls(str(name), data.get("type"), str(server) if server is not None else None,
+                   data.get("port"), extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为输出用的 Clash 代理字典（含 ip 与纯净度标注）。
+        有出口判定时 purity/country/... 描述出口IP，并附加 exit_ip 与入口的 entry_purity。
+        """
+        data: Dict[str, Any] = {"name": self.name, "type": self.type, "server": self.server}
+        if self.port is not None:
+            data["port"] = self.port
+        data.update(self.extra)
+        if self.ip is not None:
+            data["ip"] = self.ip
+        if self.exit_ip is not None:
+            data["exit_ip"] = self.exit_ip
+        verdict = self.effective_verdict
+        if verdict is not None:
+            data.update(verdict.to_annotations())
+        if self.exit_verdict is not None and self.verdict is not None:
+            data["entry_purity"] = self.verdict.purity
+        return data
+
+    def __repr__(self) -> str:
+        return f"ProxyRecord({self.name!r}, {self.type!r}, {self.server!r}, {self.port!r}, ip={self.ip!r})"
@@ -0,0 +1,89 @@
+"""
+流水线阶段统计
+每个阶段记录输入/输出条目数、被去掉的条目数和耗时，运行结束时汇总输出；
+阶段同时登记到 metrics 的运行指标中，启用 profiling 时每个阶段分别剖析
+"""
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+
+from .metrics import get_metrics
+from .profiling import get_profiler
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    """单个阶段的统计信息"""
+
+    def __init__(self, name: str, items_in: int = 0):
+        self.name = name
+        self.items_in = items_in
+        self.items_out = 0
+        self._removed: Optional[int] = None
+        self.elapsed = 0.0
+        # 阶段内的附加计数，如缓存命中数、跳过数
+        self.notes: Dict[str, int] = {}
+
+    @property
+    def removed(self) -> int:
+        """被该阶段去掉的条目数；未显式设置时为输入与输出之差。"""
+        if self._removed is not None:
+            return self._removed
+        return max(0, self.items_in - self.items_out)
+
+    @removed.setter
+    def removed(self, value: int) -> None:
+        self._removed = value
+
+    def as_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "removed": self.removed,
+            "elapsed_seconds": round(self.elapsed, 3),
+            **self.notes,
+        }
+
+
+class PipelineReport:
+    """按顺序记录流水线各阶段"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: List[StageStats] = []
+
+    @contextmanager
+    def stage(self, name: str, items_in: int = 0) -> Iterator[StageStats]:
+        """计时一个阶段；在 with 块内填写 items_in/items_out/removed/notes。"""
+        stats = StageStats(name, items_in)
+        profiler = get_profiler()
+        with profiler.profile(self.name, name) if profiler else nullcontext():
+            start = time.perf_counter()
+            try:
+                yield stats
+            finally:
+                stats.elapsed = time.perf_counter() - start
+                self.record(stats)
+
+    def record(self, stats: StageStats) -> None:
+        """登记一个手动计时的阶段（例如与其他阶段交错执行的阶段）。"""
+        self.stages.append(stats)
+        get_metrics().record_stage(self.name, stats)
+        notes = "".join(f", {k}={v}" for k, v in stats.notes.items())
+        logger.info(
+            f"[{self.name}] stage '{stats.name}': {stats.items_in} in -> {stats.items_out} out "
+            f"(removed {stats.removed}{notes}) in {stats.elapsed:.2f}s"
+        )
+
+    def as_dict(self) -> Dict:
+        return {"pipeline": self.name, "stages": [s.as_dict() for s in self.stages]}
+
+    def log_summary(self) -> None:
+        total = sum(s.elapsed for s in self.stages)
+        logger.info(f"[{self.name}] {len(self.stages)} stages finished in {total:.2f}s")
+        for s in self.stages:
+            logger.info(f"  {s.name:<12} in={s.items_in:<8} out={s.items_out:<8} "
+                        f"removed={s.removed:<8} {s.elapsed:8.2f}s")
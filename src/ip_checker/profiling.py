@@ -0,0 +1,287 @@
+"""
+按阶段的可选性能剖析
+通过环境变量 IP_CHECKER_PROFILE 或脚本的 --profile 开启，PipelineReport 的每个阶段分别剖析：
+  cpu     cProfile，写 <序号>-<流水线>.<阶段>.prof（可用 snakeviz / pstats 打开）与按累计/自身耗时排序的 .txt
+  memory  tracemalloc，记录阶段内的峰值内存与新增内存最多的代码行
+  sample  后台线程定时采样所有线程的调用栈，写折叠栈 .folded（flamegraph.pl / speedscope 可直接读取），
+          能看到线程池里等待网络的时间，cProfile 只统计CPU调用
+IP_CHECKER_PROFILE=1 / all 等价于 cpu,memory；结果与汇总 summary.json 写入 <输出文件>.profile/ 目录
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+from .fileutil import atomic_write_json, atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "IP_CHECKER_PROFILE"
+MODES = ("cpu", "memory", "sample")
+DEFAULT_MODES = ("cpu", "memory")
+# .txt 报告中列出的函数数与内存报告中列出的代码行数
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 15
+SAMPLE_INTERVAL = 0.005
+# tracemalloc 保存的栈深度，1 即按分配所在行统计
+TRACEMALLOC_FRAMES = 1
+
+# 3.12 起 cProfile 基于 sys.monitoring，一个 Profile 对所有线程生效且同时只能有一个；
+# 之前的版本只剖析调用 enable() 的线程，阶段内新建的线程需各自启用一个 Profile
+_PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+def parse_modes(value: Optional[str]) -> Set[str]:
+    """把 "cpu,memory"、"all"、"1" 之类的取值解析为模式集合；空值或 0/false/no 表示关闭"""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return set()
+    if value in ("1", "true", "yes", "on", "all"):
+        return set(DEFAULT_MODES)
+    modes = {m.strip() for m in value.split(",") if m.strip()}
+    unknown = modes - set(MODES)
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s): {', '.join(sorted(unknown))}; expected {', '.join(MODES)}")
+    return modes
+
+
+def profile_dir_for(output_path: str) -> str:
+    """剖析结果的默认目录：与输出文件同名，扩展名换成 .profile"""
+    base, _ = os.path.splitext(output_path)
+    return f"{base}.profile"
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text)
+
+
+class _ThreadedProfile:
+    """一个阶段的 cProfile，3.12 之前为阶段内新启动的线程各建一个 Profile，结束时合并"""
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _bootstrap(self, frame, event, arg):
+        # threading.setprofile 的钩子在新线程的第一次调用时触发，换成该线程自己的 Profile
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self) -> None:
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        if _PER_THREAD_PROFILES:
+            threading.setprofile(self._bootstrap)
+        profile.enable()
+
+    def stop(self) -> pstats.Stats:
+        self.profiles[0].disable()
+        if _PER_THREAD_PROFILES:
+            threading.setprofile(None)
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except (TypeError, ValueError):
+                # 线程还没有产生任何调用记录
+                continue
+        return stats
+
+
+class _StackSampler:
+    """后台线程按固定间隔采样所有线程的调用栈，统计折叠栈出现次数"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class StageProfiler:
+    """
+    一次运行的分阶段剖析器，PipelineReport.stage 在阶段内调用 profile()。
+    各阶段的结果写入 output_dir，summary() 汇总每个阶段的耗时、峰值内存与输出文件。
+    """
+
+    def __init__(self, output_dir: str, modes: Optional[Set[str]] = None,
+                 sample_interval: float = SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.modes = set(modes or DEFAULT_MODES)
+        self.sample_interval = sample_interval
+        self.stages: List[Dict] = []
+        self._lock = threading.Lock()
+        self._active = False
+        self._started_tracemalloc = False
+        os.makedirs(output_dir, exist_ok=True)
+
+    @contextmanager
+    def profile(self, pipeline: str, stage: str) -> Iterator[None]:
+        """剖析一个阶段；嵌套或与其他阶段并行的阶段只计时，不重复剖析"""
+        with self._lock:
+            nested, self._active = self._active, True
+        if nested:
+            yield
+            return
+
+        prefix = f"{len(self.stages) + 1:02d}-{_safe_name(pipeline)}.{_safe_name(stage)}"
+        entry: Dict = {"pipeline": pipeline, "stage": stage}
+        cpu = _ThreadedProfile() if "cpu" in self.modes else None
+        sampler = _StackSampler(self.sample_interval) if "sample" in self.modes else None
+        before = None
+        if "memory" in self.modes:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            entry["memory_at_start_bytes"] = tracemalloc.get_traced_memory()[0]
+
+        if sampler:
+            sampler.start()
+        if cpu:
+            cpu.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+            # 先读峰值，避免计入下面写剖析文件时的分配
+            traced = tracemalloc.get_traced_memory() if before is not None else None
+            if cpu:
+                entry["cpu_profile"] = self._write_cpu(prefix, cpu.stop())
+            if sampler:
+                sampler.stop()
+                entry["stack_samples"] = sampler.samples
+                entry["folded_stacks"] = self._write_text(f"{prefix}.folded", sampler.folded())
+            if before is not None:
+                entry.update(self._memory_report(before, entry["memory_at_start_bytes"], *traced))
+            with self._lock:
+                self.stages.append(entry)
+                self._active = False
+            peak = entry.get("peak_bytes")
+            logger.info(f"Profiled stage '{stage}' in {entry['elapsed_seconds']:.2f}s"
+                        + (f", peak traced memory {peak / 2**20:.1f} MiB" if peak is not None else ""))
+
+    def _write_text(self, name: str, text: str) -> str:
+        atomic_write_text(os.path.join(self.output_dir, name), text)
+        return name
+
+    def _write_cpu(self, prefix: str, stats: pstats.Stats) -> str:
+        """写 .prof 与按累计/自身耗时排序的文本报告，返回 .prof 文件名"""
+        stats.dump_stats(os.path.join(self.output_dir, f"{prefix}.prof"))
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+        self._write_text(f"{prefix}.txt", out.getvalue())
+        return f"{prefix}.prof"
+
+    def _memory_report(self, before: tracemalloc.Snapshot, start_bytes: int, current: int, peak: int) -> Dict:
+        after = tracemalloc.take_snapshot()
+        # 去掉剖析器自身（cProfile 的调用记录、tracemalloc 快照）的分配
+        filters = [tracemalloc.Filter(False, path)
+                   for path in (tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        return {
+            "peak_bytes": peak,
+            "peak_above_start_bytes": peak - start_bytes,
+            "retained_bytes": current - start_bytes,
+            "top_allocations": [
+                {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in diff[:TOP_ALLOCATIONS]
+            ],
+        }
+
+    def summary(self) -> Dict:
+        with self._lock:
+            stages = list(self.stages)
+        return {"modes": sorted(self.modes), "python": sys.version.split()[0], "stages": stages}
+
+    def close(self) -> str:
+        """写出 summary.json 并停止本剖析器启动的 tracemalloc，返回汇总文件路径"""
+        path = os.path.join(self.output_dir, "summary.json")
+        atomic_write_json(path, self.summary())
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        logger.info(f"Profiles of {len(self.stages)} stages saved to {self.output_dir}")
+        return path
+
+
+_profiler: Optional[StageProfiler] = None
+
+
+def get_profiler() -> Optional[StageProfiler]:
+    """当前启用的剖析器，未启用时为 None"""
+    return _profiler
+
+
+def enable_profiling(output_dir: str, modes: Optional[Set[str]] = None) -> StageProfiler:
+    """启用分阶段剖析，此后 PipelineReport 的阶段都会被剖析"""
+    global _profiler
+    if _profiler is not None:
+        _profiler.close()
+    _profiler = StageProfiler(output_dir, modes)
+    logger.info(f"Profiling enabled ({', '.join(sorted(_profiler.modes))}), writing to {output_dir}")
+    return _profiler
+
+
+def disable_profiling() -> Optional[str]:
+    """关闭剖析并写出汇总，返回 summary.json 的路径（未启用时返回 None）"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler.close() if profiler else None
+
+
+def setup_profiling(output_path: str, cli_value: Optional[str] = None) -> Optional[StageProfiler]:
+    """
+    脚本入口使用：--profile 的取值优先，其次是环境变量 IP_CHECKER_PROFILE；
+    开启时结果写到 output_path 旁的 .profile 目录。
+    """
+    modes = parse_modes(cli_value if cli_value is not None else os.getenv(PROFILE_ENV))
+    if not modes:
+        return None
+    return enable_profiling(profile_dir_for(output_path), modes)
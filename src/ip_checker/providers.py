@@ -0,0 +1,181 @@
+"""
+Clash proxy-provider 输出模式
+按 (纯净度, 国家) 把代理拆分到多个 provider 文件，主配置只通过 proxy-providers / use 引用它们。
+每个文件的 SHA-256 记录在 manifest.json 中，内容未变化的文件不会重写，客户端只需重新拉取变化的部分。
+provider 只按纯净度与国家划分，分组维度（clash.group_by）中只有 country / purity 能用 use 表达，其余维度被忽略
+"""
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+from .clash import DEFAULT_GROUP_BY, GROUP_DIMENSIONS, base_config
+from .config import get_clash_config
+from .fileutil import atomic_write_json, atomic_write_text, read_json
+from .models import ProxyRecord
+from .yaml_io import dump_yaml
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+HEALTH_CHECK = {"enable": True, "url": "http://www.gstatic.com/generate_204", "interval": 300}
+# 以 HTTP 方式提供 provider 文件时客户端的刷新间隔（秒）
+HTTP_PROVIDER_INTERVAL = 3600
+
+# provider 输出模式支持的分组维度
+PROVIDER_GROUP_DIMENSIONS = ("country", "purity")
+
+_PURITY_LABELS = {"pure": "pure", "non-pure": "non-pure"}
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def provider_name_for(proxy: Dict) -> str:
+    """代理所属的 provider，例如 pure-US / non-pure-JP / unknown-UNKNOWN。"""
+    purity = _PURITY_LABELS.get(proxy.get("purity"), "unknown")
+    country = _UNSAFE_CHARS_RE.sub("", str(proxy.get("countryCode") or "Unknown").upper()) or "UNKNOWN"
+    return f"{purity}-{country}"
+
+
+def partition_proxies(proxies_list: list) -> Dict[str, List[Dict]]:
+    """单次遍历把代理分到各 provider，provider 按名称排序。"""
+    partitions: Dict[str, List[Dict]] = {}
+    for p in proxies_list:
+        proxy = p.to_dict() if isinstance(p, ProxyRecord) else p
+        if proxy.get("name"):
+            partitions.setdefault(provider_name_for(proxy), []).append(proxy)
+    return dict(sorted(partitions.items()))
+
+
+def provider_group_by(group_by: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    provider 输出实际使用的分组维度：默认取 config.json 的 clash.group_by，
+    未知维度与 build_config_from_proxies 一样报错，provider 无法表达的维度（asn/risk/latency）记录警告后忽略。
+    """
+    group_by = list(group_by) if group_by is not None else list(get_clash_config().get("group_by", DEFAULT_GROUP_BY))
+    unknown = [dim for dim in group_by if dim not in GROUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown proxy group dimension(s): {', '.join(unknown)}")
+    ignored = [dim for dim in group_by if dim not in PROVIDER_GROUP_DIMENSIONS]
+    if ignored:
+        logger.warning(f"Provider output only groups by {' / '.join(PROVIDER_GROUP_DIMENSIONS)}; "
+                       f"ignoring group_by dimension(s): {', '.join(ignored)}")
+    return [dim for dim in group_by if dim in PROVIDER_GROUP_DIMENSIONS]
+
+
+def build_provider_config(provider_names: List[str], providers_path: str,
+                          url_base: Optional[str] = None, group_by: Optional[Sequence[str]] = None) -> Dict:
+    """
+    主配置：proxy-providers 引用各 provider 文件（url_base 给出时为 http 类型，否则为 file 类型），
+    分组通过 use 引用 provider，按 group_by（见 provider_group_by）依次生成国家分组与纯净度分组，
+    顺序与 build_config_from_proxies 一致。
+    """
+    group_by = provider_group_by(group_by)
+    new_config = base_config()
+    del new_config["proxies"]
+
+    providers = {}
+    for name in provider_names:
+        filename = f"{name}.yaml"
+        entry = {"type": "file", "path": f"{providers_path}/{filename}", "health-check": dict(HEALTH_CHECK)}
+        if url_base:
+            entry["type"] = "http"
+            entry["url"] = f"{url_base.rstrip('/')}/{filename}"
+            entry["interval"] = HTTP_PROVIDER_INTERVAL
+        providers[name] = entry
+    new_config["proxy-providers"] = providers
+
+    pure = [n for n in provider_names if n.startswith("pure-")]
+    non_pure = [n for n in provider_names if n.startswith("non-pure-")]
+    by_country: Dict[str, List[str]] = {}
+    for name in provider_names:
+        by_country.setdefault(name.split("-")[-1], []).append(name)
+
+    proxy_groups = []
+    group_selectors = []
+    if pure:
+        proxy_groups.append({
+            "name": "⚡ URL-TEST",
+            "type": "url-test",
+            "url": "http://www.gstatic.com/generate_204",
+            "interval": 300,
+            "use": pure,
+        })
+        group_selectors.append("⚡ URL-TEST")
+    for dim in group_by:
+        if dim == "country":
+            for country, names in sorted(by_country.items()):
+                proxy_groups.append({"name": f"AUTO-{country}", "type": "select", "use": names})
+                group_selectors.append(f"AUTO-{country}")
+        elif dim == "purity":
+            if pure:
+                proxy_groups.append({"name": "✅ PURE", "type": "select", "use": pure})
+                group_selectors.append("✅ PURE")
+            if non_pure:
+                proxy_groups.append({"name": "❌ NON-PURE", "type": "select", "use": non_pure})
+                group_selectors.append("❌ NON-PURE")
+    proxy_groups.insert(0, {"name": "✈️ PROXY", "type": "select", "proxies": group_selectors or ["DIRECT"]})
+    new_config["proxy-groups"] = proxy_groups
+    return new_config
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_if_changed(path: str, text: str, manifest: Dict[str, str], key: str) -> bool:
+    """内容哈希与 manifest 记录一致且文件仍存在时跳过写入，返回是否写入。"""
+    digest = _sha256(text)
+    if manifest.get(key) == digest and os.path.exists(path):
+        return False
+    atomic_write_text(path, text)
+    manifest[key] = digest
+    return True
+
+
+def save_provider_output(proxies_list: list, output_yaml: str, providers_dir: str,
+                         url_base: Optional[str] = None,
+                         group_by: Optional[Sequence[str]] = None) -> Dict[str, List[str]]:
+    """
+    写出 provider 文件与引用它们的主配置（output_yaml）。
+    manifest.json 形如 {"providers": {文件名: sha256}, "configs": {主配置路径: sha256}}，
+    主配置路径相对于 manifest 所在目录，目录整体移动或在其它机器上检出后仍然有效。
+    返回 {"written": [...], "unchanged": [...], "removed": [...]}，provider 以文件名、主配置以 output_yaml 表示。
+    """
+    os.makedirs(providers_dir, exist_ok=True)
+    manifest_path = os.path.join(providers_dir, MANIFEST_NAME)
+    manifest = read_json(manifest_path, default={}) or {}
+    provider_hashes: Dict[str, str] = manifest.get("providers", {})
+    config_hashes: Dict[str, str] = manifest.get("configs", {})
+    result: Dict[str, List[str]] = {"written": [], "unchanged": [], "removed": []}
+
+    partitions = partition_proxies(proxies_list)
+    for name, proxies in partitions.items():
+        filename = f"{name}.yaml"
+        changed = _write_if_changed(os.path.join(providers_dir, filename), dump_yaml({"proxies": proxies}),
+                                    provider_hashes, filename)
+        result["written" if changed else "unchanged"].append(filename)
+
+    # 本次不再产生的 provider 文件
+    current = {f"{name}.yaml" for name in partitions}
+    for stale in sorted(set(provider_hashes) - current):
+        try:
+            os.remove(os.path.join(providers_dir, os.path.basename(stale)))
+        except FileNotFoundError:
+            pass
+        del provider_hashes[stale]
+        result["removed"].append(stale)
+
+    providers_path = os.path.relpath(os.path.abspath(providers_dir), os.path.dirname(os.path.abspath(output_yaml)))
+    main_config = build_provider_config(list(partitions), f"./{providers_path}".replace(os.sep, "/"), url_base,
+                                        group_by)
+    config_key = os.path.relpath(os.path.abspath(output_yaml), os.path.abspath(providers_dir)).replace(os.sep, "/")
+    # 旧版本的 manifest 以绝对路径为键
+    config_hashes.pop(os.path.abspath(output_yaml), None)
+    changed = _write_if_changed(output_yaml, dump_yaml(main_config), config_hashes, config_key)
+    result["written" if changed else "unchanged"].append(output_yaml)
+
+    atomic_write_json(manifest_path, {"providers": provider_hashes, "configs": config_hashes})
+    logger.info(f"Provider output: {len(result['written'])} written, {len(result['unchanged'])} unchanged, "
+                f"{len(result['removed'])} removed ({len(partitions)} providers in {providers_dir})")
+    return result
@@ -6,24 +6,30 @@ ProxyCheck.io API服务提供者
 import time
 import logging
 import os
+import threading
 from typing import Optional, Dict, List
 import requests
 
+from .config import get_endpoint
+from .metrics import get_metrics
+from .quota import get_quota_ledger
+
 logger = logging.getLogger(__name__)
 
 
 class ProxyCheckProvider:
     """ProxyCheck.io API服务提供者"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         """
         初始化ProxyCheck提供者
         
         Args:
             api_key: API密钥，如果为None则从环境变量读取
+            base_url: API地址，如果为None则取 config.get_endpoint("proxycheck")
         """
         self.api_key = api_key or self._get_api_key()
-        self.base_url = "http://proxycheck.io/v2"
+        self.base_url = (base_url or get_endpoint("proxycheck")).rstrip("/")
         self.session = requests.Session()
         
         # 配置连接池
@@ -51,9 +57,12 @@ class ProxyCheckProvider:
             self.min_interval = 0.5   # 2 requests/second
             self.daily_limit = 1000   # 每日1000次
         
-        # 请求计数器
+        # 请求计数器（本实例）与跨运行持久化的配额账本；
+        # 实例按密钥在线程间共享，_rate_lock 保护整个 检查配额-等待-记录 过程
         self.request_count = 0
         self.request_times = []
+        self._rate_lock = threading.Lock()
+        self.ledger = get_quota_ledger()
         
         logger.info(f"ProxyCheck provider initialized with API key: {'Yes' if self.api_key else 'No'}")
         logger.info(f"Rate limit: {1/self.min_interval:.0f} req/sec, Daily limit: {self.daily_limit}")
@@ -80,8 +89,25 @@ class ProxyCheckProvider:
         logger.warning("No ProxyCheck.io API key found. Using free tier with limited requests.")
         return None
     
-    def _rate_limit(self):
-        """实施速率限制"""
+    def _rate_limit(self) -> bool:
+        """
+        实施速率限制并占用一次配额。整个过程持有实例锁，并发的工作线程依次取得发送时机；
+        配额已用尽时返回 False（不等待、不记录）。
+        """
+        with self._rate_lock:
+            if self.remaining_quota() == 0:
+                return False
+            self._wait_for_slot()
+            if not self.ledger.reserve('proxycheck', self.api_key, daily_limit=self.daily_limit):
+                return False
+            current_time = time.time()
+            self.request_times.append(current_time)
+            self.last_request_time = current_time
+            self.request_count += 1
+            return True
+
+    def _wait_for_slot(self) -> None:
+        """等待到每分钟请求数与最小间隔都允许发送，调用方需持有 _rate_lock"""
         current_time = time.time()
         
         # 清理超过1分钟的请求记录
@@ -93,6 +119,7 @@ class ProxyCheckProvider:
             sleep_time = 60 - (current_time - self.request_times[0]) + 0.1
             if sleep_time > 0:
                 logger.debug(f"Rate limit reached, sleeping for {sleep_time:.1f}s")
+                get_metrics().record_rate_limit_sleep('proxycheck', sleep_time)
                 time.sleep(sleep_time)
                 current_time = time.time()
                 self.request_times = [t for t in self.request_times if current_time - t < 60]
@@ -101,13 +128,12 @@ class ProxyCheckProvider:
         time_since_last = current_time - self.last_request_time
         if time_since_last < self.min_interval:
             sleep_time = self.min_interval - time_since_last
+            get_metrics().record_rate_limit_sleep('proxycheck', sleep_time)
             time.sleep(sleep_time)
-            current_time = time.time()
-        
-        # 记录请求时间
-        self.request_times.append(current_time)
-        self.last_request_time = current_time
-        self.request_count += 1
+
+    def remaining_quota(self) -> Optional[int]:
+        """根据持久化账本计算今日剩余请求数"""
+        return self.ledger.remaining('proxycheck', self.api_key, daily_limit=self.daily_limit)
     
     def check_ip(self, ip: str, timeout: int = 10) -> Optional[Dict]:
         """
@@ -120,7 +146,9 @@ class ProxyCheckProvider:
         Returns:
             包含IP信息和纯净度数据的字典，失败时返回None
         """
-        self._rate_limit()
+        if not self._rate_limit():
+            logger.debug(f"ProxyCheck daily quota exhausted, skipping {ip}")
+            return None
         
         # 构建请求URL
         params = {
@@ -136,12 +164,22 @@ class ProxyCheckProvider:
         
         try:
             logger.debug(f"Checking IP {ip} with ProxyCheck.io")
-            response = self.session.get(url, params=params, timeout=timeout)
-            response.raise_for_status()
-            
-            data = response.json()
+            with get_metrics().track_request('proxycheck') as call:
+                response = self.session.get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                data = response.json()
+                if data.get('status') == 'denied':
+                    call.outcome = 'denied'
+                elif data.get('status') != 'ok' or not data.get(ip):
+                    call.outcome = 'fail'
             
             # 检查API响应状态
+            if data.get('status') == 'denied':
+                # 查询次数用尽时ProxyCheck返回denied，当日后续请求都会失败
+                logger.error(f"ProxyCheck API denied request for {ip}: {data.get('message', '')}")
+                self.ledger.mark_exhausted('proxycheck', self.api_key)
+                return None
+
             if data.get('status') == 'error':
                 error_msg = data.get('message', 'Unknown error')
                 logger.error(f"ProxyCheck API error for {ip}: {error_msg}")
@@ -306,7 +344,7 @@ class ProxyCheckProvider:
                     'test_ip': test_ip,
                     'api_key_used': bool(self.api_key),
                     'daily_limit': self.daily_limit,
-                    'requests_made': self.request_count
+                    'requests_made': self.ledger.usage('proxycheck', self.api_key)['daily']
                 }
             else:
                 return {
@@ -327,17 +365,34 @@ class ProxyCheckProvider:
         获取使用统计信息
         
         Returns:
-            使用统计字典
+            使用统计字典（今日用量来自持久化账本，包含之前运行的请求）
         """
+        usage = self.ledger.usage('proxycheck', self.api_key)
         return {
-            'requests_made': self.request_count,
+            'requests_made': usage['daily'],
+            'requests_made_this_month': usage['monthly'],
+            'requests_made_this_session': self.request_count,
             'daily_limit': self.daily_limit,
-            'remaining_requests': max(0, self.daily_limit - self.request_count),
+            'remaining_requests': self.remaining_quota(),
             'api_key_configured': bool(self.api_key),
             'rate_limit': f"{1/self.min_interval:.1f} req/sec"
         }
 
 
+# 按API密钥缓存的全局实例
+_proxycheck_providers: Dict[Optional[str], ProxyCheckProvider] = {}
+_providers_lock = threading.Lock()
+
+def get_proxycheck_provider(api_key: Optional[str] = None) -> ProxyCheckProvider:
+    """获取指定API密钥对应的全局ProxyCheck提供者实例"""
+    with _providers_lock:
+        provider = _proxycheck_providers.get(api_key)
+        if provider is None:
+            provider = ProxyCheckProvider(api_key)
+            _proxycheck_providers[api_key] = provider
+        return provider
+
+
 # 便捷函数
 def fetch_ip_info_proxycheck(ip: str, api_key: Optional[str] = None, timeout: int = 10) -> Optional[Dict]:
     """
@@ -351,5 +406,5 @@ def fetch_ip_info_proxycheck(ip: str, api_key: Optional[str] = None, timeout: in
     Returns:
         IP信息字典或None
     """
-    provider = ProxyCheckProvider(api_key)
+    provider = get_proxycheck_provider(api_key)
     return provider.check_ip(ip, timeout)
@@ -0,0 +1,204 @@
+"""
+API配额记账
+按 provider + key 持久化记录每日/每月调用量，使多次运行共享同一份用量
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from .config import get_quota_config
+from .fileutil import atomic_write_json, read_json
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_LEDGER_PATH = "quota_ledger.json"
+# 每记录多少次调用落盘一次，进程退出前还会再保存一次
+SAVE_EVERY = 20
+
+
+def _key_id(api_key: Optional[str]) -> str:
+    """账本中只保存 key 的指纹，不保存明文。"""
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _windows() -> Tuple[str, str]:
+    """当前的 UTC 日窗口与月窗口。"""
+    now = time.gmtime()
+    return time.strftime("%Y-%m-%d", now), time.strftime("%Y-%m", now)
+
+
+def _rolled(entry: Optional[Dict]) -> Dict:
+    """返回滚动到当前窗口后的条目副本，跨日/跨月时清零对应计数。"""
+    day, month = _windows()
+    entry = dict(entry or {})
+    if entry.get("day") != day:
+        entry["day"] = day
+        entry["daily"] = 0
+    if entry.get("month") != month:
+        entry["month"] = month
+        entry["monthly"] = 0
+    if entry.get("exhausted_day") != day:
+        entry["exhausted_day"] = None
+    return entry
+
+
+def _remaining_of(entry: Dict, daily_limit: Optional[int], monthly_limit: Optional[int]) -> Optional[int]:
+    """已滚动条目的剩余次数；未配置任何限额时为None（不限量）。"""
+    if entry["exhausted_day"]:
+        return 0
+    candidates = []
+    if daily_limit is not None:
+        candidates.append(daily_limit - entry["daily"])
+    if monthly_limit is not None:
+        candidates.append(monthly_limit - entry["monthly"])
+    if not candidates:
+        return None
+    return max(0, min(candidates))
+
+
+class QuotaLedger:
+    """持久化的配额账本（JSON文件），线程安全，多进程写入时按增量合并"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = (
+            path
+            or os.getenv("IP_CHECKER_QUOTA_LEDGER")
+            or get_quota_config().get("ledger_path", DEFAULT_LEDGER_PATH)
+        )
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = read_json(self.path, {}) or {}
+        # 自上次保存以来新增的调用数与耗尽标记，保存时叠加到磁盘上的最新值
+        self._pending: Dict[str, int] = {}
+        self._pending_exhausted: set = set()
+
+    def _entry_key(self, provider: str, api_key: Optional[str]) -> str:
+        return f"{provider}:{_key_id(api_key)}"
+
+    def record(self, provider: str, api_key: Optional[str], count: int = 1) -> None:
+        """记录一次（或多次）实际发出的API调用。"""
+        key = self._entry_key(provider, api_key)
+        with self._lock:
+            entry = _rolled(self._entries.get(key))
+            entry["daily"] += count
+            entry["monthly"] += count
+            self._entries[key] = entry
+            self._pending[key] = self._pending.get(key, 0) + count
+            should_save = sum(self._pending.values()) >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def reserve(self, provider: str, api_key: Optional[str],
+                daily_limit: Optional[int] = None, monthly_limit: Optional[int] = None) -> bool:
+        """
+        原子地检查剩余配额并记录一次调用：多个线程同时只剩1次时只有一个能拿到。
+        配额已用尽（或当日已标记耗尽）时返回 False，且不记录。
+        """
+        key = self._entry_key(provider, api_key)
+        with self._lock:
+            entry = _rolled(self._entries.get(key))
+            if _remaining_of(entry, daily_limit, monthly_limit) == 0:
+                return False
+            entry["daily"] += 1
+            entry["monthly"] += 1
+            self._entries[key] = entry
+            self._pending[key] = self._pending.get(key, 0) + 1
+            should_save = sum(self._pending.values()) >= SAVE_EVERY
+        if should_save:
+            self.save()
+        return True
+
+    def mark_exhausted(self, provider: str, api_key: Optional[str]) -> None:
+        """服务端明确拒绝（配额用尽）时标记，当日不再向该 provider/key 发请求。"""
+        key = self._entry_key(provider, api_key)
+        with self._lock:
+            entry = _rolled(self._entries.get(key))
+            entry["exhausted_day"] = entry["day"]
+            self._entries[key] = entry
+            self._pending_exhausted.add(key)
+        logger.warning(f"Quota exhausted for {provider} ({_key_id(api_key)}) until next UTC day")
+        self.save()
+
+    def usage(self, provider: str, api_key: Optional[str]) -> Dict[str, int]:
+        """当前窗口内的用量。"""
+        with self._lock:
+            entry = _rolled(self._entries.get(self._entry_key(provider, api_key)))
+        return {"daily": entry["daily"], "monthly": entry["monthly"]}
+
+    def remaining(self, provider: str, api_key: Optional[str],
+                  daily_limit: Optional[int] = None, monthly_limit: Optional[int] = None) -> Optional[int]:
+        """按日/月限额计算剩余可用次数；未配置任何限额时返回None（不限量）。"""
+        with self._lock:
+            entry = _rolled(self._entries.get(self._entry_key(provider, api_key)))
+        return _remaining_of(entry, daily_limit, monthly_limit)
+
+    def save(self) -> None:
+        """把未保存的增量合并到磁盘上的最新账本后原子写回。"""
+        with self._lock:
+            if not self._pending and not self._pending_exhausted:
+                return
+            on_disk = read_json(self.path, {}) or {}
+            for key, count in self._pending.items():
+                entry = _rolled(on_disk.get(key))
+                entry["daily"] += count
+                entry["monthly"] += count
+                on_disk[key] = entry
+            for key in self._pending_exhausted:
+                entry = _rolled(on_disk.get(key))
+                entry["exhausted_day"] = entry["day"]
+                on_disk[key] = entry
+            try:
+                atomic_write_json(self.path, on_disk)
+            except OSError as e:
+                logger.warning(f"Failed to save quota ledger to {self.path}: {e}")
+                return
+            self._entries = on_disk
+            self._pending = {}
+            self._pending_exhausted = set()
+
+
+# 全局实例
+_quota_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_quota_ledger() -> QuotaLedger:
+    """获取全局配额账本实例"""
+    global _quota_ledger
+    with _ledger_lock:
+        if _quota_ledger is None:
+            _quota_ledger = QuotaLedger()
+            atexit.register(_quota_ledger.save)
+        return _quota_ledger
+
+
+def remaining_lookup_budget(api_key: Optional[str] = None) -> Optional[int]:
+    """
+    本次运行还能发出的计量查询次数（ProxyCheck 日配额 + IPinfo 月配额）。
+
+    ip-api.com 只是兜底，不计入容量；任一计量 provider 未配置限额时返回None（不限量）。
+    """
+    from .ipinfo_provider import get_ipinfo_provider
+    from .proxycheck_provider import get_proxycheck_provider
+
+    budgets = [
+        get_proxycheck_provider(api_key).remaining_quota(),
+        get_ipinfo_provider().remaining_quota(),
+    ]
+    if any(b is None for b in budgets):
+        return None
+    return sum(budgets)
+
+
+def plan_within_budget(items: Sequence[T], budget: Optional[int]) -> Tuple[List[T], List[T]]:
+    """按给定顺序切分出本次预算内处理的条目与推迟的条目。"""
+    if budget is None or budget >= len(items):
+        return list(items), []
+    return list(items[:budget]), list(items[budget:])
@@ -0,0 +1,154 @@
+"""
+流式CSV报告写入
+结果一产生就写入磁盘并定期刷新，进程中断后可从已写入的部分报告继续
+"""
+import csv
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+REPORT_FIELDS = ["host", "ip", "pure", "country", "countryCode", "regionName", "city", "isp", "org", "as"]
+
+
+def _truncate_partial_line(path: str) -> None:
+    """去掉文件末尾未写完的半行（进程在写一行时被杀死）。"""
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # 从后往前找最后一个换行
+        pos = size - 1
+        chunk = 4096
+        while pos > 0:
+            start = max(0, pos - chunk)
+            f.seek(start)
+            data = f.read(pos - start)
+            idx = data.rfind(b"\n")
+            if idx != -1:
+                f.truncate(start + idx + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+class CsvReportWriter:
+    """
+    逐行写入的CSV报告。
+
+    每写 flush_every 行或距上次刷新超过 flush_interval 秒时 flush + fsync。
+    resume=True 时保留已有报告并追加，已写入的键可通过 completed_keys 查询；
+    redo 判定为真的已有行（例如上次未能检查的行）会从报告中移除，以便重新写入。
+    """
+
+    def __init__(self, path: str, fieldnames: Optional[List[str]] = None, resume: bool = False,
+                 key_fields: Tuple[str, ...] = ("host", "ip"),
+                 redo: Optional[Callable[[Dict], bool]] = None,
+                 flush_every: int = 200, flush_interval: float = 5.0):
+        self.path = path
+        self.fieldnames = fieldnames or REPORT_FIELDS
+        self.key_fields = key_fields
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.completed_keys: Set[Tuple[str, ...]] = set()
+        # 续写时已有行按 pure 列统计，便于汇总
+        self.resumed_counts: Counter = Counter()
+        self.rows_written = 0
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+        if resume and os.path.exists(path) and self._load_existing(redo):
+            self._file = open(path, "a", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            logger.info(f"Resuming report {path}: {len(self.completed_keys)} rows already written")
+        else:
+            # utf-8-sig 写入BOM便于Excel打开；续写时用utf-8避免重复BOM
+            self._file = open(path, "w", newline="", encoding="utf-8-sig")
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            self._writer.writeheader()
+            self._file.flush()
+
+    def _load_existing(self, redo: Optional[Callable[[Dict], bool]]) -> bool:
+        """读取已有的部分报告；表头不一致时返回False（改为重写）。"""
+        _truncate_partial_line(self.path)
+        dropped = 0
+        with open(self.path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames != self.fieldnames:
+                logger.warning(f"Existing report {self.path} has a different header; starting over")
+                return False
+            for row in reader:
+                if redo and redo(row):
+                    dropped += 1
+                    continue
+                self.completed_keys.add(tuple(row.get(k, "") for k in self.key_fields))
+                if "pure" in row:
+                    self.resumed_counts[row["pure"]] += 1
+        if dropped:
+            self._rewrite_without(redo)
+            logger.info(f"Dropped {dropped} rows from {self.path} to be redone")
+        return True
+
+    def _rewrite_without(self, redo: Callable[[Dict], bool]) -> None:
+        """流式重写报告，去掉需要重做的行，最后原子替换原文件。"""
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, "r", newline="", encoding="utf-8-sig") as src, \
+                open(tmp_path, "w", newline="", encoding="utf-8-sig") as dst:
+            reader = csv.DictReader(src)
+            writer = csv.DictWriter(dst, fieldnames=self.fieldnames)
+            writer.writeheader()
+            for row in reader:
+                if not redo(row):
+                    writer.writerow(row)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, *key: str) -> bool:
+        return tuple(key) in self.completed_keys
+
+    def write_row(self, row: Dict) -> None:
+        with self._lock:
+            self._writer.writerow(row)
+            self.completed_keys.add(tuple(str(row.get(k, "")) for k in self.key_fields))
+            self.rows_written += 1
+            self._unflushed += 1
+            if (self._unflushed >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def write_rows(self, rows: Iterable[Dict]) -> None:
+        for row in rows:
+            self.write_row(row)
+
+    def _flush_locked(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_locked()
+            self._file.close()
+
+    def __enter__(self) -> "CsvReportWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,196 @@
+"""
+定长记录的二进制结果文件（.ipr）
+由 VerdictTable 写出，读取时直接 mmap，按下标随机访问，无需解析JSON/CSV
+
+文件布局（小端）：
+  头部 32 字节：magic "IPVR" | version u16 | record_size u16 | 行数 u32 | 字符串数 u32 | 字符串表偏移 u64 | 保留
+  记录 16 字节：ip u32 | 国家 u32 | ASN u32 | flags u8 | risk u8 | 填充 2
+  字符串表：每项 u16 长度 + UTF-8 内容；国家、ASN 与非IPv4地址都以字符串表下标引用，下标0为 "Unknown"
+
+.ipr 是有损格式：只保存过滤与分组所需的 IP、国家代码、ASN、标记与风险分，
+地区、城市、ISP、组织等描述字段（LOSSY_FIELDS）不写入，导出的 CSV/JSON 也不含这些列；
+需要完整信息时保留原始的 JSON/CSV 结果
+"""
+import mmap
+import os
+import socket
+import struct
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .columnar import FLAG_NAMES, RISK_UNKNOWN, UNKNOWN, VerdictTable
+from .fileutil import atomic_write_bytes
+
+MAGIC = b"IPVR"
+VERSION = 1
+RESULT_FILE_EXT = ".ipr"
+
+_HEADER = struct.Struct("<4sHHIIQ8x")
+_RECORD = struct.Struct("<IIIBB2x")
+_STRLEN = struct.Struct("<H")
+_MAX_STRLEN = 0xFFFF
+
+# 输入结果中有、但 .ipr 不保存的描述字段
+LOSSY_FIELDS = ("regionName", "region", "city", "isp", "org")
+
+# flags 中的内部位：ip 字段是字符串表下标（IPv6 等非IPv4地址）
+_FLAG_IP_STRING = 128
+
+
+class ResultFileError(ValueError):
+    pass
+
+
+def dropped_fields(fields: Iterable[str]) -> List[str]:
+    """输入记录的字段中写入 .ipr 时会丢弃的描述字段（按 LOSSY_FIELDS 的顺序）"""
+    present = set(fields)
+    return [name for name in LOSSY_FIELDS if name in present]
+
+
+def write_result_file(path: str, table: VerdictTable) -> int:
+    """把 VerdictTable 原子写为 .ipr 文件，返回写入的行数。"""
+    strings: List[str] = [UNKNOWN]
+    index: Dict[str, int] = {UNKNOWN: 0}
+
+    def intern(value: str) -> int:
+        idx = index.get(value)
+        if idx is None:
+            idx = index[value] = len(strings)
+            strings.append(value)
+        return idx
+
+    country_idx = [intern(v) for v in table.countries.values]
+    asn_idx = [intern(v) for v in table.asns.values]
+
+    count = len(table)
+    buf = bytearray(_HEADER.size + count * _RECORD.size)
+    offset = _HEADER.size
+    pack_into = _RECORD.pack_into
+    for i in range(count):
+        ip = table.ips[i]
+        flags = table.flags[i]
+        if ip == 0:
+            other = table.ip_at(i)
+            if other != "0.0.0.0":
+                ip = intern(other)
+                flags |= _FLAG_IP_STRING
+        pack_into(buf, offset, ip, country_idx[table.country[i]], asn_idx[table.asn[i]], flags, table.risk[i])
+        offset += _RECORD.size
+
+    for value in strings:
+        encoded = value.encode("utf-8")
+        if len(encoded) > _MAX_STRLEN:
+            # 在字符边界截断，避免切开多字节字符导致读取时解码失败
+            encoded = encoded[:_MAX_STRLEN].decode("utf-8", "ignore").encode("utf-8")
+        buf += _STRLEN.pack(len(encoded)) + encoded
+    _HEADER.pack_into(buf, 0, MAGIC, VERSION, _RECORD.size, count, len(strings), offset)
+    atomic_write_bytes(path, bytes(buf))
+    return count
+
+
+class ResultFileReader:
+    """
+    .ipr 文件的只读视图（mmap）。
+
+    reader[i] 返回与 VerdictTable.row 相同格式的 dict；iter_records() 产出原始元组
+    (ip, country, asn, flags, risk)，其中 country/asn 已还原为字符串。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ResultFileError(f"{path} is empty")
+        try:
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse_header(self) -> None:
+        if len(self._mm) < _HEADER.size:
+            raise ResultFileError(f"{self.path} is too short to be a result file")
+        magic, version, record_size, count, string_count, strings_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ResultFileError(f"{self.path} is not a result file (bad magic {magic!r})")
+        if version != VERSION or record_size != _RECORD.size:
+            raise ResultFileError(f"{self.path}: unsupported version {version} / record size {record_size}")
+        if strings_offset != _HEADER.size + count * record_size or strings_offset > len(self._mm):
+            raise ResultFileError(f"{self.path} is truncated")
+        self._count = count
+        self.strings: List[str] = []
+        pos = strings_offset
+        for _ in range(string_count):
+            (length,) = _STRLEN.unpack_from(self._mm, pos)
+            pos += _STRLEN.size
+            self.strings.append(self._mm[pos:pos + length].decode("utf-8"))
+            pos += length
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _decode(self, record: Tuple[int, int, int, int, int]) -> Tuple[str, str, str, int, int]:
+        ip, country, asn, flags, risk = record
+        if flags & _FLAG_IP_STRING:
+            ip_text = self.strings[ip]
+            flags &= ~_FLAG_IP_STRING
+        else:
+            ip_text = socket.inet_ntoa(ip.to_bytes(4, "big"))
+        return ip_text, self.strings[country], self.strings[asn], flags, risk
+
+    def record(self, index: int) -> Tuple[str, str, str, int, int]:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._decode(_RECORD.unpack_from(self._mm, _HEADER.size + index * _RECORD.size))
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += self._count
+        return _row(*self.record(index))
+
+    def iter_records(self) -> Iterator[Tuple[str, str, str, int, int]]:
+        body = self._mm[_HEADER.size:_HEADER.size + self._count * _RECORD.size]
+        for record in _RECORD.iter_unpack(body):
+            yield self._decode(record)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for record in self.iter_records():
+            yield _row(*record)
+
+    def to_table(self) -> VerdictTable:
+        """还原为 VerdictTable，以便继续做过滤与分组。"""
+        table = VerdictTable()
+        for ip, country, asn, flags, risk in self.iter_records():
+            table.append_row(ip, None if country == UNKNOWN else country,
+                             None if asn == UNKNOWN else asn, flags, risk)
+        return table
+
+    def close(self) -> None:
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "ResultFileReader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _row(ip: str, country: str, asn: str, flags: int, risk: int) -> Dict:
+    row = {"ip": ip, "countryCode": country, "as": asn, "risk": None if risk == RISK_UNKNOWN else risk}
+    for name, bit in FLAG_NAMES.items():
+        row[name] = bool(flags & bit)
+    return row
+
+
+def read_result_file(path: str) -> VerdictTable:
+    with ResultFileReader(path) as reader:
+        return reader.to_table()
+
+
+def result_path_for(output_path: str) -> str:
+    """与 JSON/CSV 产物同名的二进制结果路径，例如 results.json -> results.ipr"""
+    return os.path.splitext(output_path)[0] + RESULT_FILE_EXT
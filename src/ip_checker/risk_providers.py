@@ -0,0 +1,238 @@
+"""
+IP风险分提供者（scamalytics.com / ping0.cc）
+每个提供者持有一个带连接池的 Session，按站点限速（线程安全），成功结果按 TTL 缓存在 SQLite 中；
+ping0 的 jskey cookie 在有效期内复用，只有页面再次返回校验脚本时才重新计算，正常情况下每个IP只需加载一次页面
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Optional
+
+import requests
+
+from .config import config, get_api_provider_settings, get_endpoint
+from .metrics import get_metrics
+from .verdict_cache import DEFAULT_CACHE_DB
+
+logger = logging.getLogger(__name__)
+
+BROWSER_USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                      "(KHTML, like Gecko) Chrome/83.0.4103.116 Safari/537.36")
+# 风险分变化很慢，默认缓存一天
+DEFAULT_RISK_TTL = 86400
+
+_RATE_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate_limit(value: Optional[str], default: float) -> float:
+    """把 config.json 中 "2/second"、"45/minute" 形式的限速转换为每秒请求数。"""
+    try:
+        count, unit = str(value).split("/", 1)
+        return float(count) / _RATE_UNITS[unit.strip().rstrip("s")]
+    except (ValueError, KeyError, ZeroDivisionError):
+        return default
+
+
+def get_risk_ttl() -> int:
+    """风险查询结果的缓存有效期（秒），取自config.json的cache.ttl.risk_results"""
+    return int(config.get("cache", {}).get("ttl", {}).get("risk_results", DEFAULT_RISK_TTL))
+
+
+class RateLimiter:
+    """按固定间隔放行请求；多个线程各自预约时间槽，在锁外等待"""
+
+    def __init__(self, per_second: float, name: str = ""):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        # 等待时长计入 metrics 的 rate_limit_sleep_seconds_total
+        self.name = name
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            if self.name:
+                get_metrics().record_rate_limit_sleep(self.name, delay)
+            time.sleep(delay)
+
+
+class RiskCache:
+    """按 (提供者, IP) 缓存风险查询结果，与 VerdictCache 共用同一个数据库文件"""
+
+    def __init__(self, db_path: Optional[str] = None, ttl: Optional[int] = None):
+        self.db_path = db_path or os.getenv("IP_CHECKER_CACHE_DB") or DEFAULT_CACHE_DB
+        self.ttl = ttl if ttl is not None else get_risk_ttl()
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS risk_cache (
+                    provider TEXT,
+                    ip TEXT,
+                    data TEXT,
+                    timestamp DATETIME,
+                    PRIMARY KEY (provider, ip)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, provider: str, ip: str) -> Optional[Dict]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            row = conn.execute('SELECT data, timestamp FROM risk_cache WHERE provider = ? AND ip = ?',
+                               (provider, ip)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        try:
+            if (datetime.now() - datetime.fromisoformat(row[1])).total_seconds() >= self.ttl:
+                return None
+            return json.loads(row[0])
+        except (TypeError, ValueError):
+            return None
+
+    def put(self, provider: str, ip: str, data: Dict) -> None:
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute('INSERT OR REPLACE INTO risk_cache (provider, ip, data, timestamp) VALUES (?, ?, ?, ?)',
+                             (provider, ip, json.dumps(data, ensure_ascii=False), datetime.now().isoformat()))
+                conn.commit()
+            finally:
+                conn.close()
+
+
+class RiskProvider(ABC):
+    """风险提供者基类：连接池、限速与结果缓存；子类实现 _fetch"""
+
+    name = ""
+    default_rate = 1.0
+
+    def __init__(self, cache: Optional[RiskCache] = None, rate_per_second: Optional[float] = None,
+                 pool_size: int = 10, base_url: Optional[str] = None):
+        settings = get_api_provider_settings(self.name)
+        self.base_url = (base_url or get_endpoint(self.name)).rstrip("/")
+        self.limiter = RateLimiter(rate_per_second or parse_rate_limit(settings.get("rate_limit"), self.default_rate),
+                                   name=self.name)
+        self.cache = cache or RiskCache()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"User-Agent": BROWSER_USER_AGENT})
+        # 由调度器的多个工作线程同时更新
+        self.stats = {"cache_hits": 0, "requests": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _get(self, url: str, proxy: Optional[Dict], timeout: float, **kwargs) -> requests.Response:
+        self.limiter.wait()
+        self._count("requests")
+        with get_metrics().track_request(self.name):
+            response = self.session.get(url, proxies=proxy, timeout=timeout, **kwargs)
+            response.raise_for_status()
+        return response
+
+    @abstractmethod
+    def _fetch(self, ip: str, proxy: Optional[Dict], timeout: float) -> Optional[Dict]:
+        """请求并解析一个IP的风险页面；请求失败抛出 requests.RequestException"""
+
+    def fetch(self, ip: str, proxy: Optional[Dict] = None, timeout: float = 5, use_cache: bool = True) -> Optional[Dict]:
+        """查询一个IP的风险信息，缓存有效期内直接返回缓存；失败返回 None（失败不缓存）。"""
+        if use_cache:
+            cached = self.cache.get(self.name, ip)
+            get_metrics().record_cache(f"risk.{self.name}", hits=int(cached is not None), misses=int(cached is None))
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+        try:
+            result = self._fetch(ip, proxy, timeout)
+        except requests.RequestException as e:
+            self._count("errors")
+            logger.error(f'Error fetching {self.name} risk for {ip}: {e}')
+            return None
+        # 只缓存含有实际数据的结果，解析不出任何字段的页面下次重新查询
+        if result and any(v is not None for v in result.values()):
+            self.cache.put(self.name, ip, result)
+        return result
+
+
+class ScamalyticsProvider(RiskProvider):
+    name = "scamalytics"
+    default_rate = 2.0
+
+    def _fetch(self, ip: str, proxy: Optional[Dict], timeout: float) -> Optional[Dict]:
+        from .ip_utils import _parse_scamalytics_risk
+        return _parse_scamalytics_risk(self._get(f"{self.base_url}/{ip}", proxy, timeout).text)
+
+
+class Ping0Provider(RiskProvider):
+    """
+    ping0.cc 首次访问返回计算 jskey 的校验脚本（window.x），带上 jskey cookie 后才返回数据页。
+    jskey 按出口（proxy）缓存，后续IP直接带 cookie 请求；页面再次返回校验脚本说明 jskey 已失效，
+    此时用新的 window.x 重新计算并重试一次。
+    """
+
+    name = "ping0"
+    default_rate = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._jskeys: Dict[str, str] = {}
+        self._jskey_lock = threading.Lock()
+
+    @staticmethod
+    def _vantage(proxy: Optional[Dict]) -> str:
+        return json.dumps(proxy or {}, sort_keys=True)
+
+    def _fetch(self, ip: str, proxy: Optional[Dict], timeout: float) -> Optional[Dict]:
+        from .ip_utils import _parse_ping0_risk, _parse_window_x
+        url = f"{self.base_url}/{ip}"
+        vantage = self._vantage(proxy)
+        with self._jskey_lock:
+            jskey = self._jskeys.get(vantage)
+
+        for _ in range(2):
+            cookies = {"jskey": jskey} if jskey else None
+            text = self._get(url, proxy, timeout, cookies=cookies).text
+            challenge = _parse_window_x(text)
+            if not challenge:
+                if jskey is None:
+                    # 没有校验脚本也没有 jskey：页面结构已变化，按数据页解析
+                    logger.debug(f"ping0 returned a data page for {ip} without a jskey")
+                return _parse_ping0_risk(text)
+            # 返回了校验脚本：jskey 缺失或已失效，计算新的 jskey 后重试
+            jskey = challenge
+            with self._jskey_lock:
+                self._jskeys[vantage] = jskey
+        logger.warning(f'Failed to pass the ping0 jskey check for {ip}.')
+        return None
+
+
+_providers: Dict[str, RiskProvider] = {}
+_providers_lock = threading.Lock()
+_PROVIDER_CLASSES = {"scamalytics": ScamalyticsProvider, "ping0": Ping0Provider}
+
+
+def get_risk_provider(name: str) -> RiskProvider:
+    """获取全局的风险提供者实例（scamalytics / ping0），同一进程内共享会话、限速与 jskey"""
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            provider = _providers[name] = _PROVIDER_CLASSES[name]()
+        return provider
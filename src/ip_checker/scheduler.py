@@ -0,0 +1,93 @@
+"""
+IP查询优先级调度
+在固定的配额/时间预算下，优先查询最需要查询的IP：
+从未查过的 → 缓存结果最旧的 → 承载代理/主机最多的
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .quota import plan_within_budget
+
+logger = logging.getLogger(__name__)
+
+# 缓存年龄按小时分桶，同一桶内再按承载数量排序
+DEFAULT_AGE_BUCKET_SECONDS = 3600
+
+
+def prioritize_ips(ip_weights: Dict[str, int], ages: Optional[Dict[str, float]] = None,
+                   age_bucket_seconds: float = DEFAULT_AGE_BUCKET_SECONDS) -> List[str]:
+    """
+    返回按优先级排序的IP列表。
+
+    Args:
+        ip_weights: IP -> 承载的代理/主机数量
+        ages: IP -> 距上次查询的秒数，缺失表示从未查询过
+        age_bucket_seconds: 年龄分桶粒度
+    """
+    ages = ages or {}
+
+    def sort_key(ip: str) -> Tuple:
+        age = ages.get(ip)
+        if age is None:
+            return (0, 0, -ip_weights[ip], ip)
+        return (1, -int(age // age_bucket_seconds), -ip_weights[ip], ip)
+
+    return sorted(ip_weights, key=sort_key)
+
+
+class LookupScheduler:
+    """按优先级顺序提交查询，达到查询次数或时间预算后停止提交新任务"""
+
+    def __init__(self, ip_weights: Dict[str, int], ages: Optional[Dict[str, float]] = None,
+                 max_lookups: Optional[int] = None, time_budget: Optional[float] = None,
+                 age_bucket_seconds: float = DEFAULT_AGE_BUCKET_SECONDS):
+        self.order = prioritize_ips(ip_weights, ages, age_bucket_seconds)
+        self.planned, self.skipped = plan_within_budget(self.order, max_lookups)
+        self.time_budget = time_budget
+
+    def run(self, lookup: Callable[[str], Optional[Dict]], max_workers: int) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        并发执行查询并按完成顺序产出 (ip, result)。
+
+        同时在途的任务数限制为 max_workers，这样时间预算到期时只需等待在途任务，
+        未提交的IP追加到 self.skipped。
+        """
+        deadline = time.monotonic() + self.time_budget if self.time_budget else None
+        pending_ips = iter(self.planned)
+        submitted = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                nonlocal submitted
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                ip = next(pending_ips, None)
+                if ip is None:
+                    return False
+                in_flight[ex.submit(lookup, ip)] = ip
+                submitted += 1
+                return True
+
+            while len(in_flight) < max_workers and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ip = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.debug(f"Lookup failed for {ip}: {e}")
+                        result = None
+                    yield ip, result
+                    submit_next()
+
+        if submitted < len(self.planned):
+            not_submitted = self.planned[submitted:]
+            logger.warning(f"Time budget reached; {len(not_submitted)} planned lookups were not started")
+            self.skipped = not_submitted + self.skipped
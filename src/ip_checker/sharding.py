@@ -0,0 +1,77 @@
+"""
+分片运行支持
+用一致性哈希把唯一IP确定性地分配到 N 个分片，每个分片可作为独立任务（如 GitHub Actions matrix）运行，
+最后由 scripts/merge_shards.py 合并各分片的部分结果
+"""
+import bisect
+import hashlib
+import os
+import re
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 每个分片在环上的虚拟节点数，越多分布越均匀
+DEFAULT_VNODES = 128
+
+
+def _hash(value: str) -> int:
+    # 不能用内置 hash()：它在不同进程间是随机化的
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """一致性哈希环；分片数变化时只有约 1/N 的键会换分片"""
+
+    def __init__(self, shard_count: int, vnodes: int = DEFAULT_VNODES):
+        if shard_count < 1:
+            raise ValueError("shard_count must be >= 1")
+        self.shard_count = shard_count
+        points = sorted(
+            (_hash(f"shard-{shard}-vnode-{v}"), shard)
+            for shard in range(shard_count)
+            for v in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_for(self, key: str) -> int:
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._shards[idx]
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """解析 "i/N" 形式的分片参数（i 从0开始），返回 (i, N)。"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec or "")
+    if not match:
+        raise ValueError(f"Invalid shard spec '{spec}', expected INDEX/COUNT such as 0/4")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec '{spec}': index must be in [0, {count})")
+    return index, count
+
+
+def select_shard(items: Iterable[T], shard_index: int, shard_count: int,
+                 key: Callable[[T], str] = str) -> List[T]:
+    """保留属于指定分片的条目；同一个键（IP）的所有条目总在同一分片。"""
+    if shard_count == 1:
+        return list(items)
+    ring = ConsistentHashRing(shard_count)
+    return [item for item in items if ring.shard_for(key(item)) == shard_index]
+
+
+def shard_path(path: str, shard_index: int, shard_count: int, ext: Optional[str] = None) -> str:
+    """分片产物路径，例如 report.csv -> report.shard-0-of-4.csv"""
+    root, original_ext = os.path.splitext(path)
+    return f"{root}.shard-{shard_index}-of-{shard_count}{ext or original_ext}"
+
+
+def shard_api_key(shard_index: int, env_var: str = "PROXYCHECK_API_KEYS") -> Optional[str]:
+    """
+    从逗号分隔的环境变量中为分片挑选API密钥，使各分片分摊到不同的key上。
+    未设置时返回None（回退到 PROXYCHECK_API_KEY / 密钥文件）。
+    """
+    keys = [k.strip() for k in os.getenv(env_var, "").split(",") if k.strip()]
+    if not keys:
+        return None
+    return keys[shard_index % len(keys)]
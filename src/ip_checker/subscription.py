@@ -1,25 +1,38 @@
 import base64
+import json
 import logging
+import os
 import re
 import socket
+import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Set, Tuple, Dict, Optional
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, List, Set, Tuple, Dict, Optional
 
 import requests
-import yaml
 from urllib.parse import urlparse, parse_qs
 
+from .config import get_endpoint
+from .metrics import get_metrics
+from .models import ProxyRecord
+from .yaml_io import load_yaml
+from .validate import HOST_PORT_RE, is_probable_base64, is_valid_hostname_or_ip
+
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+_WHITESPACE_RE = re.compile(r"\s+")
+
 # 并发与超时相关的默认设置（降低并发数以提高稳定性）
 MAX_FETCH_WORKERS: int = 5   # 降低订阅获取并发数
 MAX_RESOLVE_WORKERS: int = 10  # 降低DNS解析并发数
 REQUEST_TIMEOUT_SECONDS: int = 15
 RESOLVE_TIMEOUT_SECONDS: int = 6
 DOH_TIMEOUT_SECONDS: int = 6
+# 解析阶段：小于该大小的订阅直接在下载线程内解析，较大的交给进程池，避免序列化开销得不偿失
+PARSE_INLINE_MAX_BYTES: int = 256 * 1024
+MAX_PARSE_WORKERS: int = os.cpu_count() or 2
 
 
 def read_subscription_links(file_path: str = "汇聚订阅.txt") -> List[str]:
@@ -45,8 +58,9 @@ def read_subscription_links(file_path: str = "汇聚订阅.txt") -> List[str]:
 
 
 def fetch_text(url: str, timeout: int = REQUEST_TIMEOUT_SECONDS) -> str:
-    resp = requests.get(url, timeout=timeout)
-    resp.raise_for_status()
+    with get_metrics().track_request("subscription"):
+        resp = requests.get(url, timeout=timeout)
+        resp.raise_for_status()
     # best effort encoding
     content_type = resp.headers.get("content-type", "")
     if "charset=" in content_type:
@@ -60,7 +74,7 @@ def try_base64_decode(text: str) -> str:
     """尝试对文本整体进行Base64解码，失败则原样返回。"""
     try:
         # 清洗空白与换行
-        compact = re.sub(r"\s+", "", text)
+        compact = _WHITESPACE_RE.sub("", text)
         decoded = base64.b64decode(compact + "==", validate=False)
         return decoded.decode("utf-8", errors="ignore")
     except Exception:
@@ -69,7 +83,7 @@ def try_base64_decode(text: str) -> str:
 
 def parse_clash_yaml(text: str) -> List[Dict]:
     """解析Clash YAML，返回 proxies 列表（原始字典）。"""
-    data = yaml.safe_load(text)
+    data = load_yaml(text)
     if not isinstance(data, dict):
         return []
     proxies = data.get("proxies") or []
@@ -85,39 +99,17 @@ def parse_subscription_lines(text: str) -> List[str]:
 def safe_base64_decode(text: str) -> Optional[str]:
     """对单行做宽松Base64解码，失败返回None。"""
     try:
-        compact = re.sub(r"\s+", "", text)
+        compact = _WHITESPACE_RE.sub("", text)
         decoded = base64.b64decode(compact + "==", validate=False)
         return decoded.decode("utf-8", errors="ignore")
     except Exception:
         return None
 
 
-def is_probable_base64(s: str) -> bool:
-    return bool(re.fullmatch(r"[A-Za-z0-9_\-+/=]+", s)) and len(s) >= 16
-
-
-def is_valid_hostname_or_ip(host: str) -> bool:
-    if not host or len(host) > 253 or " " in host:
-        return False
-    # IPv4 quick check
-    if re.fullmatch(r"(\d{1,3}\.){3}\d{1,3}", host):
-        parts = [int(p) for p in host.split('.') if p.isdigit()]
-        return len(parts) == 4 and all(0 <= p <= 255 for p in parts)
-    # Hostname check
-    if not re.fullmatch(r"[A-Za-z0-9.-]+", host):
-        return False
-    for label in host.split('.'):
-        if not label or len(label) > 63:
-            return False
-    return True
-
-
 def extract_host_from_vmess(uri: str) -> str:
     try:
         b64 = uri.split("vmess://", 1)[-1]
         payload = base64.b64decode(b64 + "==").decode("utf-8", errors="ignore")
-        import json
-
         obj = json.loads(payload)
         return obj.get("add", "")
     except Exception:
@@ -180,7 +172,7 @@ def normalize_line_to_uri(line: str) -> Optional[str]:
         if decoded and (":" in decoded and "@" in decoded):
             return "ss://" + base64.b64encode(decoded.encode()).decode()
         # host:port 形式
-        if decoded and re.fullmatch(r"[^\s:]+:\d+", decoded):
+        if decoded and HOST_PORT_RE.fullmatch(decoded):
             return "trojan://user@" + decoded
     # 其它非支持协议的HTTP链接忽略（防止误把URL当作主机）
     return None
@@ -188,8 +180,11 @@ def normalize_line_to_uri(line: str) -> Optional[str]:
 
 def extract_hosts_from_subscription(url: str) -> Set[str]:
     """从一个订阅链接提取所有 server 主机名（或IP）。"""
-    text = fetch_text(url)
+    return extract_hosts_from_text(fetch_text(url))
+
 
+def extract_hosts_from_text(text: str) -> Set[str]:
+    """从已下载的订阅内容提取所有 server 主机名（或IP）。纯CPU计算，可在子进程中运行。"""
     # 尝试直接解析成 YAML
     proxies = []
     if "proxies:" in text or "proxy-groups:" in text:
@@ -248,16 +243,17 @@ def _resolve_via_system(host: str) -> Set[str]:
     return ips
 
 
-def _resolve_via_doh_google(host: str, timeout: int = DOH_TIMEOUT_SECONDS) -> Set[str]:
-    """使用 Google DNS JSON API 作为 DoH 备用解析，仅返回 A 记录。"""
+def _resolve_via_doh_google(host: str, timeout: int = DOH_TIMEOUT_SECONDS, url: Optional[str] = None) -> Set[str]:
+    """使用 Google DNS JSON API 作为 DoH 备用解析，仅返回 A 记录。url 默认取 config.get_endpoint("doh")。"""
     try:
-        resp = requests.get(
-            "https://dns.google/resolve",
-            params={"name": host, "type": "A"},
-            timeout=timeout,
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        with get_metrics().track_request("doh"):
+            resp = requests.get(
+                url or get_endpoint("doh"),
+                params={"name": host, "type": "A"},
+                timeout=timeout,
+            )
+            resp.raise_for_status()
+            data = resp.json()
         answers = data.get("Answer") or []
         ips: Set[str] = set()
         for ans in answers:
@@ -293,35 +289,75 @@ def resolve_host_to_ips(host: str) -> Set[str]:
     return set()
 
 
-def collect_ips_from_links(links: List[str]) -> List[Tuple[str, str]]:
-    """从多个订阅链接并发汇总唯一的 (host, ip) 列表，带解析回退。"""
-    results: Set[Tuple[str, str]] = set()
+def _free_threaded() -> bool:
+    """当前解释器是否以无GIL（free-threaded）模式运行。"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _make_parse_executor() -> Executor:
+    """解析用的执行器：无GIL时线程即可并行，否则使用进程池绕开GIL。"""
+    if _free_threaded():
+        return ThreadPoolExecutor(max_workers=MAX_PARSE_WORKERS)
+    return ProcessPoolExecutor(max_workers=MAX_PARSE_WORKERS)
+
+
+def fetch_and_parse(links: List[str], parse: Callable[[str], Any]) -> Iterator[Tuple[str, Any]]:
+    """
+    下载与解析分为两个阶段：线程池并发下载订阅（I/O），下载完成的内容交给解析执行器（CPU），
+    按完成顺序产出 (url, 解析结果)。parse 必须是模块级函数以便传给子进程。
+    """
     if not links:
-        return []
+        return
+    parse_ex: Optional[Executor] = None
+    parse_futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as fetch_ex:
+            future_to_url = {fetch_ex.submit(fetch_text, url): url for url in links}
+            for future in as_completed(future_to_url):
+                url = future_to_url[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to fetch {url}: {e}")
+                    continue
+                if len(text) < PARSE_INLINE_MAX_BYTES:
+                    try:
+                        yield url, parse(text)
+                    except Exception as e:
+                        logger.error(f"Failed to parse {url}: {e}")
+                    continue
+                if parse_ex is None:
+                    parse_ex = _make_parse_executor()
+                parse_futures[parse_ex.submit(parse, text)] = url
 
-    # 第一步：并发拉取每个订阅并提取 host 集合
-    host_sets: List[Set[str]] = []
-    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as ex:
-        future_to_url = {ex.submit(extract_hosts_from_subscription, url): url for url in links}
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
+        for future in as_completed(parse_futures):
+            url = parse_futures[future]
             try:
-                hosts = future.result()
-                logger.info(f"{url} => {len(hosts)} hosts")
-                host_sets.append(hosts)
+                yield url, future.result()
             except Exception as e:
-                logger.error(f"Failed to process {url}: {e}")
+                logger.error(f"Failed to parse {url}: {e}")
+    finally:
+        if parse_ex is not None:
+            parse_ex.shutdown(wait=True, cancel_futures=True)
 
-    unique_hosts: Set[str] = set()
-    for hs in host_sets:
-        unique_hosts.update(hs)
 
-    if not unique_hosts:
-        return []
+def fetch_host_sets(links: List[str]) -> List[Set[str]]:
+    """并发拉取每个订阅并提取 host 集合，返回每个订阅各自的集合（未跨订阅去重）。"""
+    host_sets: List[Set[str]] = []
+    for url, hosts in fetch_and_parse(links, extract_hosts_from_text):
+        logger.info(f"{url} => {len(hosts)} hosts")
+        host_sets.append(hosts)
+    return host_sets
 
-    # 第二步：并发解析所有 host -> ip 列表
+
+def resolve_hosts(hosts: Set[str]) -> List[Tuple[str, str]]:
+    """并发解析所有 host，返回排序后的唯一 (host, ip) 列表；解析失败的 host 不出现。"""
+    results: Set[Tuple[str, str]] = set()
+    if not hosts:
+        return []
     with ThreadPoolExecutor(max_workers=MAX_RESOLVE_WORKERS) as ex:
-        future_to_host = {ex.submit(resolve_host_to_ips, host): host for host in unique_hosts}
+        future_to_host = {ex.submit(resolve_host_to_ips, host): host for host in hosts}
         for future in as_completed(future_to_host):
             host = future_to_host[future]
             try:
@@ -330,10 +366,26 @@ def collect_ips_from_links(links: List[str]) -> List[Tuple[str, str]]:
                     results.add((host, ip))
             except Exception as e:
                 logger.warning(f"Resolve failed for {host}: {e}")
-
     return sorted(results, key=lambda x: (x[0], x[1]))
 
 
+def collect_ips_from_links(links: List[str]) -> List[Tuple[str, str]]:
+    """从多个订阅链接并发汇总唯一的 (host, ip) 列表，带解析回退。"""
+    if not links:
+        return []
+
+    # 第一步：并发拉取每个订阅并提取 host 集合
+    unique_hosts: Set[str] = set()
+    for hs in fetch_host_sets(links):
+        unique_hosts.update(hs)
+
+    if not unique_hosts:
+        return []
+
+    # 第二步：并发解析所有 host -> ip 列表
+    return resolve_hosts(unique_hosts)
+
+
 
 
 def parse_uri_to_clash_proxy(uri: str) -> Optional[Dict]:
@@ -386,7 +438,11 @@ def extract_proxies_from_subscription(url: str) -> List[Dict]:
     except Exception as e:
         logger.error(f"Failed to fetch subscription content from {url}: {e}")
         return []
+    return parse_proxies_from_text(text)
+
 
+def parse_proxies_from_text(text: str) -> List[Dict]:
+    """Extracts full proxy configurations from downloaded subscription content (CPU only, process-safe)."""
     # Try to parse as Clash YAML first
     if "proxies:" in text or "proxy-groups:" in text:
         try:
@@ -416,26 +472,41 @@ def extract_proxies_from_subscription(url: str) -> List[Dict]:
 
 def collect_proxies_from_links(links: List[str]) -> List[Dict]:
     """From a list of subscription URLs, concurrently fetch and parse all proxies."""
-    all_proxies = []
     unique_proxies = {} # Use dict to handle duplicates by name
 
-    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
-        future_to_url = {executor.submit(extract_proxies_from_subscription, url): url for url in links}
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                proxies = future.result()
-                logger.info(f"Got {len(proxies)} proxies from {url}")
-                for proxy in proxies:
-                    if proxy.get("name") not in unique_proxies:
-                        unique_proxies[proxy["name"]] = proxy
-            except Exception as e:
-                logger.error(f"Error processing subscription {url}: {e}")
+    for url, proxies in fetch_and_parse(links, parse_proxies_from_text):
+        logger.info(f"Got {len(proxies)} proxies from {url}")
+        for proxy in proxies:
+            if isinstance(proxy, dict) and proxy.get("name") not in unique_proxies:
+                unique_proxies[proxy["name"]] = proxy
 
     all_proxies = list(unique_proxies.values())
     logger.info(f"Collected {len(all_proxies)} unique proxies in total.")
     return all_proxies
 
+def parse_proxy_records_from_text(text: str) -> List[ProxyRecord]:
+    """Like parse_proxies_from_text, but returns compact ProxyRecord objects (cheaper to pickle and keep)."""
+    records = []
+    for proxy in parse_proxies_from_text(text):
+        record = ProxyRecord.from_dict(proxy) if isinstance(proxy, dict) else None
+        if record:
+            records.append(record)
+    return records
+
+def collect_proxy_records_from_links(links: List[str]) -> List[ProxyRecord]:
+    """Same as collect_proxies_from_links, returning ProxyRecord objects de-duplicated by name."""
+    unique_records: Dict[str, ProxyRecord] = {}
+
+    for url, records in fetch_and_parse(links, parse_proxy_records_from_text):
+        logger.info(f"Got {len(records)} proxies from {url}")
+        for record in records:
+            if record.name not in unique_records:
+                unique_records[record.name] = record
+
+    all_records = list(unique_records.values())
+    logger.info(f"Collected {len(all_records)} unique proxies in total.")
+    return all_records
+
 if __name__ == "__main__":
     start_time = time.time()
     links = read_subscription_links()
@@ -0,0 +1,84 @@
+"""
+主机名 / IP 字面量校验
+订阅解析时每一行都会调用这些函数，因此正则全部预编译，IPv4 走手写的快速路径
+"""
+import ipaddress
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# 单次匹配即可校验所有标签：只含字母数字和连字符，非空且不超过63个字符
+_HOSTNAME_RE = re.compile(r"(?:[A-Za-z0-9-]{1,63}\.)*[A-Za-z0-9-]{1,63}")
+_BASE64_RE = re.compile(r"[A-Za-z0-9_\-+/=]+")
+# 行内Base64解码后得到的 host:port
+HOST_PORT_RE = re.compile(r"[^\s:]+:\d+")
+
+MAX_HOSTNAME_LENGTH = 253
+MIN_BASE64_LENGTH = 16
+
+
+def _ipv4_octets(value: str) -> Optional[List[int]]:
+    """形如 a.b.c.d（每段1-3位ASCII数字）时返回各段数值，否则返回None。"""
+    parts = value.split(".")
+    if len(parts) != 4:
+        return None
+    octets = []
+    for part in parts:
+        if not (0 < len(part) <= 3 and part.isascii() and part.isdigit()):
+            return None
+        octets.append(int(part))
+    return octets
+
+
+def is_ipv4_literal(value: str) -> bool:
+    """是否为点分十进制 IPv4 地址（每段1-3位ASCII数字且不大于255）。"""
+    octets = _ipv4_octets(value)
+    return octets is not None and max(octets) <= 255
+
+
+def is_ipv6_literal(value: str) -> bool:
+    """是否为 IPv6 地址字面量（允许方括号包裹，如 [2001:db8::1]）。"""
+    if ":" not in value:
+        return False
+    if value.startswith("[") and value.endswith("]"):
+        value = value[1:-1]
+    try:
+        ipaddress.IPv6Address(value)
+    except ValueError:
+        return False
+    return True
+
+
+def is_ip_literal(value: str) -> bool:
+    return is_ipv4_literal(value) or is_ipv6_literal(value)
+
+
+def is_valid_hostname_or_ip(host: str) -> bool:
+    """IPv4 字面量或合法主机名。形如IPv4但数值越界的字符串视为非法。"""
+    if not host or len(host) > MAX_HOSTNAME_LENGTH:
+        return False
+    if host[-1].isdigit():
+        octets = _ipv4_octets(host)
+        if octets is not None:
+            return max(octets) <= 255
+    return _HOSTNAME_RE.fullmatch(host) is not None
+
+
+def is_probable_base64(s: str) -> bool:
+    return len(s) >= MIN_BASE64_LENGTH and _BASE64_RE.fullmatch(s) is not None
+
+
+def filter_valid_hosts(hosts: Iterable[str]) -> List[str]:
+    """批量校验，保留合法的主机名/IPv4，保持原有顺序。"""
+    return [h for h in hosts if is_valid_hostname_or_ip(h)]
+
+
+def partition_ip_literals(hosts: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """把主机列表分成 (IP字面量, 需要DNS解析的主机名)，非法条目被丢弃。"""
+    ips: List[str] = []
+    names: List[str] = []
+    for host in hosts:
+        if is_ip_literal(host):
+            ips.append(host)
+        elif is_valid_hostname_or_ip(host):
+            names.append(host)
+    return ips, names
@@ -0,0 +1,102 @@
+"""
+IP查询结果缓存（SQLite）
+与 ipinfo_batch_processor 使用相同的 ip_cache 表结构，可共用同一个 ip_cache.db
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DB = "ip_cache.db"
+# SQLite 单条语句的参数个数有限，批量查询时分块
+_QUERY_CHUNK = 500
+
+
+def get_result_ttl() -> int:
+    """IP查询结果的缓存有效期（秒），取自config.json的cache.ttl.ip_results"""
+    return int(config.get("cache", {}).get("ttl", {}).get("ip_results", 3600))
+
+
+class VerdictCache:
+    """按IP缓存完整的查询结果，并记录查询时间，用于复用新鲜结果和安排复查顺序"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("IP_CHECKER_CACHE_DB") or DEFAULT_CACHE_DB
+        self._lock = threading.Lock()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ip_cache (
+                    ip TEXT PRIMARY KEY,
+                    data TEXT,
+                    timestamp DATETIME,
+                    source TEXT
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, ip: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """读取缓存结果；max_age 为秒，超过则视为未命中，None 表示不限新鲜度。"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT data, timestamp FROM ip_cache WHERE ip = ?', (ip,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        data_json, timestamp_str = row
+        if max_age is not None:
+            age = (datetime.now() - datetime.fromisoformat(timestamp_str)).total_seconds()
+            if age >= max_age:
+                return None
+        try:
+            return json.loads(data_json)
+        except (TypeError, json.JSONDecodeError):
+            return None
+
+    def put(self, ip: str, data: Dict, source: str = "fetch_ip_info") -> None:
+        """写入/覆盖一条结果，时间戳为当前本地时间。"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO ip_cache (ip, data, timestamp, source) VALUES (?, ?, ?, ?)',
+                    (ip, json.dumps(data, ensure_ascii=False), datetime.now().isoformat(), source)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def ages(self, ips: Iterable[str]) -> Dict[str, float]:
+        """批量返回已缓存IP距上次查询的秒数；从未查询过的IP不出现在结果中。"""
+        ip_list = list(ips)
+        now = datetime.now()
+        result: Dict[str, float] = {}
+        conn = self._connect()
+        try:
+            for start in range(0, len(ip_list), _QUERY_CHUNK):
+                chunk = ip_list[start:start + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f'SELECT ip, timestamp FROM ip_cache WHERE ip IN ({placeholders})', chunk
+                ).fetchall()
+                for ip, timestamp_str in rows:
+                    try:
+                        result[ip] = (now - datetime.fromisoformat(timestamp_str)).total_seconds()
+                    except (TypeError, ValueError):
+                        continue
+        finally:
+            conn.close()
+        return result
@@ -0,0 +1,253 @@
+"""
+YAML 读写层
+PyYAML 编译了 libyaml 时使用 C 实现的 Loader/Dumper（比纯Python实现快一个数量级），否则自动回退；
+大型 Clash 配置的 proxies 列表分块流式写出，输出内容与一次性 yaml.dump 完全一致；
+只有 proxies 内部或它与其它部分之间有被多处引用的对象（会输出锚点/别名）时才改为整体一次 dump，
+否则各块的锚点编号会重复。分组之间共享成员列表（clash.build_config_from_proxies 的默认输出）不影响分块
+"""
+import json
+import logging
+import re
+from typing import IO, Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import yaml
+
+from .fileutil import atomic_writer
+
+logger = logging.getLogger(__name__)
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+FastDumper = getattr(yaml, "CDumper", yaml.Dumper)
+HAS_LIBYAML = SafeLoader is not yaml.SafeLoader
+
+# 每次交给 dumper 的代理数
+PROXY_CHUNK_SIZE = 1000
+
+# libyaml 与纯Python发射器在两类字符上表现不同：
+# 1. BMP 以外的字符（如国旗emoji）：libyaml 总是转义为 \UXXXXXXXX，纯Python发射器原样输出。
+#    dump 前把它们临时替换为私用区字符（两种发射器对其处理相同），dump 后再换回；
+# 2. 控制字符、换行类字符、BOM，以及数据中本来就有的私用区字符：含有它们的数据改用纯Python发射器。
+# 两者保证输出与 yaml.dump 逐字节一致
+_ASTRAL_RE = re.compile("[\U00010000-\U0010fffe]")
+_PYTHON_ONLY_RE = re.compile("[\x00-\x1f\x7f-\x9f\u2028\u2029\ufeff\ue000-\uf8ff\U0010ffff]")
+_PUA_START = 0xE000
+_PUA_SIZE = 0xF900 - 0xE000
+
+_DUMP_OPTIONS = {"allow_unicode": True, "sort_keys": False}
+
+# 模板中独占一行的占位符，如 {{PROXY_NODES}}
+_PLACEHOLDER_LINE_RE = re.compile(r"^(\s*)\{\{([A-Z0-9_]+)\}\}\s*$")
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
+
+
+def load_yaml(text: str) -> Any:
+    """等价于 yaml.safe_load，可用时使用 libyaml。"""
+    return yaml.load(text, Loader=SafeLoader)
+
+
+class _NeedsPythonEmitter(Exception):
+    pass
+
+
+class _AstralMasker:
+    """把数据中的BMP以外字符替换为私用区字符，共享的容器仍然共享（保证锚点/别名不变）。"""
+
+    def __init__(self):
+        self._forward: Dict[str, str] = {}
+        self._memo: Dict[int, Any] = {}
+
+    def _replace(self, match) -> str:
+        ch = match.group()
+        masked = self._forward.get(ch)
+        if masked is None:
+            if len(self._forward) >= _PUA_SIZE:
+                raise _NeedsPythonEmitter()
+            masked = self._forward[ch] = chr(_PUA_START + len(self._forward))
+        return masked
+
+    def mask(self, obj: Any) -> Any:
+        if isinstance(obj, str):
+            if _PYTHON_ONLY_RE.search(obj):
+                raise _NeedsPythonEmitter()
+            return _ASTRAL_RE.sub(self._replace, obj) if _ASTRAL_RE.search(obj) else obj
+        if type(obj) not in (dict, list, tuple):
+            return obj
+        key = id(obj)
+        if key in self._memo:
+            return self._memo[key]
+        if type(obj) is dict:
+            items = [(self.mask(k), self.mask(v)) for k, v in obj.items()]
+            changed = any(nk is not k or nv is not v for (nk, nv), (k, v) in zip(items, obj.items()))
+            result = dict(items) if changed else obj
+        else:
+            values = [self.mask(v) for v in obj]
+            changed = any(nv is not v for nv, v in zip(values, obj))
+            result = type(obj)(values) if changed else obj
+        self._memo[key] = result
+        return result
+
+    def unmask(self, text: str) -> str:
+        if not self._forward:
+            return text
+        return text.translate({ord(masked): ch for ch, masked in self._forward.items()})
+
+
+def _dump_text(data: Any) -> str:
+    if FastDumper is not yaml.Dumper:
+        masker = _AstralMasker()
+        try:
+            masked = masker.mask(data)
+        except _NeedsPythonEmitter:
+            pass
+        else:
+            return masker.unmask(yaml.dump(masked, Dumper=FastDumper, **_DUMP_OPTIONS))
+    return yaml.dump(data, Dumper=yaml.Dumper, **_DUMP_OPTIONS)
+
+
+def dump_yaml(data: Any, stream: Optional[IO] = None) -> Optional[str]:
+    """与 yaml.dump(data, allow_unicode=True, sort_keys=False) 输出相同，尽量使用 libyaml。"""
+    text = _dump_text(data)
+    if stream is None:
+        return text
+    stream.write(text)
+    return None
+
+
+# SafeRepresenter.ignore_aliases 对这些类型不生成锚点，其余对象被多处引用时都会输出 &idNNN
+_UNALIASED_TYPES = (str, bytes, bool, int, float, type(None))
+
+
+def _node_ids(data: Any) -> Tuple[bool, Set[int]]:
+    """(是否有对象被引用多次, 所有可能生成锚点的对象 id)"""
+    seen: Set[int] = set()
+    shared = False
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, _UNALIASED_TYPES) or (isinstance(obj, tuple) and not obj):
+            continue
+        if id(obj) in seen:
+            shared = True
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return shared, seen
+
+
+def has_shared_nodes(data: Any) -> bool:
+    """数据中是否有同一个对象被引用多次（dump 时会输出锚点与别名）。"""
+    return _node_ids(data)[0]
+
+
+def _can_stream_proxies(config: Dict) -> bool:
+    """
+    proxies 能否分块写出：proxies 内部没有共享对象，也不与其它键共享对象；
+    其它键按 proxies 之前/之后各 dump 一次，两段中至多一段有锚点，编号才不会重复。
+    """
+    keys = list(config)
+    index = keys.index("proxies")
+    proxies_shared, proxies_ids = _node_ids(config["proxies"])
+    if proxies_shared:
+        return False
+    head_shared, head_ids = _node_ids([config[k] for k in keys[:index]])
+    tail_shared, tail_ids = _node_ids([config[k] for k in keys[index + 1:]])
+    if head_shared and tail_shared:
+        return False
+    return not (proxies_ids & head_ids or proxies_ids & tail_ids or head_ids & tail_ids)
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _write_indented(stream: IO, text: str, indent: str) -> None:
+    if not indent:
+        stream.write(text)
+        return
+    for line in text.splitlines(keepends=True):
+        stream.write(indent + line)
+
+
+def write_proxy_list(stream: IO, proxies: List[Dict], indent: str = "", chunk_size: int = PROXY_CHUNK_SIZE) -> None:
+    """
+    把代理列表以块序列（- name: ...）分块写出，每块单独 dump，不在内存中拼出整个文档。
+    列表内有共享对象时整体一次 dump，保证锚点唯一。
+    """
+    if has_shared_nodes(proxies):
+        _write_indented(stream, dump_yaml(proxies), indent)
+        return
+    for chunk in _chunks(proxies, chunk_size):
+        _write_indented(stream, dump_yaml(chunk), indent)
+
+
+def write_config(config: Dict, stream: IO, chunk_size: int = PROXY_CHUNK_SIZE) -> None:
+    """
+    流式写出 Clash 配置。proxies 列表分块写出，其余键合并为一次 dump（分组间共享的成员列表在其中正常输出锚点），
+    与 yaml.dump(config, allow_unicode=True, sort_keys=False) 的结果一致。
+    proxies 中有共享对象（如订阅中的 YAML 别名）或与其它键共享对象时整体一次 dump。
+    """
+    proxies = config.get("proxies")
+    if not (isinstance(proxies, list) and proxies and _can_stream_proxies(config)):
+        dump_yaml(config, stream)
+        return
+    pending: Dict = {}
+    for key, value in config.items():
+        if key == "proxies" and isinstance(value, list) and value:
+            if pending:
+                dump_yaml(pending, stream)
+                pending = {}
+            stream.write("proxies:\n")
+            write_proxy_list(stream, value, chunk_size=chunk_size)
+        else:
+            pending[key] = value
+    if pending:
+        dump_yaml(pending, stream)
+
+
+def save_yaml_config(config: Dict, file_path: str, chunk_size: int = PROXY_CHUNK_SIZE) -> None:
+    """原子地流式保存配置文件。"""
+    with atomic_writer(file_path) as f:
+        write_config(config, f, chunk_size)
+
+
+def _scalar(value: Any) -> str:
+    # JSON 字符串同时也是合法的 YAML 双引号标量
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, str) else str(value)
+
+
+def render_template(template_path: str, output_path: str, proxies: List[Dict],
+                    values: Optional[Dict[str, Any]] = None, proxy_indent: str = "  ",
+                    list_indent: str = "      ", chunk_size: int = PROXY_CHUNK_SIZE) -> None:
+    """
+    按 templates/clash-template.yaml 这类模板生成配置。
+
+    {{PROXY_NODES}} 占位行替换为流式写出的 proxies 列表（缩进 proxy_indent）；
+    其它独占一行且值为列表的占位符（如 {{US_NODES}}）展开为 `- "节点名"` 列表（缩进 list_indent），
+    空列表写入 DIRECT，保证分组不为空；行内占位符（如 {{TOTAL_NODES}}）直接替换为文本。
+    模板中出现但未提供的占位符会报错，避免生成半成品配置。
+    """
+    values = dict(values or {})
+    with open(template_path, "r", encoding="utf-8") as f:
+        template = f.read()
+    missing = sorted(set(_PLACEHOLDER_RE.findall(template)) - set(values) - {"PROXY_NODES"})
+    if missing:
+        raise KeyError(f"Template {template_path} needs values for: {', '.join(missing)}")
+
+    with atomic_writer(output_path) as out:
+        for line in template.splitlines(keepends=True):
+            match = _PLACEHOLDER_LINE_RE.match(line)
+            if match and match.group(2) == "PROXY_NODES":
+                write_proxy_list(out, proxies, indent=match.group(1) + proxy_indent, chunk_size=chunk_size)
+            elif match and isinstance(values.get(match.group(2)), (list, tuple)):
+                names = values[match.group(2)] or ["DIRECT"]
+                prefix = match.group(1) + list_indent
+                for name in names:
+                    out.write(f"{prefix}- {_scalar(name)}\n")
+            else:
+                out.write(_PLACEHOLDER_RE.sub(lambda m: str(values[m.group(1)]), line))
+    logger.info(f"Rendered {template_path} with {len(proxies)} proxies to {output_path}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与 scripts/ 相同：把项目根目录加入 sys.path，以 src.ip_checker.X 导入
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,67 @@
+from src.ip_checker.checkpoint import CheckpointJournal, journal_path_for
+
+
+def test_journal_path_for():
+    assert journal_path_for("out/report.csv") == "out/report.csv.journal.jsonl"
+
+
+def test_resume_loads_recorded_results(tmp_path):
+    path = str(tmp_path / "report.csv.journal.jsonl")
+    with CheckpointJournal(path) as journal:
+        journal.record("1.1.1.1", {"pure": "yes", "country": "澳大利亚"})
+        journal.record("8.8.8.8", None)
+
+    with CheckpointJournal(path, resume=True) as journal:
+        assert len(journal) == 2
+        assert "8.8.8.8" in journal
+        assert journal.get("1.1.1.1") == {"pure": "yes", "country": "澳大利亚"}
+        journal.record("9.9.9.9", {"pure": "no"})
+
+    with CheckpointJournal(path, resume=True) as journal:
+        assert dict(journal.items()) == {
+            "1.1.1.1": {"pure": "yes", "country": "澳大利亚"},
+            "8.8.8.8": None,
+            "9.9.9.9": {"pure": "no"},
+        }
+
+
+def test_without_resume_starts_over(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with CheckpointJournal(path) as journal:
+        journal.record("a", 1)
+    with CheckpointJournal(path) as journal:
+        assert len(journal) == 0
+    with CheckpointJournal(path, resume=True) as journal:
+        assert len(journal) == 0
+
+
+def test_truncated_and_malformed_lines_are_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    with CheckpointJournal(str(path)) as journal:
+        journal.record("a", 1)
+        journal.record("b", 2)
+    with open(path, "a", encoding="utf-8") as f:
+        # 进程在写最后一行时被杀死
+        f.write('{"result": 3}\n[1, 2]\n{"key": "c", "res')
+
+    with CheckpointJournal(str(path), resume=True) as journal:
+        assert dict(journal.items()) == {"a": 1, "b": 2}
+
+
+def test_later_record_wins(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with CheckpointJournal(path) as journal:
+        journal.record("a", "stale")
+        journal.record("a", "fresh")
+    with CheckpointJournal(path, resume=True) as journal:
+        assert journal.get("a") == "fresh"
+
+
+def test_discard_removes_the_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(str(path))
+    journal.record("a", 1)
+    journal.discard()
+    assert not path.exists()
+    # 重复调用不报错
+    journal.discard()
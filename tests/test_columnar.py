@@ -0,0 +1,28 @@
+from src.ip_checker.columnar import FLAG_HOSTING, FLAG_PURE, RISK_UNKNOWN, VerdictTable
+
+
+def _table():
+    table = VerdictTable()
+    table.append_row("1.1.1.1", "US", "AS1", FLAG_PURE, 5)
+    table.append_row("2.2.2.2", "JP", "AS2", FLAG_HOSTING, 80)
+    table.append_row("3.3.3.3", None, None, FLAG_PURE | FLAG_HOSTING, RISK_UNKNOWN)
+    return table
+
+
+def test_masks_combine():
+    table = _table()
+    pure = table.mask_flags(all_of=FLAG_PURE)
+    assert table.select_ips(pure) == ["1.1.1.1", "3.3.3.3"]
+    assert table.select_ips(table.mask_and(pure, table.mask_flags(none_of=FLAG_HOSTING))) == ["1.1.1.1"]
+    assert table.select_ips(table.mask_or(table.mask_country("JP"), table.mask_country("Unknown"))) == \
+        ["2.2.2.2", "3.3.3.3"]
+    assert table.select_ips(table.mask_risk(10, include_unknown=True)) == ["1.1.1.1", "3.3.3.3"]
+
+
+def test_empty_mask_combinations():
+    table = _table()
+    assert table.mask_or() == bytes(len(table))
+    assert table.mask_and() == b"\x01" * len(table)
+    empty = VerdictTable()
+    assert empty.mask_or() == b""
+    assert empty.mask_and() == b""
@@ -0,0 +1,139 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.ip_checker.exitfarm import (LISTEN_HOST, assign_ports, build_listener_config, free_ports, local_proxy,
+                                     probe_exits)
+
+ECHO_URL = "http://echo.test/ip"
+
+
+class StubExitProxies:
+    """
+    代替 mihomo 的监听端口：每个端口一个 HTTP 转发代理，对经由它请求 ECHO_URL 的客户端
+    回显该端口对应的出口IP，并记录同时在处理的请求数
+    """
+
+    def __init__(self, ports, hold=0.0):
+        self.hold = hold
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.targets = []
+        self.servers = [self._server(port, f"198.51.100.{i + 1}") for i, port in enumerate(ports)]
+
+    def _server(self, port, exit_ip):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.forward(self, exit_ip)
+
+        return ThreadingHTTPServer((LISTEN_HOST, port), Handler)
+
+    def forward(self, request, exit_ip):
+        with self.lock:
+            # 转发代理收到的是绝对 URI
+            self.targets.append(request.path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.hold)
+            data = json.dumps({"ip": exit_ip}).encode()
+            request.send_response(200)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(data)))
+            request.end_headers()
+            request.wfile.write(data)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def __enter__(self):
+        for server in self.servers:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_env_proxies(monkeypatch):
+    for name in ("NO_PROXY", "no_proxy", "HTTP_PROXY", "http_proxy", "ALL_PROXY", "all_proxy"):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def busy_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((LISTEN_HOST, 0))
+        sock.listen()
+        yield sock.getsockname()[1]
+
+
+def _proxies(count):
+    return [{"name": f"node-{i}", "type": "ss", "server": f"192.0.2.{i}", "port": 443} for i in range(count)]
+
+
+def test_assign_ports_counts_up_from_port_start():
+    proxies = _proxies(3) + [{"name": "node-0", "type": "ss"}, {"type": "ss"}]
+    assert assign_ports(proxies, port_start=42000) == {"node-0": 42000, "node-1": 42001, "node-2": 42002}
+    with pytest.raises(ValueError):
+        assign_ports(_proxies(3), port_start=65534)
+
+
+def test_assign_ports_skips_busy_ports(busy_port):
+    ports = assign_ports(_proxies(3), port_start=busy_port, host=LISTEN_HOST)
+    assert busy_port not in ports.values()
+    assert list(ports.values()) == sorted(ports.values())
+    assert min(ports.values()) > busy_port
+    assert list(ports.values()) == free_ports(LISTEN_HOST, busy_port, 3)
+
+
+def test_build_listener_config_pins_each_port_to_its_proxy():
+    proxies = _proxies(3)
+    config = build_listener_config(proxies, {"node-0": 42000, "node-2": 42001})
+    assert [p["name"] for p in config["proxies"]] == ["node-0", "node-2"]
+    assert [(l["port"], l["proxy"], l["listen"]) for l in config["listeners"]] == \
+        [(42000, "node-0", LISTEN_HOST), (42001, "node-2", LISTEN_HOST)]
+    assert "external-controller" not in config
+    assert config["rules"] == ["MATCH,DIRECT"]
+
+
+def test_probe_exits_in_parallel_through_local_ports():
+    ports = assign_ports(_proxies(8), port_start=43000, host=LISTEN_HOST)
+    with StubExitProxies(ports.values(), hold=0.1) as stub:
+        results = probe_exits(ports, max_threads=4, ipv4_url=ECHO_URL, timeout=5)
+
+    assert {name: r.exit_ip for name, r in results.items()} == \
+        {f"node-{i}": f"198.51.100.{i + 1}" for i in range(8)}
+    assert all(r.error is None for r in results.values())
+    assert [r.port for r in results.values()] == list(ports.values())
+    assert set(stub.targets) == {ECHO_URL}
+    assert stub.max_in_flight == 4
+
+
+def test_probe_exits_reports_dead_listener():
+    live, dead = free_ports(LISTEN_HOST, 43100, 2)
+    with StubExitProxies([live]):
+        results = probe_exits({"live": live, "dead": dead}, max_threads=2, ipv4_url=ECHO_URL, timeout=2)
+    assert results["live"].exit_ip == "198.51.100.1"
+    assert (results["dead"].exit_ip, results["dead"].error) == (None, "exit IPv4 lookup failed")
+
+
+def test_local_proxy_schemes():
+    assert local_proxy(42000) == {"http": "http://127.0.0.1:42000", "https": "http://127.0.0.1:42000"}
+    assert local_proxy(42000, scheme="socks5h")["https"] == "socks5h://127.0.0.1:42000"
+    with pytest.raises(ValueError):
+        local_proxy(42000, scheme="socks4")
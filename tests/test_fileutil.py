@@ -0,0 +1,34 @@
+import os
+import stat
+
+from src.ip_checker.fileutil import atomic_write_json, atomic_write_text, read_json
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_gets_default_mode(tmp_path):
+    path = tmp_path / "config.yaml"
+    atomic_write_text(str(path), "port: 7890\n")
+    umask = os.umask(0)
+    os.umask(umask)
+    assert _mode(path) == 0o644 & ~umask
+    assert path.read_text(encoding="utf-8") == "port: 7890\n"
+
+
+def test_existing_file_keeps_its_mode(tmp_path):
+    path = tmp_path / "provider.yaml"
+    path.write_text("old\n", encoding="utf-8")
+    os.chmod(path, 0o664)
+    atomic_write_text(str(path), "new\n")
+    assert _mode(path) == 0o664
+    assert path.read_text(encoding="utf-8") == "new\n"
+
+
+def test_json_round_trip_and_missing_file(tmp_path):
+    path = tmp_path / "state.json"
+    atomic_write_json(str(path), {"b": 1, "a": ["x"]})
+    assert read_json(str(path)) == {"a": ["x"], "b": 1}
+    assert read_json(str(tmp_path / "missing.json"), {}) == {}
+    assert [p.name for p in tmp_path.iterdir()] == ["state.json"]
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from src.ip_checker.htmlscan import compile_path, extract_fields
+from src.ip_checker.ip_utils import _parse_ping0_risk, _parse_scamalytics_risk
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'fixtures')
+
+
+def _extract(html_content, **paths):
+    return extract_fields(html_content, {key: compile_path(path) for key, path in paths.items()})
+
+
+def test_compile_path():
+    assert compile_path('/html/body/div[2]') == (("/", "html", None, None), ("/", "body", None, None),
+                                                  ("/", "div", None, 2))
+    assert compile_path('//DIV[@class="a b"]//span') == (("//", "div", "a b", None), ("//", "span", None, None))
+    for bad in ("", "div", "//div[@id='x']", "/html/body[last()]"):
+        with pytest.raises(ValueError):
+            compile_path(bad)
+
+
+def test_absolute_path_counts_same_tag_siblings():
+    page = ("<html><body><div>first</div><p>x</p><div>second <b>bold</b></div>"
+            "<div><span>a</span><br><span>b</span></div></body></html>")
+    assert _extract(page, second='/html/body/div[2]', span='/html/body/div[3]/span[2]',
+                    missing='/html/body/div[4]') == {"second": "second bold", "span": "b", "missing": None}
+
+
+def test_descendant_axis_and_exact_class():
+    page = ('<div class="line"><span class="value">no</span></div>'
+            '<div class="line line-risk"><section><span class="value extra">no</span>'
+            '<span class="value">42%</span></section></div>')
+    assert _extract(page, risk='//div[@class="line line-risk"]//span[@class="value"]') == {"risk": "42%"}
+
+
+def test_first_match_in_document_order_and_nested_targets():
+    page = '<ul><li>one <li>two</li></li><li>three</li></ul>'
+    assert _extract(page, first='//li', outer='/ul/li[2]') == {"first": "one two", "outer": "three"}
+
+
+def test_markup_that_is_not_elements():
+    page = ('<!DOCTYPE html><html><body><!-- <div>comment</div> -->'
+            '<script>var s = "<div>script</div>";</script>'
+            '<div title="a > b" class=\'x\'>AT&amp;T &lt;ok&gt;</div></body></html>')
+    assert _extract(page, text='//div[@class="x"]', first='/html/body/div[1]') == \
+        {"text": "AT&T <ok>", "first": "AT&T <ok>"}
+
+
+def test_tolerates_unclosed_and_stray_tags():
+    page = '<HTML><Body><div><p>open</div></span><div><img src="x"/><p>target</p></div>'
+    assert _extract(page, target='/html/body/div[2]/p', open='/html/body/div[1]/p') == \
+        {"target": "target", "open": "open"}
+
+
+def _fixtures(prefix):
+    return sorted(name for name in os.listdir(FIXTURES) if name.startswith(prefix) and name.endswith(".html"))
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def expected():
+    with open(os.path.join(FIXTURES, "expected.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("name", _fixtures("ping0_"))
+def test_ping0_fixtures(name, expected):
+    assert _parse_ping0_risk(_read(name)) == expected[name]
+
+
+@pytest.mark.parametrize("name", _fixtures("scamalytics_"))
+def test_scamalytics_fixtures(name, expected):
+    assert _parse_scamalytics_risk(_read(name)) == expected[name]
+
+
+@pytest.mark.parametrize("name", _fixtures("ping0_"))
+def test_matches_lxml_xpath(name):
+    lxml_html = pytest.importorskip("lxml.html")
+    paths = {
+        "ping0Risk": '//div[@class="line line-risk"]//div[@class="riskitem riskcurrent"]/span[@class="value"]',
+        "ipType": '/html/body/div[2]/div[2]/div[1]/div[2]/div[8]/div[2]/span',
+        "nativeIP": '/html/body/div[2]/div[2]/div[1]/div[2]/div[10]/div[2]/span',
+    }
+    page = _read(name)
+    tree = lxml_html.fromstring(page)
+    for key, path in paths.items():
+        elements = tree.xpath(path)
+        want = elements[0].text_content().strip() if elements else None
+        assert _extract(page, **{key: path})[key] == want
@@ -0,0 +1,111 @@
+import json
+import os
+
+from src.ip_checker import incremental, providers
+from src.ip_checker.incremental import (build_model, diff_models, generate_incremental, model_path_for,
+                                        save_clash_incremental)
+
+
+def _proxy(name, purity="pure", country="US", **extra):
+    return dict({"name": name, "type": "ss", "server": f"{name}.example.com", "port": 443,
+                 "purity": purity, "countryCode": country}, **extra)
+
+
+def test_build_model_keeps_first_of_each_name():
+    model = build_model([_proxy("a"), _proxy("a", country="JP"), {"type": "ss"}, _proxy("b")])
+    assert list(model) == ["a", "b"]
+    assert model["a"]["countryCode"] == "US"
+
+
+def test_diff_models_classifies_changes():
+    old = build_model([_proxy("kept"), _proxy("gone"), _proxy("moved"), _proxy("edited")])
+    new = build_model([_proxy("edited", isp="New ISP"), _proxy("moved", purity="non-pure"),
+                       _proxy("kept"), _proxy("fresh")])
+    diff = diff_models(old, new)
+    assert diff.added == ["fresh"]
+    assert diff.removed == ["gone"]
+    assert diff.reclassified == {"moved": {"purity": ["pure", "non-pure"]}}
+    assert diff.updated == ["edited"]
+    assert not diff.is_empty
+    assert diff.summary() == "1 added, 1 removed, 1 reclassified, 1 updated"
+
+
+def test_diff_models_ignores_order_and_reports_settings():
+    proxies = [_proxy("a"), _proxy("b", country="JP")]
+    assert diff_models(build_model(proxies), build_model(proxies[::-1])).is_empty
+    diff = diff_models(build_model(proxies), build_model(proxies), settings_changed=True)
+    assert not diff.is_empty
+    assert diff.to_dict()["settings_changed"] is True
+
+
+def test_generate_incremental_skips_unchanged_output(tmp_path):
+    output = str(tmp_path / "clash.yml")
+    writes = []
+
+    def write(proxies):
+        writes.append(len(proxies))
+        with open(output, "w", encoding="utf-8") as f:
+            f.write("proxies: []\n")
+
+    proxies = [_proxy("a"), _proxy("b")]
+    assert generate_incremental(proxies, output, write, settings={"mode": 1}).added == ["a", "b"]
+    assert generate_incremental(proxies, output, write, settings={"mode": 1}).is_empty
+    assert writes == [2]
+
+    assert generate_incremental(proxies, output, write, settings={"mode": 2}).settings_changed
+    generate_incremental(proxies, output, write, settings={"mode": 2}, force=True)
+    os.remove(output)
+    generate_incremental(proxies, output, write, settings={"mode": 2})
+    assert writes == [2, 2, 2, 2]
+
+    with open(model_path_for(output), "r", encoding="utf-8") as f:
+        assert json.load(f)["settings"] == {"mode": 2}
+
+
+def test_unreadable_model_regenerates(tmp_path):
+    output = tmp_path / "clash.yml"
+    output.write_text("old\n", encoding="utf-8")
+    (tmp_path / "clash.yml.model.json").write_text("{not json", encoding="utf-8")
+    written = []
+    diff = generate_incremental([_proxy("a")], str(output), written.append)
+    assert diff.added == ["a"]
+    assert len(written) == 1
+
+
+def test_save_clash_incremental_tracks_base_config_and_effective_group_by(tmp_path, monkeypatch):
+    output = str(tmp_path / "clash.yml")
+    providers_dir = str(tmp_path / "providers")
+    clash_config = {"group_by": ["country", "purity"]}
+    monkeypatch.setattr(incremental, "get_clash_config", lambda: clash_config)
+    monkeypatch.setattr(providers, "get_clash_config", lambda: clash_config)
+    proxies = [_proxy("a"), _proxy("b", purity="non-pure", country="JP")]
+
+    save_clash_incremental(proxies, output, providers_dir)
+    assert save_clash_incremental(proxies, output, providers_dir).is_empty
+
+    # provider 输出无法按 asn 分组，修改它不应触发重写
+    clash_config["group_by"] = ["country", "purity", "asn"]
+    assert save_clash_incremental(proxies, output, providers_dir).is_empty
+
+    # 基础配置（DNS / 规则等）变化时需要重写
+    original = incremental.base_config
+
+    def changed_base_config(proxies_list=None):
+        config = original(proxies_list)
+        config["rules"] = ["MATCH,✈️ PROXY"]
+        return config
+
+    monkeypatch.setattr(incremental, "base_config", changed_base_config)
+    assert save_clash_incremental(proxies, output, providers_dir).settings_changed
+
+
+def test_latencies_are_part_of_the_model(tmp_path):
+    output = str(tmp_path / "clash.yml")
+    proxies = [_proxy("a"), _proxy("b")]
+    save_clash_incremental(proxies, output)
+    diff = save_clash_incremental(proxies, output, latencies={"a": 123.6})
+    assert diff.updated == ["a"]
+    assert "latency" not in proxies[0]
+    assert save_clash_incremental(proxies, output, latencies={"a": 123.6}).is_empty
+    with open(model_path_for(output), "r", encoding="utf-8") as f:
+        assert json.load(f)["proxies"]["a"]["latency"] == 123
@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+from src.ip_checker import latency
+from src.ip_checker.latency import DelayTester, rank_proxies
+
+
+class FakeController:
+    """
+    最小的 mihomo 控制器：GET /proxies 列出代理，GET /proxies/{name}/delay 按 script 返回延迟。
+    script[name] 为每次采样的结果列表（循环使用）：整数为延迟，"dead" 返回 503，
+    ("sleep", 秒) 先阻塞再返回 0
+    """
+
+    def __init__(self, script, hold=0.0):
+        self.script = script
+        self.hold = hold
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.params = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        controller = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                controller.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def handle(self, request):
+        parsed = urlparse(request.path)
+        if parsed.path == "/proxies":
+            proxies = {name: {"type": "Shadowsocks"} for name in self.script}
+            proxies["GLOBAL"] = {"type": "Selector"}
+            return self._send(request, 200, {"proxies": proxies})
+
+        name = unquote(parsed.path[len("/proxies/"):-len("/delay")])
+        with self.lock:
+            index = self.calls.get(name, 0)
+            self.calls[name] = index + 1
+            self.params.append(parse_qs(parsed.query))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            outcome = self.script[name][index % len(self.script[name])]
+            time.sleep(self.hold)
+            if outcome == "dead":
+                return self._send(request, 503, {"message": "An error occurred in the delay test"})
+            if isinstance(outcome, tuple):
+                time.sleep(outcome[1])
+                outcome = 0
+            return self._send(request, 200, {"delay": outcome})
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _send(request, status, body):
+        data = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _tester(controller, **kwargs):
+    return DelayTester(controller=controller.url, secret="", **kwargs)
+
+
+def test_repeat_sampling_median_p90_and_failures():
+    script = {"fast": [30, 10, 20], "flaky": [100, "dead", 300], "dead": ["dead"], "zero": [0]}
+    with FakeController(script) as controller, _tester(controller, max_threads=4) as tester:
+        stats = tester.measure_all(samples=3)
+
+    assert set(stats) == set(script)
+    assert controller.calls == {name: 3 for name in script}
+    assert (stats["fast"].median, stats["fast"].p90, stats["fast"].loss) == (20.0, 30.0, 0)
+    assert stats["flaky"].samples == [100, None, 300]
+    assert (stats["flaky"].median, round(stats["flaky"].loss, 3)) == (200.0, 0.333)
+    assert not stats["dead"].alive and stats["dead"].loss == 1
+    # 0ms 是有效的测量结果，不是失败
+    assert stats["zero"].samples == [0, 0, 0] and stats["zero"].alive
+    assert [s.name for s in rank_proxies(stats)] == ["fast", "zero", "flaky"]
+
+
+def test_concurrency_is_bounded_by_max_threads():
+    script = {f"node-{i}": [5] for i in range(12)}
+    with FakeController(script, hold=0.05) as controller, _tester(controller, max_threads=3) as tester:
+        stats = tester.measure_all(samples=2)
+    assert all(s.alive for s in stats.values())
+    assert controller.max_in_flight == 3
+
+
+def test_per_call_timeout(monkeypatch):
+    monkeypatch.setattr(latency, "API_TIMEOUT", 0.2)
+    script = {"hung": [("sleep", 1.0), 40], "ok": [15]}
+    with FakeController(script) as controller, _tester(controller, max_threads=2, timeout_ms=100) as tester:
+        started = time.monotonic()
+        stats = tester.measure_all(["hung", "ok"], samples=2)
+        elapsed = time.monotonic() - started
+
+    # 控制器收到的测速超时是 timeout_ms，HTTP 请求在 API_TIMEOUT + timeout_ms 后放弃
+    assert {p["timeout"][0] for p in controller.params} == {"100"}
+    assert stats["hung"].samples == [None, 40]
+    assert stats["hung"].error
+    assert stats["ok"].samples == [15, 15]
+    assert elapsed < 1.0
+
+
+@pytest.mark.parametrize("name", ["🇺🇸 US 01", "a/b?c"])
+def test_proxy_names_are_url_quoted(name):
+    with FakeController({name: [7]}) as controller, _tester(controller) as tester:
+        assert tester.measure_once(name) == 7
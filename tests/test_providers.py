@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from src.ip_checker.providers import (MANIFEST_NAME, build_provider_config, partition_proxies, provider_group_by,
+                                      save_provider_output)
+from src.ip_checker.yaml_io import load_yaml
+
+PROXIES = [
+    {"name": "a", "type": "ss", "server": "1.1.1.1", "port": 1, "purity": "pure", "countryCode": "us"},
+    {"name": "b", "type": "ss", "server": "1.1.1.2", "port": 1, "purity": "non-pure", "countryCode": "JP"},
+    {"name": "c", "type": "ss", "server": "1.1.1.3", "port": 1, "countryCode": None},
+]
+
+
+def _group_names(config):
+    return [group["name"] for group in config["proxy-groups"]]
+
+
+def test_partition_proxies():
+    assert {name: [p["name"] for p in proxies] for name, proxies in partition_proxies(PROXIES).items()} == \
+        {"non-pure-JP": ["b"], "pure-US": ["a"], "unknown-UNKNOWN": ["c"]}
+
+
+def test_group_by_order_and_unsupported_dimensions():
+    names = list(partition_proxies(PROXIES))
+    config = build_provider_config(names, "./providers", group_by=["purity", "asn", "country"])
+    assert _group_names(config) == ["✈️ PROXY", "⚡ URL-TEST", "✅ PURE", "❌ NON-PURE",
+                                    "AUTO-JP", "AUTO-UNKNOWN", "AUTO-US"]
+    assert _group_names(build_provider_config(names, "./providers", group_by=["purity"])) == \
+        ["✈️ PROXY", "⚡ URL-TEST", "✅ PURE", "❌ NON-PURE"]
+    assert provider_group_by(["latency", "country"]) == ["country"]
+    with pytest.raises(ValueError):
+        provider_group_by(["colour"])
+
+
+def test_http_providers():
+    config = build_provider_config(["pure-US"], "./providers", url_base="https://example.com/p/", group_by=[])
+    entry = config["proxy-providers"]["pure-US"]
+    assert (entry["type"], entry["url"]) == ("http", "https://example.com/p/pure-US.yaml")
+
+
+def test_save_provider_output_rewrites_only_changes(tmp_path):
+    output = str(tmp_path / "clash.yml")
+    providers_dir = str(tmp_path / "providers")
+    first = save_provider_output(PROXIES, output, providers_dir, group_by=["country", "purity"])
+    assert sorted(first["written"]) == sorted([output, "non-pure-JP.yaml", "pure-US.yaml", "unknown-UNKNOWN.yaml"])
+
+    with open(os.path.join(providers_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    # 主配置以相对 manifest 目录的路径记录
+    assert list(manifest["configs"]) == ["../clash.yml"]
+
+    changed = [dict(PROXIES[0], server="9.9.9.9")] + PROXIES[1:2]
+    second = save_provider_output(changed, output, providers_dir, group_by=["country", "purity"])
+    assert second["written"] == ["pure-US.yaml", output]
+    assert second["unchanged"] == ["non-pure-JP.yaml"]
+    assert second["removed"] == ["unknown-UNKNOWN.yaml"]
+    assert not os.path.exists(os.path.join(providers_dir, "unknown-UNKNOWN.yaml"))
+
+    with open(output, "r", encoding="utf-8") as f:
+        config = load_yaml(f.read())
+    assert config["proxy-providers"]["pure-US"]["path"] == "./providers/pure-US.yaml"
@@ -0,0 +1,71 @@
+import json
+
+from src.ip_checker import quota
+from src.ip_checker.quota import QuotaLedger, plan_within_budget
+
+
+def test_record_and_remaining(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / "ledger.json"))
+    assert ledger.remaining("ipinfo", "token") is None
+    ledger.record("ipinfo", "token", count=3)
+    assert ledger.usage("ipinfo", "token") == {"daily": 3, "monthly": 3}
+    assert ledger.remaining("ipinfo", "token", daily_limit=10, monthly_limit=5) == 2
+    assert ledger.remaining("ipinfo", "token", monthly_limit=2) == 0
+    # 不同 key 分开计数
+    assert ledger.usage("ipinfo", "other") == {"daily": 0, "monthly": 0}
+
+
+def test_mark_exhausted_blocks_until_next_day(tmp_path, monkeypatch):
+    path = str(tmp_path / "ledger.json")
+    ledger = QuotaLedger(path)
+    ledger.mark_exhausted("proxycheck", "key")
+    assert ledger.remaining("proxycheck", "key", daily_limit=1000) == 0
+    # 标记立即落盘，新进程同样看到
+    assert QuotaLedger(path).remaining("proxycheck", "key", daily_limit=1000) == 0
+
+    monkeypatch.setattr(quota, "_windows", lambda: ("2999-01-01", "2999-01"))
+    assert ledger.remaining("proxycheck", "key", daily_limit=1000) == 1000
+
+
+def test_save_persists_key_fingerprint_only(tmp_path):
+    path = tmp_path / "ledger.json"
+    ledger = QuotaLedger(str(path))
+    ledger.record("ipinfo", "secret-token")
+    ledger.save()
+    text = path.read_text(encoding="utf-8")
+    assert "secret-token" not in text
+    assert QuotaLedger(str(path)).usage("ipinfo", "secret-token") == {"daily": 1, "monthly": 1}
+
+
+def test_concurrent_ledgers_merge_increments(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    first, second = QuotaLedger(path), QuotaLedger(path)
+    first.record("ipinfo", None, count=4)
+    second.record("ipinfo", None, count=6)
+    first.save()
+    second.save()
+    assert QuotaLedger(path).usage("ipinfo", None) == {"daily": 10, "monthly": 10}
+
+
+def test_counts_roll_over_with_the_window(tmp_path, monkeypatch):
+    path = tmp_path / "ledger.json"
+    monkeypatch.setattr(quota, "_windows", lambda: ("2024-01-31", "2024-01"))
+    ledger = QuotaLedger(str(path))
+    ledger.record("ipinfo", None, count=5)
+    ledger.save()
+
+    monkeypatch.setattr(quota, "_windows", lambda: ("2024-02-01", "2024-02"))
+    ledger = QuotaLedger(str(path))
+    assert ledger.usage("ipinfo", None) == {"daily": 0, "monthly": 0}
+    ledger.record("ipinfo", None)
+    ledger.save()
+    (entry,) = json.loads(path.read_text(encoding="utf-8")).values()
+    assert (entry["day"], entry["daily"], entry["monthly"]) == ("2024-02-01", 1, 1)
+
+
+def test_plan_within_budget():
+    items = ["a", "b", "c"]
+    assert plan_within_budget(items, None) == (items, [])
+    assert plan_within_budget(items, 5) == (items, [])
+    assert plan_within_budget(items, 1) == (["a"], ["b", "c"])
+    assert plan_within_budget(items, 0) == ([], items)
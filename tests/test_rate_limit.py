@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.ip_checker import quota
+from src.ip_checker.ipinfo_provider import IPInfoProvider
+from src.ip_checker.mockserver import MockProviderServer
+from src.ip_checker.proxycheck_provider import ProxyCheckProvider
+
+
+@pytest.fixture
+def ledger_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "quota_ledger.json")
+    monkeypatch.setenv("IP_CHECKER_QUOTA_LEDGER", path)
+    monkeypatch.setattr(quota, "_quota_ledger", None)
+    return path
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockProviderServer() as srv:
+        yield srv
+
+
+def _run_concurrently(fn, count, workers=8):
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(fn, [f"10.0.0.{i}" for i in range(count)]))
+
+
+def test_proxycheck_workers_share_interval_and_quota(server, ledger_path):
+    provider = ProxyCheckProvider(api_key="k", base_url=server.endpoints()["proxycheck"])
+    provider.min_interval = 0.05
+    provider.daily_limit = 6
+    sent = []
+    session_get = provider.session.get
+
+    def recording_get(*args, **kwargs):
+        sent.append(time.monotonic())
+        return session_get(*args, **kwargs)
+
+    provider.session.get = recording_get
+
+    results = _run_concurrently(provider.check_ip, 16)
+
+    # 16 个并发查询只剩 6 次配额：恰好发出 6 次，账本记录 6 次
+    assert len(sent) == 6
+    assert sum(r is not None for r in results) == 6
+    assert provider.ledger.usage("proxycheck", "k")["daily"] == 6
+    assert provider.remaining_quota() == 0
+    gaps = [b - a for a, b in zip(sorted(sent), sorted(sent)[1:])]
+    assert min(gaps) >= 0.045
+
+
+def test_ipinfo_workers_do_not_overspend_monthly_quota(server, ledger_path):
+    provider = IPInfoProvider(api_token="t", base_url=server.endpoints()["ipinfo"])
+    provider.min_interval = 0.01
+    provider.monthly_limit = 3
+
+    results = _run_concurrently(provider.fetch_ip_info, 12)
+
+    assert sum(r is not None for r in results) == 3
+    assert provider.ledger.usage("ipinfo", "t")["monthly"] == 3
+
+
+def test_reserve_is_atomic(tmp_path):
+    ledger = quota.QuotaLedger(str(tmp_path / "ledger.json"))
+    ledger.record("ipinfo", None, count=9)
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        granted = list(ex.map(lambda _: ledger.reserve("ipinfo", None, daily_limit=10), range(8)))
+    assert granted.count(True) == 1
+    assert ledger.usage("ipinfo", None)["daily"] == 10
@@ -0,0 +1,81 @@
+import csv
+
+from src.ip_checker.report import REPORT_FIELDS, CsvReportWriter
+
+
+def _redo_unknown(row):
+    return row.get("pure") == "unknown"
+
+
+def _row(host, pure="yes", **extra):
+    return dict({"host": host, "ip": f"{host}.ip", "pure": pure, "countryCode": "US"}, **extra)
+
+
+def _read_rows(path):
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def _truncated_report(tmp_path):
+    """进程在写第四行时被杀死：前三行完整，最后一行只写了一半且没有换行"""
+    path = tmp_path / "report.csv"
+    with CsvReportWriter(str(path)) as sink:
+        sink.write_rows([_row("a"), _row("b", pure="unknown"), _row("c", pure="no", city="Zürich")])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("d,d.ip,ye")
+    return path
+
+
+def test_resume_drops_torn_last_line(tmp_path):
+    path = _truncated_report(tmp_path)
+    with CsvReportWriter(str(path), resume=True) as sink:
+        assert sink.completed_keys == {("a", "a.ip"), ("b", "b.ip"), ("c", "c.ip")}
+        assert not sink.is_done("d", "d.ip")
+        sink.write_row(_row("d"))
+
+    rows = _read_rows(path)
+    assert [r["host"] for r in rows] == ["a", "b", "c", "d"]
+    assert rows[2]["city"] == "Zürich"
+    # 续写不重复写 BOM 与表头
+    assert path.read_bytes().count(b"\xef\xbb\xbf") == 1
+    assert path.read_text(encoding="utf-8-sig").count("host,ip") == 1
+
+
+def test_resume_skips_completed_keys(tmp_path):
+    path = _truncated_report(tmp_path)
+    with CsvReportWriter(str(path), resume=True) as sink:
+        todo = [host for host in ("a", "b", "c", "d", "e") if not sink.is_done(host, f"{host}.ip")]
+        sink.write_rows(_row(host) for host in todo)
+        assert sink.resumed_counts == {"yes": 1, "unknown": 1, "no": 1}
+
+    assert todo == ["d", "e"]
+    hosts = [r["host"] for r in _read_rows(path)]
+    assert len(hosts) == len(set(hosts)) == 5
+
+
+def test_redo_rewrites_unknown_rows(tmp_path):
+    path = _truncated_report(tmp_path)
+    with CsvReportWriter(str(path), resume=True, redo=_redo_unknown) as sink:
+        assert not sink.is_done("b", "b.ip")
+        assert sink.resumed_counts == {"yes": 1, "no": 1}
+        sink.write_row(_row("b"))
+
+    rows = _read_rows(path)
+    assert [(r["host"], r["pure"]) for r in rows] == [("a", "yes"), ("c", "no"), ("b", "yes")]
+    assert not (tmp_path / "report.csv.tmp").exists()
+
+
+def test_different_header_starts_over(tmp_path):
+    path = tmp_path / "report.csv"
+    path.write_text("host,pure\nx,yes\n", encoding="utf-8")
+    with CsvReportWriter(str(path), resume=True) as sink:
+        assert not sink.completed_keys
+    assert path.read_text(encoding="utf-8-sig").splitlines() == [",".join(REPORT_FIELDS)]
+
+
+def test_header_only_partial_line_is_truncated(tmp_path):
+    path = tmp_path / "report.csv"
+    path.write_text("host,ip,pu", encoding="utf-8")
+    with CsvReportWriter(str(path), resume=True) as sink:
+        sink.write_row(_row("a"))
+    assert [r["host"] for r in _read_rows(path)] == ["a"]
@@ -0,0 +1,88 @@
+import pytest
+
+from src.ip_checker.columnar import FLAG_HOSTING, FLAG_PURE, FLAG_UNCHECKED, RISK_UNKNOWN, VerdictTable
+from src.ip_checker.resultfile import (ResultFileError, ResultFileReader, dropped_fields, read_result_file,
+                                       result_path_for, write_result_file)
+
+
+def _sample_table():
+    table = VerdictTable()
+    table.append_row("1.1.1.1", "AU", "AS13335 Cloudflare, Inc.", FLAG_HOSTING, 12)
+    table.append_row("2001:db8::1", "JP", None, FLAG_PURE, RISK_UNKNOWN)
+    table.append_row("8.8.8.8", None, "AS15169 Google LLC", FLAG_UNCHECKED, 0)
+    table.append_row("9.9.9.9", "AU", "AS19281 Quad9 — 非营利", FLAG_PURE, 100)
+    return table
+
+
+def test_round_trip(tmp_path):
+    table = _sample_table()
+    path = str(tmp_path / "results.ipr")
+    assert write_result_file(path, table) == len(table)
+
+    with ResultFileReader(path) as reader:
+        assert len(reader) == len(table)
+        assert list(reader) == [table.row(i) for i in range(len(table))]
+        assert reader[-1] == table.row(3)
+        assert reader[1]["ip"] == "2001:db8::1"
+        assert reader[2]["countryCode"] == "Unknown"
+        with pytest.raises(IndexError):
+            reader.record(len(table))
+
+    restored = read_result_file(path)
+    assert [restored.row(i) for i in range(len(restored))] == [table.row(i) for i in range(len(table))]
+    assert restored.count(restored.mask_flags(all_of=FLAG_PURE)) == 2
+
+
+def test_empty_table_round_trip(tmp_path):
+    path = str(tmp_path / "empty.ipr")
+    assert write_result_file(path, VerdictTable()) == 0
+    with ResultFileReader(path) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+
+
+def test_long_strings_are_cut_on_a_character_boundary(tmp_path):
+    table = VerdictTable()
+    # 4 字节前缀加 3 字节的汉字，直接在 65535 字节处截断会切开一个字符
+    asn = "AS1 " + "网" * 30000
+    table.append_row("1.2.3.4", "CN", asn, 0, RISK_UNKNOWN)
+    path = str(tmp_path / "long.ipr")
+    write_result_file(path, table)
+
+    with ResultFileReader(path) as reader:
+        value = reader[0]["as"]
+    assert asn.startswith(value)
+    assert len(value.encode("utf-8")) <= 0xFFFF
+    assert len(asn.encode("utf-8")) - len(value.encode("utf-8")) < 0xFFFF
+
+
+def test_rejects_files_that_are_not_result_files(tmp_path):
+    empty = tmp_path / "empty.ipr"
+    empty.write_bytes(b"")
+    with pytest.raises(ResultFileError):
+        ResultFileReader(str(empty))
+
+    other = tmp_path / "other.ipr"
+    other.write_bytes(b"NOPE" + bytes(28))
+    with pytest.raises(ResultFileError):
+        ResultFileReader(str(other))
+
+    path = str(tmp_path / "results.ipr")
+    write_result_file(path, _sample_table())
+    with open(path, "rb") as f:
+        data = f.read()
+    truncated = tmp_path / "truncated.ipr"
+    truncated.write_bytes(data[:40])
+    with pytest.raises(ResultFileError):
+        ResultFileReader(str(truncated))
+
+
+def test_result_path_for():
+    assert result_path_for("out/results.json") == "out/results.ipr"
+    assert result_path_for("report.csv") == "report.ipr"
+
+
+def test_dropped_fields_lists_what_ipr_does_not_store():
+    assert dropped_fields(["host", "ip", "pure", "country", "countryCode", "regionName", "city", "isp", "org",
+                           "as"]) == ["regionName", "city", "isp", "org"]
+    assert dropped_fields(["ip", "countryCode", "as"]) == []
@@ -0,0 +1,105 @@
+import io
+
+import pytest
+import yaml
+
+from src.ip_checker import yaml_io
+from src.ip_checker.clash import build_config_from_proxies
+from src.ip_checker.yaml_io import dump_yaml, has_shared_nodes, load_yaml, save_yaml_config, write_config
+
+
+def _reference(data):
+    return yaml.dump(data, allow_unicode=True, sort_keys=False)
+
+
+def _write(config, chunk_size):
+    stream = io.StringIO()
+    write_config(config, stream, chunk_size=chunk_size)
+    return stream.getvalue()
+
+
+def _config(n=5):
+    proxies = [{"name": f"🇺🇸 node-{i}", "type": "ss", "server": f"192.0.2.{i}", "port": 8000 + i,
+                "cipher": "aes-128-gcm", "password": f"pw{i}"} for i in range(n)]
+    return {
+        "port": 7890,
+        "proxies": proxies,
+        "proxy-groups": [{"name": "PROXY", "type": "select", "proxies": [p["name"] for p in proxies]}],
+        "rules": ["MATCH,PROXY"],
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_chunked_output_matches_single_dump(chunk_size):
+    config = _config()
+    assert _write(config, chunk_size) == _reference(config)
+
+
+def test_shared_sub_dicts_and_group_lists_round_trip():
+    ws_opts = {"path": "/ws", "headers": {"Host": "example.invalid"}}
+    members = ["a", "b"]
+    config = {
+        "proxies": [{"name": "a", "type": "vmess", "ws-opts": ws_opts},
+                    {"name": "b", "type": "vmess", "ws-opts": ws_opts}],
+        "proxy-groups": [{"name": "g1", "type": "select", "proxies": members},
+                         {"name": "g2", "type": "select", "proxies": members}],
+    }
+    assert has_shared_nodes(config)
+    text = _write(config, chunk_size=1)
+    assert text == _reference(config)
+    assert yaml.safe_load(text) == config
+
+
+def test_generated_config_with_shared_group_members_is_chunked(monkeypatch):
+    proxies = [{"name": f"n{i}", "type": "ss", "server": f"192.0.2.{i}", "port": 443,
+                "countryCode": "US" if i % 2 else "JP", "purity": "pure"} for i in range(6)]
+    config = build_config_from_proxies(proxies, group_by=["country", "purity"])
+    # 分组之间共享成员列表，会输出锚点
+    assert has_shared_nodes(config["proxy-groups"])
+    assert "&id001" in _reference(config)
+
+    dumped = []
+    original = yaml_io.dump_yaml
+
+    def recording_dump(data, stream=None):
+        dumped.append(data)
+        return original(data, stream)
+
+    monkeypatch.setattr(yaml_io, "dump_yaml", recording_dump)
+    text = _write(config, chunk_size=2)
+    assert text == _reference(config)
+    assert yaml.safe_load(text) == config
+    # proxies 按 2 个一块写出，其余键（包括 proxy-groups）一次 dump
+    assert [len(d) for d in dumped if isinstance(d, list)] == [2, 2, 2]
+    assert [list(d) for d in dumped if isinstance(d, dict)] == [[k for k in config if k != "proxies"]]
+
+
+def test_proxies_shared_with_other_sections_fall_back_to_single_dump():
+    proxy = {"name": "a", "type": "ss", "server": "192.0.2.1", "port": 443}
+    config = {"proxies": [proxy], "extra": [proxy]}
+    assert _write(config, chunk_size=1) == _reference(config)
+
+
+def test_aliased_subscription_input_round_trips():
+    # 订阅里的 YAML 别名解析后是同一个对象
+    parsed = load_yaml("""
+proxies:
+  - {name: a, type: vmess, server: 192.0.2.1, ws-opts: &ws {path: /ray}}
+  - {name: b, type: vmess, server: 192.0.2.2, ws-opts: *ws}
+""")
+    assert parsed["proxies"][0]["ws-opts"] is parsed["proxies"][1]["ws-opts"]
+    text = _write(parsed, chunk_size=1)
+    assert text == _reference(parsed)
+    assert yaml.safe_load(text) == parsed
+
+
+def test_dump_yaml_matches_yaml_dump_with_control_characters():
+    data = {"name": "line break", "emoji": "🇯🇵", "private": ""}
+    assert dump_yaml(data) == _reference(data)
+
+
+def test_save_yaml_config_round_trips(tmp_path):
+    config = _config(3)
+    path = tmp_path / "clash.yaml"
+    save_yaml_config(config, str(path), chunk_size=2)
+    assert load_yaml(path.read_text(encoding="utf-8")) == config